@@ -7,6 +7,7 @@ from app.utils.security import (
     create_access_token,
     get_current_user
 )
+from app.utils.stats import note_user_created
 from datetime import datetime
 
 router = APIRouter()
@@ -42,6 +43,7 @@ async def register(user: UserRegister):
     }
     
     result = await db.users.insert_one(new_user)
+    await note_user_created(db, new_user["is_admin"])
     created_user = await db.users.find_one({"_id": result.inserted_id})
     
     return UserResponse(
@@ -0,0 +1,99 @@
+from functools import lru_cache
+from typing import List, Literal, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+ReadPreferenceMode = Literal["primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"]
+
+
+class MongoSettings(BaseSettings):
+    """
+    MongoDB client settings, read from MONGO_* environment variables (and .env)
+    The pool is sized per process: with MONGO_TOTAL_POOL_SIZE set, it is split
+    across the WEB_CONCURRENCY gunicorn workers so all of them together stay
+    within what the cluster should see from this deployment.
+    """
+
+    model_config = SettingsConfigDict(env_prefix="MONGO_", env_file=".env", extra="ignore")
+
+    url: Optional[str] = None
+    database_name: Optional[str] = Field(None, validation_alias="DATABASE_NAME")
+
+    # Connection pool (per worker process)
+    max_pool_size: int = Field(100, ge=1)
+    min_pool_size: int = Field(0, ge=0)
+    total_pool_size: Optional[int] = Field(None, ge=1)
+    web_concurrency: int = Field(1, ge=1, validation_alias="WEB_CONCURRENCY")
+    max_idle_time_ms: int = Field(60000, ge=0)
+    wait_queue_timeout_ms: int = Field(5000, ge=0)
+
+    # Timeouts
+    server_selection_timeout_ms: int = Field(5000, ge=0)
+    connect_timeout_ms: int = Field(10000, ge=0)
+    socket_timeout_ms: Optional[int] = Field(None, ge=0)
+
+    # Wire compression; zstd and snappy need the zstandard / python-snappy packages
+    compressors: str = "zlib"
+    zlib_compression_level: int = Field(6, ge=-1, le=9)
+
+    # History searches use heavy_read_preference; deployments may opt into
+    # secondaries for them, at the cost of not seeing the newest checks
+    read_preference: ReadPreferenceMode = "primary"
+    heavy_read_preference: ReadPreferenceMode = "primary"
+    max_staleness_seconds: int = Field(-1, ge=-1)
+
+    # Driver retries plus our own backoff for transient errors (failovers, pool timeouts)
+    retry_writes: bool = True
+    retry_reads: bool = True
+    retry_attempts: int = Field(3, ge=1)
+    retry_backoff_ms: int = Field(100, ge=0)
+    retry_backoff_max_ms: int = Field(2000, ge=0)
+
+    def pool_size(self) -> int:
+        """Connections this worker may open"""
+        if self.total_pool_size:
+            return max(self.min_pool_size, 1, self.total_pool_size // self.web_concurrency)
+        return max(self.max_pool_size, self.min_pool_size)
+
+    def compressor_list(self) -> List[str]:
+        return [name.strip() for name in self.compressors.split(",") if name.strip()]
+
+    def client_options(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        options = {
+            "maxPoolSize": self.pool_size(),
+            "minPoolSize": min(self.min_pool_size, self.pool_size()),
+            "maxIdleTimeMS": self.max_idle_time_ms,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+            "serverSelectionTimeoutMS": self.server_selection_timeout_ms,
+            "connectTimeoutMS": self.connect_timeout_ms,
+            "socketTimeoutMS": self.socket_timeout_ms,
+            "readPreference": self.read_preference,
+            "retryWrites": self.retry_writes,
+            "retryReads": self.retry_reads,
+        }
+        if self.compressor_list():
+            options["compressors"] = ",".join(self.compressor_list())
+            options["zlibCompressionLevel"] = self.zlib_compression_level
+        if self.max_staleness_seconds > 0 and self.read_preference != "primary":
+            options["maxStalenessSeconds"] = self.max_staleness_seconds
+        return options
+
+    def summary(self) -> dict:
+        """Effective settings without the connection string (it may hold credentials)"""
+        return {
+            "database": self.database_name,
+            "max_pool_size": self.pool_size(),
+            "min_pool_size": min(self.min_pool_size, self.pool_size()),
+            "web_concurrency": self.web_concurrency,
+            "wait_queue_timeout_ms": self.wait_queue_timeout_ms,
+            "compressors": self.compressor_list(),
+            "read_preference": self.read_preference,
+            "heavy_read_preference": self.heavy_read_preference,
+            "retry_attempts": self.retry_attempts,
+        }
+
+
+@lru_cache
+def get_mongo_settings() -> MongoSettings:
+    return MongoSettings()
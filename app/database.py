@@ -1,34 +1,158 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure, PyMongoError
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from bson import ObjectId
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from app.config import get_mongo_settings
 
 # Load environment variables
 load_dotenv()
 
-# MongoDB Configuration from environment variables
-MONGO_URL = os.getenv("MONGO_URL")
-DATABASE_NAME = os.getenv("DATABASE_NAME")
-
 client: Optional[AsyncIOMotorClient] = None
 database = None
+heavy_database = None
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool events aggregated for the health check
+    Called from the driver's threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_ms = 0.0
+        self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            # Time spent waiting for a free connection (or opening one)
+            self.checkout_wait_ms += event.duration * 1000
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self, max_pool_size: int) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": max_pool_size,
+                "open_connections": self.open,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "utilization": round(self.checked_out / max_pool_size, 3) if max_pool_size else 0.0,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_checkout_wait_ms": round(self.checkout_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "pool_clears": self.pool_clears,
+            }
+
+pool_metrics = PoolMetrics()
+
+def is_transient_error(error: Exception) -> bool:
+    """Errors worth retrying: failovers, network blips, pool wait timeouts"""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, PyMongoError) and (
+        error.has_error_label("RetryableWriteError") or error.has_error_label("TransientTransactionError")
+    )
+
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait before retry number attempt (exponential backoff with jitter)"""
+    settings = get_mongo_settings()
+    delay_ms = min(settings.retry_backoff_max_ms, settings.retry_backoff_ms * (2 ** attempt))
+    return random.uniform(delay_ms / 2, delay_ms) / 1000
+
+async def with_retry(operation, *args, **kwargs):
+    """
+    Await operation(*args, **kwargs), retrying transient errors with backoff
+    Only for idempotent operations (reads, pings, upserts by _id).
+    """
+    attempts = get_mongo_settings().retry_attempts
+    for attempt in range(attempts):
+        try:
+            return await operation(*args, **kwargs)
+        except PyMongoError as e:
+            if attempt == attempts - 1 or not is_transient_error(e):
+                raise
+            delay = retry_delay(attempt)
+            print(f"⚠️ Transient MongoDB error ({type(e).__name__}), retrying in {delay:.2f}s: {e}")
+            await asyncio.sleep(delay)
 
 async def connect_to_mongo():
     """Connect to MongoDB database"""
-    global client, database
+    global client, database, heavy_database
+    settings = get_mongo_settings()
     try:
         client = AsyncIOMotorClient(
-            MONGO_URL,
-            serverSelectionTimeoutMS=5000,  # 5 second timeout
-            connectTimeoutMS=10000,  # 10 second timeout
+            settings.url,
+            event_listeners=[pool_metrics],
+            **settings.client_options()
         )
         
         # Test the connection
-        await client.admin.command('ping')
+        await with_retry(client.admin.command, 'ping')
         
-        database = client[DATABASE_NAME]
-        print(f"✅ Connected to MongoDB: {DATABASE_NAME}")
-        print(f"📍 MongoDB URL: {MONGO_URL[:20]}...")  # Print first 20 chars only for security
+        database = client[settings.database_name]
+        # History scans and searches may read from secondaries
+        heavy_database = client.get_database(
+            settings.database_name,
+            read_preference=make_read_preference(
+                read_pref_mode_from_name(settings.heavy_read_preference),
+                tag_sets=None,
+                max_staleness=settings.max_staleness_seconds if settings.heavy_read_preference != "primary" else -1
+            )
+        )
+        print(f"✅ Connected to MongoDB: {settings.database_name}")
+        print(f"📍 MongoDB URL: {(settings.url or '')[:20]}...")  # Print first 20 chars only for security
+        print(f"🏊 Pool: {settings.pool_size()} connections per worker ({settings.web_concurrency} workers), "
+              f"reads: {settings.read_preference}, heavy reads: {settings.heavy_read_preference}")
         
     except Exception as e:
         print(f"❌ Failed to connect to MongoDB: {e}")
@@ -47,6 +171,47 @@ def get_database():
         raise Exception("Database not connected. Call connect_to_mongo() first.")
     return database
 
+def get_heavy_database():
+    """Database handle for history scans and searches (MONGO_HEAVY_READ_PREFERENCE); writes still go to the primary"""
+    if heavy_database is None:
+        raise Exception("Database not connected. Call connect_to_mongo() first.")
+    return heavy_database
+
+# ObjectIds come from the inserting worker's clock, so a record with a smaller
+# _id than one already read can still become visible later; in-memory indexes
+# catching up with history re-check this many seconds below their high-water mark
+CATCH_UP_LOOKBACK_SECONDS = int(os.getenv("CATCH_UP_LOOKBACK_SECONDS", "60"))
+
+async def catch_up_history(db, high_water: Optional[ObjectId], is_known: Callable[[ObjectId], bool],
+                           apply: Callable[[List[Dict]], Awaitable[None]], projection: Dict,
+                           batch_size: int = 500) -> Optional[ObjectId]:
+    """
+    Pass history records past high_water that is_known rejects to apply, one
+    batch at a time in _id order; returns the new high-water mark
+    Below an existing mark the lookback window is listed by _id alone and only
+    unknown records are read in full. Pass the primary handle: a lagging
+    secondary would let the mark move past records it hasn't replicated yet.
+    """
+    if high_water is None:
+        batch = []
+        async for record in db.history.find({}, projection).sort("_id", 1).batch_size(batch_size):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                await apply(batch)
+                high_water, batch = batch[-1]["_id"], []
+        if batch:
+            await apply(batch)
+            high_water = batch[-1]["_id"]
+        return high_water
+
+    since = ObjectId.from_datetime(high_water.generation_time - timedelta(seconds=CATCH_UP_LOOKBACK_SECONDS))
+    window = [record["_id"] async for record in db.history.find({"_id": {"$gte": since}}, {"_id": 1}).sort("_id", 1)]
+    unknown = [history_id for history_id in window if not is_known(history_id)]
+    for start in range(0, len(unknown), batch_size):
+        await apply(await db.history.find({"_id": {"$in": unknown[start:start + batch_size]}}, projection)
+                    .sort("_id", 1).to_list(None))
+    return max(high_water, window[-1]) if window else high_water
+
 async def check_database_health():
     """Check if database connection is healthy"""
     try:
@@ -55,4 +220,16 @@ async def check_database_health():
             return True
         return False
     except Exception:
-        return False
\ No newline at end of file
+        return False
+
+async def get_database_health() -> dict:
+    """Ping latency, pool utilization and effective settings for the health check"""
+    settings = get_mongo_settings()
+    started = time.perf_counter()
+    healthy = await check_database_health()
+    return {
+        "connected": healthy,
+        "ping_ms": round((time.perf_counter() - started) * 1000, 2) if healthy else None,
+        "pool": pool_metrics.snapshot(settings.pool_size()),
+        "settings": settings.summary(),
+    }
@@ -1,17 +1,36 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import connect_to_mongo, close_mongo_connection
-from app.routers import admin, plagiarism, history
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
+import os
+from app.database import connect_to_mongo, close_mongo_connection, get_database, get_database_health
+from app.utils.history_store import ensure_history_indexes, backfill_derived_fields
+from app.utils.fingerprint_store import load_fingerprint_index
+from app.utils.stats import ensure_stats_counters, run_stats_rollups
+from app.utils.maintenance import ensure_maintenance_indexes, run_maintenance_worker
+from app.utils.lazy_imports import STARTUP_WARMUP, warmup
+from app.utils.process_pool import start_process_pool, shutdown_process_pool
+from app.routers import admin, plagiarism, history, batch
 from app.routers.history_search import router as history_search_router
 from app.routers.file_history_search import router as file_history_router  # Add this
 from app import auth
 
+# Responses smaller than this aren't worth compressing; level 5 is most of
+# level 9's ratio on large results at a fraction of the CPU
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "5"))
+
 app = FastAPI(
     title="Plagiarism Checker API",
     description="A plagiarism detection system with user and admin dashboards",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# Compress responses for clients that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -24,9 +43,30 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_db_client():
     await connect_to_mongo()
+    db = get_database()
+    await ensure_history_indexes(db)
+    # Older records lack the derived search fields; fill them in without blocking startup
+    asyncio.create_task(backfill_derived_fields(db))
+    # mmap the on-disk fingerprint index (if configured) and apply the delta since its snapshot
+    await load_fingerprint_index(db)
+    # Dashboard counters are maintained incrementally; daily buckets are rolled up in the background
+    await ensure_stats_counters(db)
+    asyncio.create_task(run_stats_rollups(db))
+    # Batched cascade deletes and history retention run off the request path
+    await ensure_maintenance_indexes(db)
+    asyncio.create_task(run_maintenance_worker(db))
+    # Batch scoring shares one spawn-started process pool instead of forking one per request
+    start_process_pool()
+    # PDF/DOCX parsing, auth and search dependencies are imported lazily;
+    # warm them up so the first request that needs one doesn't pay for it
+    if STARTUP_WARMUP == "blocking":
+        warmup()
+    elif STARTUP_WARMUP == "background":
+        asyncio.create_task(asyncio.to_thread(warmup))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    shutdown_process_pool()
     await close_mongo_connection()
 
 # Include routers
@@ -35,6 +75,7 @@ app.include_router(plagiarism.router, prefix="/plagiarism", tags=["Plagiarism"])
 app.include_router(history.router, prefix="/history", tags=["History"])
 app.include_router(history_search_router, prefix="/history", tags=["History Search"])
 app.include_router(file_history_router, prefix="/files", tags=["File History"])  # Add this
+app.include_router(batch.router, prefix="/batch", tags=["Batch"])
 app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 
 @app.get("/")
@@ -43,4 +84,13 @@ async def root():
         "message": "Welcome to Plagiarism Checker API",
         "docs": "/docs",
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+@app.get("/health")
+async def health():
+    """Liveness plus MongoDB ping, connection-pool utilization and client settings (503 if the database is down)"""
+    database = await get_database_health()
+    return ORJSONResponse(
+        status_code=200 if database["connected"] else 503,
+        content={"status": "ok" if database["connected"] else "degraded", "database": database}
+    )
\ No newline at end of file
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.database import get_database
 from app.utils.security import get_current_admin
 from app.schemas import UserResponse
-from typing import List
+from app.utils.maintenance import enqueue_history_purge, enqueue_retention_purge, list_jobs, job_progress
+from app.utils.admission import get_admission_controller
+from app.utils.lazy_imports import lazy_import_status
+from app.utils import stats
+from typing import List, Literal, Optional
 from bson import ObjectId
 
 router = APIRouter()
@@ -37,6 +41,7 @@ async def delete_user(user_id: str, current_admin: dict = Depends(get_current_ad
         )
     
     try:
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"is_admin": 1})
         result = await db.users.delete_one({"_id": ObjectId(user_id)})
         
         if result.deleted_count == 0:
@@ -45,10 +50,16 @@ async def delete_user(user_id: str, current_admin: dict = Depends(get_current_ad
                 detail="User not found"
             )
         
-        # Also delete user's history
-        await db.history.delete_many({"user_id": user_id})
+        await stats.note_user_deleted(db, bool(user and user.get("is_admin", False)))
         
-        return {"message": "User deleted successfully", "user_id": user_id}
+        # The user's history and its index postings are deleted in the background
+        job = await enqueue_history_purge(db, "delete_user", user_id=user_id)
+        
+        return {
+            "message": "User deleted successfully; history removal is in progress",
+            "user_id": user_id,
+            "job_id": str(job["_id"])
+        }
     
     except Exception as e:
         raise HTTPException(
@@ -83,6 +94,7 @@ async def toggle_admin_status(user_id: str, current_admin: dict = Depends(get_cu
             {"_id": ObjectId(user_id)},
             {"$set": {"is_admin": new_admin_status}}
         )
+        await stats.note_admin_toggled(db, new_admin_status)
         
         return {
             "message": "Admin status updated successfully",
@@ -98,16 +110,67 @@ async def toggle_admin_status(user_id: str, current_admin: dict = Depends(get_cu
 
 @router.get("/stats")
 async def get_stats(current_admin: dict = Depends(get_current_admin)):
-    """Get system statistics (admin only)"""
+    """Get system statistics (admin only), served from the maintained counters"""
     db = get_database()
     
-    total_users = await db.users.count_documents({})
-    total_admins = await db.users.count_documents({"is_admin": True})
-    total_checks = await db.history.count_documents({})
+    totals = await stats.get_totals(db)
+    total_users = totals.get("users", 0)
+    total_admins = totals.get("admins", 0)
     
     return {
         "total_users": total_users,
         "total_admins": total_admins,
         "regular_users": total_users - total_admins,
-        "total_plagiarism_checks": total_checks
-    }
\ No newline at end of file
+        "total_plagiarism_checks": totals.get("checks", 0),
+        "checks_by_type": totals.get("checks_by_type", {})
+    }
+
+@router.get("/stats/daily")
+async def get_daily_stats(
+    days: int = Query(30, ge=1, le=366),
+    group_by: Literal["check_type", "score_band", "user_id"] = Query("check_type"),
+    user_id: Optional[str] = Query(None),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Per-day check counts broken down by check type, score band or user (admin only)"""
+    db = get_database()
+    
+    return {
+        "days": days,
+        "group_by": group_by,
+        "series": await stats.daily_series(db, days, group_by, user_id)
+    }
+
+@router.get("/admission")
+async def get_admission_stats(current_admin: dict = Depends(get_current_admin)):
+    """Slots in use, queue depth and wait times of the heavy-endpoint scheduler (admin only)"""
+    return get_admission_controller().stats()
+
+@router.get("/lazy-imports")
+async def get_lazy_imports(current_admin: dict = Depends(get_current_admin)):
+    """Which lazily imported dependencies this worker has loaded, and how long each took (admin only)"""
+    return lazy_import_status()
+
+@router.get("/maintenance/jobs")
+async def get_maintenance_jobs(
+    limit: int = Query(50, ge=1, le=500),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Recent background deletion and retention jobs with their progress (admin only)"""
+    db = get_database()
+    
+    return [job_progress(job) for job in await list_jobs(db, limit)]
+
+@router.post("/maintenance/retention")
+async def run_retention(
+    retention_days: int = Query(..., ge=1),
+    current_admin: dict = Depends(get_current_admin)
+):
+    """Queue deletion of history older than retention_days now (admin only)"""
+    db = get_database()
+    
+    job = await enqueue_retention_purge(db, retention_days)
+    if job is None:
+        return {"message": "No history older than the retention window, or a retention purge is already queued", "job": None}
+    
+    return {"message": "Retention purge queued", "job": job_progress(job)}
@@ -0,0 +1,291 @@
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from app.utils.security import get_current_user
+from app.utils.admission import admission
+from app.utils.batch_similarity import compute_similarity_matrix
+from app.utils.batch_ai_detection import detect_ai_batch
+from app.utils.text_extraction import content_type_from_filename, extract_text, extraction_failed
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field
+import io
+import os
+import time
+import zipfile
+
+router = APIRouter()
+
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", "500"))
+MAX_BATCH_ZIP_BYTES = int(os.getenv("MAX_BATCH_ZIP_BYTES", str(200 * 1024 * 1024)))
+# Most suspicious pairs one response may list (top_k)
+MAX_BATCH_TOP_K = int(os.getenv("MAX_BATCH_TOP_K", "1000"))
+
+
+class BatchSimilarityRequest(BaseModel):
+    texts: List[str]
+    names: Optional[List[str]] = None
+    min_similarity: float = 50.0  # Pairs at or above this are reported as suspicious
+    top_k: int = Field(50, ge=1, le=MAX_BATCH_TOP_K)
+    include_matrix: bool = False
+    cluster: bool = False
+
+
+class SuspiciousPair(BaseModel):
+    doc1: int
+    doc2: int
+    doc1_name: str
+    doc2_name: str
+    similarity_score: float
+    shared_fingerprints: int
+
+
+class DocumentCluster(BaseModel):
+    documents: List[int]
+    names: List[str]
+
+
+class BatchSimilarityResponse(BaseModel):
+    document_count: int
+    names: List[str]
+    total_pairs: int
+    candidate_pairs: int
+    suspicious_count: int
+    suspicious_pairs: List[SuspiciousPair]
+    matrix: Optional[List[List[Optional[float]]]] = None
+    clusters: Optional[List[DocumentCluster]] = None
+    skipped_files: Optional[List[str]] = None
+    elapsed_seconds: float
+
+
+class BatchAIDetectionRequest(BaseModel):
+    texts: List[str]
+    names: Optional[List[str]] = None
+
+
+class RankedAIDocument(BaseModel):
+    rank: int
+    doc: int
+    name: str
+    ai_probability: float
+    human_probability: float
+    confidence: str
+    message: str
+    perplexity_score: float
+    uniformity_score: float
+    patterns_detected: int
+    word_diversity: float
+    avg_sentence_length: float
+
+
+class BatchAIDetectionResponse(BaseModel):
+    document_count: int
+    ranking: List[RankedAIDocument]
+    skipped_files: Optional[List[str]] = None
+    elapsed_seconds: float
+    documents_per_second: float
+
+
+def read_zip_documents(content: bytes) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Extract text from every PDF/DOCX/TXT member of a ZIP archive
+    Returns (names, texts, skipped) where skipped lists unusable members
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file is not a valid ZIP archive"
+        )
+
+    names, texts, skipped = [], [], []
+    total_size = 0
+
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+
+            content_type = content_type_from_filename(info.filename)
+            if content_type is None:
+                skipped.append(info.filename)
+                continue
+
+            # Guard against ZIP bombs before decompressing
+            total_size += info.file_size
+            if total_size > MAX_BATCH_ZIP_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"ZIP contents exceed {MAX_BATCH_ZIP_BYTES // (1024 * 1024)} MB"
+                )
+
+            text = extract_text(archive.read(info), content_type)
+            if not text or len(text.strip()) < 10 or extraction_failed(text):
+                skipped.append(info.filename)
+                continue
+
+            names.append(info.filename)
+            texts.append(text)
+
+    return names, texts, skipped
+
+
+async def run_batch_similarity(texts: List[str], names: List[str], min_similarity: float,
+                               top_k: int, include_matrix: bool, cluster: bool,
+                               skipped: Optional[List[str]] = None) -> BatchSimilarityResponse:
+    if len(texts) < 2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least two documents are required"
+        )
+
+    if len(texts) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {MAX_BATCH_DOCUMENTS} documents"
+        )
+
+    started = time.perf_counter()
+
+    # CPU-bound; keep the event loop free while the pool works
+    result = await run_in_threadpool(
+        compute_similarity_matrix,
+        texts,
+        min_similarity=min_similarity,
+        top_k=top_k,
+        include_matrix=include_matrix,
+        cluster=cluster
+    )
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 Batch similarity: {len(texts)} docs, {result['candidate_pairs']}/{result['total_pairs']} pairs scored in {elapsed:.2f}s")
+
+    return BatchSimilarityResponse(
+        document_count=result["document_count"],
+        names=names,
+        total_pairs=result["total_pairs"],
+        candidate_pairs=result["candidate_pairs"],
+        suspicious_count=result["suspicious_count"],
+        suspicious_pairs=[
+            SuspiciousPair(doc1_name=names[pair["doc1"]], doc2_name=names[pair["doc2"]], **pair)
+            for pair in result["suspicious_pairs"]
+        ],
+        matrix=result["matrix"],
+        clusters=[
+            DocumentCluster(documents=members, names=[names[i] for i in members])
+            for members in result["clusters"]
+        ] if result["clusters"] is not None else None,
+        skipped_files=skipped or None,
+        elapsed_seconds=round(elapsed, 3)
+    )
+
+
+async def run_batch_ai_detection(texts: List[str], names: List[str],
+                                 skipped: Optional[List[str]] = None) -> BatchAIDetectionResponse:
+    if not texts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one document is required"
+        )
+
+    if len(texts) > MAX_BATCH_DOCUMENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {MAX_BATCH_DOCUMENTS} documents"
+        )
+
+    started = time.perf_counter()
+
+    # CPU-bound; keep the event loop free while the pool works
+    rows = await run_in_threadpool(detect_ai_batch, texts)
+
+    elapsed = time.perf_counter() - started
+    documents_per_second = len(texts) / elapsed if elapsed > 0 else float(len(texts))
+    print(f"🤖 Batch AI detection: {len(texts)} docs in {elapsed:.2f}s ({documents_per_second:.0f} docs/s)")
+
+    return BatchAIDetectionResponse(
+        document_count=len(texts),
+        ranking=[
+            RankedAIDocument(rank=rank, name=names[row["doc"]], **row)
+            for rank, row in enumerate(rows, 1)
+        ],
+        skipped_files=skipped or None,
+        elapsed_seconds=round(elapsed, 3),
+        documents_per_second=round(documents_per_second, 1)
+    )
+
+
+@router.post("/similarity-matrix", response_model=BatchSimilarityResponse, dependencies=[Depends(admission("batch"))])
+async def batch_similarity_matrix(
+    request: BatchSimilarityRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Compute pairwise similarity across a batch of texts"""
+    if request.names is not None and len(request.names) != len(request.texts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="names must have the same length as texts"
+        )
+
+    names = request.names or [f"Document {i + 1}" for i in range(len(request.texts))]
+
+    return await run_batch_similarity(
+        request.texts,
+        names,
+        request.min_similarity,
+        request.top_k,
+        request.include_matrix,
+        request.cluster
+    )
+
+
+@router.post("/similarity-matrix/upload", response_model=BatchSimilarityResponse, dependencies=[Depends(admission("batch"))])
+async def batch_similarity_matrix_from_zip(
+    file: UploadFile = File(...),
+    min_similarity: float = Form(50.0),
+    top_k: int = Form(50, ge=1, le=MAX_BATCH_TOP_K),
+    include_matrix: bool = Form(False),
+    cluster: bool = Form(False),
+    current_user: dict = Depends(get_current_user)
+):
+    """Compute pairwise similarity across PDF/DOCX/TXT files in a ZIP archive"""
+    content = await file.read()
+    names, texts, skipped = await run_in_threadpool(read_zip_documents, content)
+
+    return await run_batch_similarity(
+        texts,
+        names,
+        min_similarity,
+        top_k,
+        include_matrix,
+        cluster,
+        skipped
+    )
+
+
+@router.post("/ai-detection", response_model=BatchAIDetectionResponse, dependencies=[Depends(admission("batch"))])
+async def batch_ai_detection(
+    request: BatchAIDetectionRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Rank a batch of texts by AI-generated likelihood"""
+    if request.names is not None and len(request.names) != len(request.texts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="names must have the same length as texts"
+        )
+
+    names = request.names or [f"Document {i + 1}" for i in range(len(request.texts))]
+
+    return await run_batch_ai_detection(request.texts, names)
+
+
+@router.post("/ai-detection/upload", response_model=BatchAIDetectionResponse, dependencies=[Depends(admission("batch"))])
+async def batch_ai_detection_from_zip(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """Rank PDF/DOCX/TXT files in a ZIP archive by AI-generated likelihood"""
+    content = await file.read()
+    names, texts, skipped = await run_in_threadpool(read_zip_documents, content)
+
+    return await run_batch_ai_detection(texts, names, skipped)
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from app.database import get_database
+from app.database import get_heavy_database
 from app.utils.security import get_current_user
-from app.utils.google_similarity import calculate_text_similarity
+from app.utils.admission import admission
+from app.utils.similarity_cascade import SimilarityCascade
+from app.schemas import SearchPruningStats, OverlapPassage
+from app.utils.shingle_index import overlap_passages
+from app.utils.history_store import find_near_duplicates
+from app.utils.history_scan import TopK, find_candidates, iter_history, page_capacity, MAX_HISTORY_MATCHES
+from app.utils.text_extraction import ALLOWED_CONTENT_TYPES, extract_text, extraction_failed
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-import PyPDF2
-import docx
-import io
 
 router = APIRouter()
 
@@ -22,49 +25,75 @@ class FileHistoryMatch(BaseModel):
     matched_with: str  # NEW: "text1" or "text2"
     text_name: Optional[str] = None  # NEW: Name of matched text
     text_metadata: Optional[dict] = None  # NEW: Metadata of matched text
+    near_duplicate: bool = False  # Found by the SimHash fast path
+    similarity_estimated: bool = False  # similarity_score estimated from Hamming distance
+    hamming_distance: Optional[int] = None
+    overlaps: Optional[List[OverlapPassage]] = None  # Shared passages (shingle_index source only)
 
 class FileHistorySearchResponse(BaseModel):
     matches_found: int
     matches: List[FileHistoryMatch]
     highest_similarity: float
+    offset: int = 0
+    limit: int = 0
+    near_duplicates_found: int = 0
+    pruning_stats: Optional[SearchPruningStats] = None
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
-    try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
-        return text.strip()
-    except Exception as e:
-        print(f"PDF extraction error: {e}")
-        return ""
+# Only the fields a file search reads; keeps Google and AI results off the wire
+FILE_SEARCH_PROJECTION = {
+    "text1": 1,
+    "text2": 1,
+    "text1_name": 1,
+    "text2_name": 1,
+    "text1_metadata": 1,
+    "text2_metadata": 1,
+    "timestamp": 1,
+    "file_name": 1,
+    "text1_clean_length": 1,
+    "text2_clean_length": 1,
+}
 
-def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from DOCX file"""
-    try:
-        docx_file = io.BytesIO(file_content)
-        doc = docx.Document(docx_file)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
-        return text.strip()
-    except Exception as e:
-        print(f"DOCX extraction error: {e}")
-        return ""
+def build_file_match(record: dict, slot: str, similarity: float, **extra) -> FileHistoryMatch:
+    """Build the match entry for one text slot of a history record"""
+    text1 = record.get("text1", "")
+    text2 = record.get("text2", "")
+    slot_text = text1 if slot == "text1" else text2
+    
+    file_name = record.get("file_name")
+    if not file_name or file_name == "[Google Only Check]":
+        file_name = "Text Comparison"
+    
+    return FileHistoryMatch(
+        history_id=str(record["_id"]),
+        similarity_score=round(similarity, 2),
+        timestamp=record["timestamp"],
+        file_name=file_name,
+        matched_text_preview=slot_text[:200] + "..." if len(slot_text) > 200 else slot_text,
+        original_text1_preview=text1[:150] + "..." if len(text1) > 150 else text1,
+        original_text2_preview=text2[:150] + "..." if len(text2) > 150 else text2,
+        matched_with=slot,
+        text_name=record.get(f"{slot}_name", "Text 1" if slot == "text1" else "Text 2"),
+        text_metadata=record.get(f"{slot}_metadata", {}),
+        **extra
+    )
 
-@router.post("/check-file-history", response_model=FileHistorySearchResponse)
+@router.post("/check-file-history", response_model=FileHistorySearchResponse, dependencies=[Depends(admission("heavy"))])
 async def check_file_in_history(
     file: UploadFile = File(...),
     min_similarity: float = Form(50.0),
+    offset: int = Form(0),
+    limit: int = Form(100),
+    near_duplicates_only: bool = Form(False),
+    candidate_source: str = Form("scan"),
     current_user: dict = Depends(get_current_user)
 ):
     """
     Check if uploaded file content matches any previous submissions in history
     Works for PDF, DOCX, and TXT files - checks separately against text1 and text2
+    Near-duplicates (resubmissions) are found first via SimHash and reported
+    with an estimated score; near_duplicates_only skips the full scan.
     """
-    db = get_database()
+    db = get_heavy_database()
     user_id = str(current_user["_id"])
     
     print(f"📄 Checking file history for: {file.filename}, Type: {file.content_type}")
@@ -72,114 +101,125 @@ async def check_file_in_history(
     # Extract text from uploaded file
     content = await file.read()
     
-    if file.content_type == "application/pdf":
-        text = extract_text_from_pdf(content)
-        print(f"Extracted {len(text)} characters from PDF")
-    elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        text = extract_text_from_docx(content)
-        print(f"Extracted {len(text)} characters from DOCX")
-    elif file.content_type == "text/plain":
-        try:
-            text = content.decode("utf-8", errors='ignore')
-        except Exception as e:
-            text = content.decode("latin-1", errors='ignore')
-        print(f"Read {len(text)} characters from TXT")
-    else:
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=400,
             detail=f"Unsupported file type: {file.content_type}"
         )
     
-    if not text or len(text.strip()) < 50:
+    text = extract_text(content, file.content_type)
+    print(f"Extracted {len(text)} characters from {file.filename}")
+    
+    if extraction_failed(text) or not text or len(text.strip()) < 50:
         print(f"⚠️ Text too short: {len(text)} characters")
         raise HTTPException(
             status_code=400,
             detail=f"Could not extract meaningful text from {file.filename}. The file may be empty, corrupted, or image-based. Please ensure the file contains extractable text."
         )
     
-    # Get user's history
-    history_records = []
-    cursor = db.history.find({"user_id": user_id})
+    cascade = SimilarityCascade(text, min_similarity)
+    
+    # Get user's history, skipping records whose lengths rule out a match
+    base_filter = {"user_id": user_id}
+    query_filter = base_filter
+    length_filter = cascade.length_filter("text1_clean_length", "text2_clean_length")
+    if length_filter:
+        query_filter = {"$and": [base_filter, length_filter]}
+    
+    if offset + limit > MAX_HISTORY_MATCHES or offset < 0 or limit < 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset must be >= 0, limit >= 1 and offset + limit <= {MAX_HISTORY_MATCHES}"
+        )
     
-    async for record in cursor:
-        history_records.append(record)
+    if candidate_source not in ("scan", "shingle_index", "fingerprint_index"):
+        raise HTTPException(
+            status_code=400,
+            detail="candidate_source must be 'scan', 'shingle_index' or 'fingerprint_index'"
+        )
     
-    print(f"🔍 Checking against {len(history_records)} history records")
+    # Restrict to records sharing shingles with the upload when using an index
+    try:
+        candidates = await find_candidates(db, candidate_source, text, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if candidates is not None:
+        query_filter = {"$and": [query_filter, {"_id": {"$in": list({history_id for history_id, _ in candidates})}}]}
     
-    matches = []
+    top_matches = TopK(page_capacity(offset, limit))
     highest_similarity = 0.0
+    records_scanned = 0
     
-    # Compare against each history record - CHECK BOTH TEXT1 AND TEXT2 SEPARATELY
-    for record in history_records:
-        text1 = record.get("text1", "")
-        text2 = record.get("text2", "")
-        
-        if not text1 and not text2:
+    # Fast path: SimHash band lookup flags resubmissions without exact scoring
+    near_duplicates = await find_near_duplicates(db, text, base_filter)
+    near_duplicate_slots = set()
+    for near in near_duplicates:
+        record, slot, similarity = near["record"], near["slot"], near["similarity"]
+        near_duplicate_slots.add((record["_id"], slot))
+        if similarity < min_similarity:
             continue
-        
-        # Check against text1
-        if text1:
-            similarity1 = calculate_text_similarity(text, text1)
-            print(f"Record {record['_id']} - Text1 similarity: {similarity1:.2f}%")
+        highest_similarity = max(highest_similarity, similarity)
+        top_matches.push(similarity, build_file_match(
+            record, slot, similarity,
+            near_duplicate=True,
+            similarity_estimated=True,
+            hamming_distance=near["distance"]
+        ))
+    print(f"⚡ SimHash fast path: {len(near_duplicate_slots)} near-duplicate texts")
+    
+    # Stream the history and compare each record as it arrives, exactly scoring
+    # everything the fast path didn't settle - CHECK BOTH TEXT1 AND TEXT2 SEPARATELY
+    if not near_duplicates_only:
+        async for record in iter_history(db, query_filter, FILE_SEARCH_PROJECTION):
+            records_scanned += 1
             
-            if similarity1 >= min_similarity:
-                file_name = record.get("file_name")
-                if not file_name or file_name == "[Google Only Check]":
-                    file_name = "Text Comparison"
+            for slot in ("text1", "text2"):
+                slot_text = record.get(slot, "")
                 
-                text1_name = record.get("text1_name", "Text 1")
-                text1_metadata = record.get("text1_metadata", {})
+                # Skip empty texts, google-only placeholders and known near-duplicates
+                if not slot_text or slot_text == "[Google Only Check]":
+                    continue
+                if (record["_id"], slot) in near_duplicate_slots:
+                    continue
+                if candidates is not None and (record["_id"], slot) not in candidates:
+                    continue
                 
-                matches.append(FileHistoryMatch(
-                    history_id=str(record["_id"]),
-                    similarity_score=round(similarity1, 2),
-                    timestamp=record["timestamp"],
-                    file_name=file_name,
-                    matched_text_preview=text1[:200] + "..." if len(text1) > 200 else text1,
-                    original_text1_preview=text1[:150] + "..." if len(text1) > 150 else text1,
-                    original_text2_preview=text2[:150] + "..." if len(text2) > 150 else text2,
-                    matched_with="text1",
-                    text_name=text1_name,
-                    text_metadata=text1_metadata
-                ))
+                similarity = cascade.score(slot_text, record.get(f"{slot}_clean_length"))
+                if similarity is None or similarity < min_similarity:
+                    continue
                 
-                highest_similarity = max(highest_similarity, similarity1)
-        
-        # Check against text2 (if it's not a google-only check)
-        if text2 and text2 != "[Google Only Check]":
-            similarity2 = calculate_text_similarity(text, text2)
-            print(f"Record {record['_id']} - Text2 similarity: {similarity2:.2f}%")
-            
-            if similarity2 >= min_similarity:
-                file_name = record.get("file_name")
-                if not file_name or file_name == "[Google Only Check]":
-                    file_name = "Text Comparison"
+                print(f"Record {record['_id']} - {slot.capitalize()} similarity: {similarity:.2f}%")
+                highest_similarity = max(highest_similarity, similarity)
                 
-                text2_name = record.get("text2_name", "Text 2")
-                text2_metadata = record.get("text2_metadata", {})
+                if not top_matches.would_keep(similarity):
+                    top_matches.push(similarity, None)
+                    continue
                 
-                matches.append(FileHistoryMatch(
-                    history_id=str(record["_id"]),
-                    similarity_score=round(similarity2, 2),
-                    timestamp=record["timestamp"],
-                    file_name=file_name,
-                    matched_text_preview=text2[:200] + "..." if len(text2) > 200 else text2,
-                    original_text1_preview=text1[:150] + "..." if len(text1) > 150 else text1,
-                    original_text2_preview=text2[:150] + "..." if len(text2) > 150 else text2,
-                    matched_with="text2",
-                    text_name=text2_name,
-                    text_metadata=text2_metadata
-                ))
+                overlaps = None
+                if candidates is not None:
+                    overlaps = [
+                        OverlapPassage(**passage)
+                        for passage in overlap_passages(slot_text, candidates[(record["_id"], slot)]["positions"])
+                    ] or None
                 
-                highest_similarity = max(highest_similarity, similarity2)
+                top_matches.push(similarity, build_file_match(record, slot, similarity, overlaps=overlaps))
     
-    # Sort by similarity score (highest first)
-    matches.sort(key=lambda x: x.similarity_score, reverse=True)
+    print(f"✅ Checked {records_scanned} history records, found {top_matches.total} matches, highest: {highest_similarity:.2f}%")
     
-    print(f"✅ Found {len(matches)} matches, highest: {highest_similarity:.2f}%")
+    stats = SearchPruningStats(records_scanned=records_scanned, **cascade.stats)
+    if candidates is not None:
+        stats.index_candidates = len(candidates)
+    if (length_filter or candidates is not None) and not near_duplicates_only:
+        total = await db.history.count_documents(base_filter)
+        stats.records_pruned_by_db = max(0, total - records_scanned)
+    print(f"✂️ Pruning: {stats.dict()}")
     
     return FileHistorySearchResponse(
-        matches_found=len(matches),
-        matches=matches,
-        highest_similarity=round(highest_similarity, 2) if highest_similarity > 0 else 0.0
+        matches_found=top_matches.total,
+        matches=top_matches.page(offset, limit),
+        highest_similarity=round(highest_similarity, 2) if highest_similarity > 0 else 0.0,
+        offset=offset,
+        limit=limit,
+        near_duplicates_found=len(near_duplicate_slots),
+        pruning_stats=stats
     )
\ No newline at end of file
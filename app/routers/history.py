@@ -1,10 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.concurrency import run_in_threadpool
 from app.database import get_database
 from app.utils.security import get_current_user, get_current_admin
-from app.schemas import HistoryResponse
-from typing import List
+from app.utils.admission import admitted
+from app.utils.google_similarity import check_google_similarity
+from app.utils.ai_detector import detect_ai_content_windows
+from app.schemas import HistoryResponse, GoogleSource, AIDetectionResult, HighlightFormat, HighlightSpan
+from app.utils import history_store
+from app.utils.history_store import GOOGLE_ONLY_PLACEHOLDER, TEXT_SLOTS
+from app.utils.maintenance import enqueue_history_purge, get_job, job_progress
+from app.routers.plagiarism import build_ai_detection_result, GOOGLE_API_KEY, GOOGLE_SEARCH_ENGINE_ID
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
 from pydantic import BaseModel
+import asyncio
 
 router = APIRouter()
 
@@ -15,6 +26,146 @@ class HistoryFullTextResponse(BaseModel):
     text1_name: str
     text2_name: str
 
+class HistoryGoogleAnalysis(BaseModel):
+    history_id: str
+    cached: bool  # Served from the stored analysis rather than computed by this request
+    google_similarity: Optional[float] = None
+    google_similarity_text1: Optional[float] = None
+    google_similarity_text2: Optional[float] = None
+    google_sources_text1: Optional[List[GoogleSource]] = None
+    google_sources_text2: Optional[List[GoogleSource]] = None
+    google_highlighted_text1: Optional[str] = None
+    google_highlighted_text2: Optional[str] = None
+    google_highlight_spans_text1: Optional[List[HighlightSpan]] = None
+    google_highlight_spans_text2: Optional[List[HighlightSpan]] = None
+    all_google_matches_text1: Optional[List[str]] = None
+    all_google_matches_text2: Optional[List[str]] = None
+
+class HistoryAIAnalysis(BaseModel):
+    history_id: str
+    cached: bool
+    ai_detection: Optional[AIDetectionResult] = None
+    ai_detection_text2: Optional[AIDetectionResult] = None
+
+# Where each text's AI detection result is stored in a history record
+AI_RESULT_FIELDS = {"text1": "ai_detection", "text2": "ai_detection_text2"}
+
+# Where each text's Google similarity is stored; None means not computed yet
+GOOGLE_RESULT_FIELDS = {"text1": "google_similarity_text1", "text2": "google_similarity_text2"}
+
+# Analyses being computed, so concurrent first views of a record share one computation
+_pending_analyses: Dict[Tuple[str, str], asyncio.Task] = {}
+
+async def compute_once(key: Tuple[str, str], compute: Callable[[], Awaitable]):
+    task = _pending_analyses.get(key)
+    if task is None:
+        task = asyncio.ensure_future(compute())
+        _pending_analyses[key] = task
+        task.add_done_callback(lambda _: _pending_analyses.pop(key, None))
+    # A client disconnecting must not cancel the computation others wait on
+    return await asyncio.shield(task)
+
+async def compute_admitted(current_user: dict, compute: Callable[[], Awaitable]):
+    """Run a deferred analysis holding a heavy admission slot (stored results need none)"""
+    async with admitted(str(current_user["_id"]), "heavy"):
+        return await compute()
+
+async def get_owned_record(db, history_id: str, current_user: dict) -> dict:
+    """The history record, if the current user owns it or is an admin"""
+    try:
+        record_id = ObjectId(history_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid history ID"
+        )
+
+    record = await db.history.find_one({"_id": record_id})
+    if not record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="History record not found"
+        )
+
+    if record["user_id"] != str(current_user["_id"]) and not current_user.get("is_admin", False):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this record"
+        )
+
+    return record
+
+def analysed_slots(record: dict) -> List[str]:
+    """Text slots holding a real document (not the Google-only placeholder)"""
+    return [slot for slot in TEXT_SLOTS if record.get(slot) and record[slot] != GOOGLE_ONLY_PLACEHOLDER]
+
+def missing_slots(record: dict, result_fields: Dict[str, str]) -> List[str]:
+    """Analysed slots without a stored result"""
+    return [slot for slot in analysed_slots(record) if record.get(result_fields[slot]) is None]
+
+async def compute_google_analysis(db, record: dict) -> dict:
+    """
+    Look up the record's texts that have no stored result on Google and store them in the record
+    A failed lookup stores nothing for its text, so the next request retries it.
+    """
+    missing = missing_slots(record, GOOGLE_RESULT_FIELDS)
+    results = await asyncio.gather(*[
+        run_in_threadpool(check_google_similarity, record[slot], GOOGLE_API_KEY, GOOGLE_SEARCH_ENGINE_ID)
+        for slot in missing
+    ])
+    if all(result is None for result in results):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google search is unavailable, please try again later"
+        )
+
+    update = {"google_analyzed_at": datetime.utcnow()}
+    for slot, result in zip(missing, results):
+        if result is None:
+            continue
+        update[f"google_similarity_{slot}"] = result["similarity_percentage"]
+        update[f"google_sources_{slot}"] = result["sources"] or None
+        update[f"google_highlighted_{slot}"] = result["highlighted_text"]
+        update[f"google_highlight_spans_{slot}"] = result["highlight_spans"]
+        update[f"all_google_matches_{slot}"] = result["all_matches"]
+        update[f"{slot}_metadata.google_similarity"] = result["similarity_percentage"]
+        update[f"{slot}_metadata.google_sources_count"] = len(result["sources"])
+    update["google_similarity"] = max(
+        update.get(field, record.get(field)) or 0 for field in GOOGLE_RESULT_FIELDS.values()
+    )
+    # Legacy single-text fields mirror text1
+    if "google_similarity_text1" in update:
+        update["google_sources"] = update["google_sources_text1"]
+        update["google_highlighted_text"] = update["google_highlighted_text1"]
+
+    await db.history.update_one({"_id": record["_id"]}, {"$set": update})
+    return {key: value for key, value in update.items() if "." not in key}
+
+async def compute_ai_analysis(db, record: dict) -> dict:
+    """AI-detect the record's texts that have no stored result and store them in the record"""
+    missing = missing_slots(record, AI_RESULT_FIELDS)
+    results = await asyncio.gather(*[
+        run_in_threadpool(detect_ai_content_windows, record[slot]) for slot in missing
+    ])
+
+    update = {"ai_analyzed_at": datetime.utcnow()}
+    for slot, result in zip(missing, results):
+        # Both highlight formats are stored so any later view can be served
+        update[AI_RESULT_FIELDS[slot]] = build_ai_detection_result(result, "both").dict()
+
+    await db.history.update_one({"_id": record["_id"]}, {"$set": update})
+    return update
+
+def select_highlights(stored: Optional[dict], highlight_format: str) -> Optional[AIDetectionResult]:
+    if not stored:
+        return None
+    result = AIDetectionResult(**stored)
+    if highlight_format == "spans":
+        result.highlighted_text = None
+    else:
+        result.highlight_spans = None
+    return result
+
 @router.get("/my-history", response_model=List[HistoryResponse])
 async def get_my_history(current_user: dict = Depends(get_current_user)):
     """Get current user's plagiarism check history"""
@@ -123,8 +274,8 @@ async def delete_history_record(
                 detail="You don't have permission to delete this record"
             )
         
-        # Delete the record
-        await db.history.delete_one({"_id": ObjectId(history_id)})
+        # Delete the record along with its index postings
+        await history_store.delete_history_record(db, ObjectId(history_id))
         
         return {"message": "History record deleted successfully", "history_id": history_id}
     
@@ -140,9 +291,97 @@ async def clear_my_history(current_user: dict = Depends(get_current_user)):
     db = get_database()
     
     user_id = str(current_user["_id"])
-    result = await db.history.delete_many({"user_id": user_id})
+    # Records are deleted in batches by the maintenance worker; poll the job for progress
+    job = await enqueue_history_purge(db, "clear_history", user_id=user_id)
     
     return {
-        "message": "History cleared successfully",
-        "deleted_count": result.deleted_count
-    }
\ No newline at end of file
+        "message": "History is being cleared",
+        "deleted_count": job["total"],
+        "job_id": str(job["_id"])
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_history_job(
+    job_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Progress of a background history deletion"""
+    db = get_database()
+    
+    try:
+        job = await get_job(db, ObjectId(job_id))
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid job ID"
+        )
+    
+    if not job or (job.get("user_id") != str(current_user["_id"]) and not current_user.get("is_admin", False)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return job_progress(job)
+
+@router.get("/{history_id}/google", response_model=HistoryGoogleAnalysis)
+async def get_history_google_analysis(
+    history_id: str,
+    highlight_format: HighlightFormat = Query("html"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Google analysis of a history record, computed on first request
+    The result is stored in the record, so later requests are served from it.
+    Only computing it takes an admission slot.
+    """
+    db = get_database()
+    record = await get_owned_record(db, history_id, current_user)
+
+    cached = not missing_slots(record, GOOGLE_RESULT_FIELDS)
+    if not cached:
+        record.update(await compute_once((history_id, "google"), lambda: compute_admitted(
+            current_user, lambda: compute_google_analysis(db, record))))
+
+    spans_only = highlight_format == "spans"
+    return HistoryGoogleAnalysis(
+        history_id=history_id,
+        cached=cached,
+        google_similarity=record.get("google_similarity"),
+        google_similarity_text1=record.get("google_similarity_text1"),
+        google_similarity_text2=record.get("google_similarity_text2"),
+        google_sources_text1=record.get("google_sources_text1"),
+        google_sources_text2=record.get("google_sources_text2"),
+        google_highlighted_text1=None if spans_only else record.get("google_highlighted_text1"),
+        google_highlighted_text2=None if spans_only else record.get("google_highlighted_text2"),
+        google_highlight_spans_text1=record.get("google_highlight_spans_text1") if spans_only else None,
+        google_highlight_spans_text2=record.get("google_highlight_spans_text2") if spans_only else None,
+        all_google_matches_text1=record.get("all_google_matches_text1"),
+        all_google_matches_text2=record.get("all_google_matches_text2")
+    )
+
+@router.get("/{history_id}/ai", response_model=HistoryAIAnalysis)
+async def get_history_ai_analysis(
+    history_id: str,
+    highlight_format: HighlightFormat = Query("html"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    AI detection of a history record's texts, computed on first request
+    The result is stored in the record, so later requests are served from it.
+    Only computing it takes an admission slot.
+    """
+    db = get_database()
+    record = await get_owned_record(db, history_id, current_user)
+
+    cached = not missing_slots(record, AI_RESULT_FIELDS)
+    if not cached:
+        record.update(await compute_once((history_id, "ai"), lambda: compute_admitted(
+            current_user, lambda: compute_ai_analysis(db, record))))
+
+    return HistoryAIAnalysis(
+        history_id=history_id,
+        cached=cached,
+        ai_detection=select_highlights(record.get("ai_detection"), highlight_format),
+        ai_detection_text2=select_highlights(record.get("ai_detection_text2"), highlight_format)
+    )
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
-from app.database import get_database
+from app.database import get_database, get_heavy_database
 from app.utils.security import get_current_user
-from app.utils.google_similarity import calculate_text_similarity
+from app.utils.admission import admission
+from app.utils.similarity_cascade import SimilarityCascade
+from app.schemas import SearchPruningStats, CandidateSource, OverlapPassage, ScoringMethod, TfidfEngineStats
+from app.utils.tfidf_engine import get_tfidf_engine
+from app.utils.shingle_index import overlap_passages
+from app.utils.history_scan import TopK, find_candidates, iter_history, page_capacity, MAX_HISTORY_MATCHES
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 router = APIRouter()
@@ -17,125 +22,202 @@ class HistoryMatch(BaseModel):
     original_text1: str
     original_text2: str
     file_name: Optional[str] = None  # Make it Optional and provide default
+    overlaps: Optional[List[OverlapPassage]] = None  # Shared passages (shingle_index source only)
 
 class HistorySearchRequest(BaseModel):
     text: str
     min_similarity: float = 50.0  # Minimum similarity threshold
+    offset: int = Field(0, ge=0)  # Pagination over matches sorted by similarity
+    limit: int = Field(100, ge=1)
+    candidate_source: CandidateSource = "scan"
+    scoring_method: ScoringMethod = "sequence"
 
 class HistorySearchResponse(BaseModel):
     matches_found: int
     matches: List[HistoryMatch]
     highest_similarity: float
+    offset: int = 0
+    limit: int = 0
+    pruning_stats: Optional[SearchPruningStats] = None
+    scoring_method: ScoringMethod = "sequence"
+    engine_stats: Optional[TfidfEngineStats] = None  # TF-IDF scoring only
 
-@router.post("/search-history", response_model=HistorySearchResponse)
-async def search_in_history(
-    request: HistorySearchRequest,
-    current_user: dict = Depends(get_current_user)
-):
-    """Search for similar text in user's history"""
-    db = get_database()
-    user_id = str(current_user["_id"])
+# Only the fields a search reads; keeps metadata, Google and AI results off the wire
+SEARCH_PROJECTION = {
+    "user_id": 1,
+    "text1": 1,
+    "text2": 1,
+    "timestamp": 1,
+    "file_name": 1,
+    "text1_clean_length": 1,
+    "text2_clean_length": 1,
+}
+
+def build_history_match(record: dict, matched_slot: str, similarity: float,
+                        overlaps: Optional[List[OverlapPassage]] = None) -> HistoryMatch:
+    matched_text = record[matched_slot]
     
-    # Get all user's history
-    history_records = []
-    cursor = db.history.find({"user_id": user_id})
+    # Safely get file_name with default value
+    file_name = record.get("file_name", None) or "Text Comparison"
     
-    async for record in cursor:
-        history_records.append(record)
+    return HistoryMatch(
+        history_id=str(record["_id"]),
+        user_id=record["user_id"],
+        similarity_score=round(similarity, 2),
+        timestamp=record["timestamp"],
+        matched_text=matched_text[:200] + "..." if len(matched_text) > 200 else matched_text,
+        original_text1=record["text1"][:100] + "..." if len(record["text1"]) > 100 else record["text1"],
+        original_text2=record["text2"][:100] + "..." if len(record["text2"]) > 100 else record["text2"],
+        file_name=file_name,
+        overlaps=overlaps
+    )
+
+async def search_history_tfidf(db, base_filter: dict, request: HistorySearchRequest) -> HistorySearchResponse:
+    """Rank history texts by TF-IDF cosine similarity in one pass over the in-memory matrix"""
+    engine = get_tfidf_engine()
+    # Catch-up and deletion checks read the primary, so a lagging secondary
+    # can neither hide new records nor make them look deleted
+    primary = get_database()
+    await engine.ensure_loaded(primary)
     
-    matches = []
-    highest_similarity = 0.0
+    # Records other workers deleted are still in this worker's matrix; tombstone them and rank again
+    while True:
+        matches_found, hits = engine.query(
+            request.text,
+            user_id=base_filter.get("user_id"),
+            min_similarity=request.min_similarity,
+            top_k=page_capacity(request.offset, request.limit)
+        )
+        if not await engine.prune_deleted(primary, [history_id for history_id, _, _ in hits]):
+            break
+    page = hits[request.offset:request.offset + request.limit]
     
-    # Compare against each history record
-    for record in history_records:
-        # Check similarity with text1
-        similarity1 = calculate_text_similarity(request.text, record["text1"])
-        
-        # Check similarity with text2
-        similarity2 = calculate_text_similarity(request.text, record["text2"])
-        
-        # Use the higher similarity score
-        max_similarity = max(similarity1, similarity2)
-        matched_text = record["text1"] if similarity1 > similarity2 else record["text2"]
-        
-        if max_similarity >= request.min_similarity:
-            # Safely get file_name with default value
-            file_name = record.get("file_name", None) or "Text Comparison"
-            
-            matches.append(HistoryMatch(
-                history_id=str(record["_id"]),
-                user_id=record["user_id"],
-                similarity_score=round(max_similarity, 2),
-                timestamp=record["timestamp"],
-                matched_text=matched_text[:200] + "..." if len(matched_text) > 200 else matched_text,
-                original_text1=record["text1"][:100] + "..." if len(record["text1"]) > 100 else record["text1"],
-                original_text2=record["text2"][:100] + "..." if len(record["text2"]) > 100 else record["text2"],
-                file_name=file_name
-            ))
-            
-            highest_similarity = max(highest_similarity, max_similarity)
-    
-    # Sort by similarity score (highest first)
-    matches.sort(key=lambda x: x.similarity_score, reverse=True)
+    # Only the requested page is read back; records deleted since the check drop out here
+    records = {}
+    if page:
+        async for record in iter_history(db, {"_id": {"$in": [history_id for history_id, _, _ in page]}}, SEARCH_PROJECTION):
+            records[record["_id"]] = record
+    
+    matches = [
+        build_history_match(records[history_id], slot, score)
+        for history_id, slot, score in page
+        if history_id in records
+    ]
     
     return HistorySearchResponse(
-        matches_found=len(matches),
+        matches_found=matches_found,
         matches=matches,
-        highest_similarity=round(highest_similarity, 2) if highest_similarity > 0 else 0.0
+        highest_similarity=hits[0][2] if hits else 0.0,
+        offset=request.offset,
+        limit=request.limit,
+        scoring_method="tfidf",
+        engine_stats=TfidfEngineStats(**engine.memory_stats())
     )
 
-@router.post("/search-all-history", response_model=HistorySearchResponse)
-async def search_in_all_history(
-    request: HistorySearchRequest,
-    current_user: dict = Depends(get_current_user)
-):
-    """Search for similar text in ALL users' history (admin or check across all data)"""
-    db = get_database()
+async def search_history_records(db, base_filter: dict, request: HistorySearchRequest) -> HistorySearchResponse:
+    """Score history records matching base_filter against the request text"""
+    if request.offset + request.limit > MAX_HISTORY_MATCHES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset + limit may not exceed {MAX_HISTORY_MATCHES}"
+        )
     
-    # Get all history records
-    history_records = []
-    cursor = db.history.find()
+    if request.scoring_method == "tfidf":
+        return await search_history_tfidf(db, base_filter, request)
     
-    async for record in cursor:
-        history_records.append(record)
+    cascade = SimilarityCascade(request.text, request.min_similarity)
     
-    matches = []
+    # Push the length bound down to Mongo so hopeless records are never fetched
+    query_filter = base_filter
+    length_filter = cascade.length_filter("text1_clean_length", "text2_clean_length")
+    if length_filter:
+        query_filter = {"$and": [base_filter, length_filter]} if base_filter else length_filter
+    
+    # Restrict to records sharing shingles with the query when using an index
+    try:
+        candidates = await find_candidates(db, request.candidate_source, request.text, base_filter.get("user_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if candidates is not None:
+        id_filter = {"_id": {"$in": list({history_id for history_id, _ in candidates})}}
+        query_filter = {"$and": [query_filter, id_filter]} if query_filter else id_filter
+    
+    top_matches = TopK(page_capacity(request.offset, request.limit))
     highest_similarity = 0.0
+    records_scanned = 0
     
-    # Compare against each history record
-    for record in history_records:
-        # Check similarity with text1
-        similarity1 = calculate_text_similarity(request.text, record["text1"])
+    # Stream candidate records and compare each one as it arrives
+    async for record in iter_history(db, query_filter, SEARCH_PROJECTION):
+        records_scanned += 1
+        
+        # Check similarity with text1 and text2; None means a bound ruled it out
+        similarity1 = similarity2 = None
+        if candidates is None or (record["_id"], "text1") in candidates:
+            similarity1 = cascade.score(record["text1"], record.get("text1_clean_length"))
+        if candidates is None or (record["_id"], "text2") in candidates:
+            similarity2 = cascade.score(record["text2"], record.get("text2_clean_length"))
         
-        # Check similarity with text2
-        similarity2 = calculate_text_similarity(request.text, record["text2"])
+        if similarity1 is None and similarity2 is None:
+            continue
         
         # Use the higher similarity score
+        similarity1 = similarity1 if similarity1 is not None else 0.0
+        similarity2 = similarity2 if similarity2 is not None else 0.0
         max_similarity = max(similarity1, similarity2)
-        matched_text = record["text1"] if similarity1 > similarity2 else record["text2"]
         
-        if max_similarity >= request.min_similarity:
-            # Safely get file_name with default value
-            file_name = record.get("file_name", None) or "Text Comparison"
-            
-            matches.append(HistoryMatch(
-                history_id=str(record["_id"]),
-                user_id=record["user_id"],
-                similarity_score=round(max_similarity, 2),
-                timestamp=record["timestamp"],
-                matched_text=matched_text[:200] + "..." if len(matched_text) > 200 else matched_text,
-                original_text1=record["text1"][:100] + "..." if len(record["text1"]) > 100 else record["text1"],
-                original_text2=record["text2"][:100] + "..." if len(record["text2"]) > 100 else record["text2"],
-                file_name=file_name
-            ))
-            
-            highest_similarity = max(highest_similarity, max_similarity)
-    
-    # Sort by similarity score (highest first)
-    matches.sort(key=lambda x: x.similarity_score, reverse=True)
+        if max_similarity < request.min_similarity:
+            continue
+        
+        highest_similarity = max(highest_similarity, max_similarity)
+        
+        if not top_matches.would_keep(max_similarity):
+            top_matches.push(max_similarity, None)
+            continue
+        
+        matched_slot = "text1" if similarity1 > similarity2 else "text2"
+        
+        overlaps = None
+        if candidates is not None and (record["_id"], matched_slot) in candidates:
+            overlaps = [
+                OverlapPassage(**passage)
+                for passage in overlap_passages(record[matched_slot], candidates[(record["_id"], matched_slot)]["positions"])
+            ] or None
+        
+        top_matches.push(max_similarity, build_history_match(record, matched_slot, max_similarity, overlaps))
+    
+    stats = SearchPruningStats(records_scanned=records_scanned, **cascade.stats)
+    if candidates is not None:
+        stats.index_candidates = len(candidates)
+    if length_filter or candidates is not None:
+        total = await db.history.count_documents(base_filter) if base_filter else await db.history.estimated_document_count()
+        stats.records_pruned_by_db = max(0, total - records_scanned)
     
     return HistorySearchResponse(
-        matches_found=len(matches),
-        matches=matches,
-        highest_similarity=round(highest_similarity, 2) if highest_similarity > 0 else 0.0
-    )
\ No newline at end of file
+        matches_found=top_matches.total,
+        matches=top_matches.page(request.offset, request.limit),
+        highest_similarity=round(highest_similarity, 2) if highest_similarity > 0 else 0.0,
+        offset=request.offset,
+        limit=request.limit,
+        pruning_stats=stats
+    )
+
+@router.post("/search-history", response_model=HistorySearchResponse, dependencies=[Depends(admission("heavy"))])
+async def search_in_history(
+    request: HistorySearchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Search for similar text in user's history"""
+    db = get_heavy_database()
+    user_id = str(current_user["_id"])
+    
+    return await search_history_records(db, {"user_id": user_id}, request)
+
+@router.post("/search-all-history", response_model=HistorySearchResponse, dependencies=[Depends(admission("heavy"))])
+async def search_in_all_history(
+    request: HistorySearchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Search for similar text in ALL users' history (admin or check across all data)"""
+    db = get_heavy_database()
+    
+    return await search_history_records(db, {}, request)
\ No newline at end of file
@@ -1,15 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from app.database import get_database
 from app.utils.security import get_current_user
-from app.utils.google_similarity import calculate_text_similarity, check_google_similarity
-from app.utils.ai_detector import detect_ai_content
-from app.schemas import PlagiarismCheck, PlagiarismResult, GoogleSource, AIDetectionResult, AIIndicator
+from app.utils.admission import admission, hold_for_stream
+from app.utils.google_similarity import GOOGLE_REQUEST_TIMEOUT, check_google_similarity, render_highlighted_html
+from app.utils.chunked_similarity import compare_texts
+from app.utils.alignment import find_aligned_passages, passage_spans
+from app.utils.ai_detector import detect_ai_content, detect_ai_content_windows, iter_ai_windows, AI_WINDOW_WORDS
+from app.utils.semantic_similarity import semantic_similarity
+from app.utils.text_extraction import ALLOWED_CONTENT_TYPES, extract_text
+from app.utils.history_store import insert_history_record
+from app.utils.revisions import recheck_revision
+from app.utils.deadline import Deadline
+from app.utils.response_views import parse_fields, render_result
+from app.schemas import PlagiarismCheck, PlagiarismResult, GoogleSource, AIDetectionResult, AIIndicator, HighlightFormat, HighlightSpan, SemanticAlignment, AlignedPassage, PlagiarismRecheck, ResponseView
+from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
-import PyPDF2
-import docx
-import io
+import asyncio
+import json
 import os
 from dotenv import load_dotenv
 
@@ -22,49 +35,87 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_SEARCH_ENGINE_ID = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
 
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
-    try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
-        
-        # If no text was extracted, return a meaningful message
-        if not text.strip():
-            return "[PDF file appears to be scanned or image-based. Text extraction not possible. Please use OCR or convert to text format.]"
-        
-        return text.strip()
-    except Exception as e:
-        print(f"PDF extraction error: {str(e)}")
-        # Return a fallback instead of raising an error
-        return f"[PDF text extraction failed: {str(e)}. File may be corrupted or password-protected.]"
-
-
-def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from DOCX file"""
-    try:
-        docx_file = io.BytesIO(file_content)
-        doc = docx.Document(docx_file)
-        text = "\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
-        
-        # If no text was extracted, return a meaningful message
-        if not text.strip():
-            return "[DOCX file appears to be empty or contains only images. Text extraction not possible.]"
-        
-        return text.strip()
-    except Exception as e:
-        print(f"DOCX extraction error: {str(e)}")
-        # Return a fallback instead of raising an error
-        return f"[DOCX text extraction failed: {str(e)}. File may be corrupted or password-protected.]"
+def build_ai_detection_result(ai_result: dict, highlight_format: str = "html") -> AIDetectionResult:
+    """
+    Convert a detect_ai_content() result into the response schema
+    highlight_format "both" keeps the rendered HTML and the spans (for storing).
+    """
+    include_html = highlight_format != "spans"
+    include_spans = highlight_format != "html"
+    return AIDetectionResult(
+        ai_probability=ai_result["ai_probability"],
+        human_probability=ai_result["human_probability"],
+        confidence=ai_result["confidence"],
+        analysis=ai_result["analysis"],
+        message=ai_result["message"],
+        ai_indicators=[
+            # detect_ai_patterns() reports indicators as phrase/context
+            AIIndicator(
+                type=indicator.get("type") or indicator.get("phrase", ""),
+                description=indicator.get("description") or indicator.get("context", ""),
+                confidence=indicator.get("confidence", 0.0)
+            )
+            for indicator in ai_result["ai_indicators"]
+        ],
+        highlighted_text=ai_result["highlighted_text"] if include_html else None,
+        highlight_spans=ai_result.get("highlight_spans") if include_spans else None,
+        windows=ai_result.get("windows")
+    )
+
+
+async def detect_ai_for_both(text1: str, text2: str, highlight_format: str = "html",
+                             deadline: Optional[Deadline] = None):
+    """Windowed AI detection of both texts, run side by side off the event loop"""
+    if deadline is not None and not deadline.start_stage("ai"):
+        return None, None
+    ai_result1, ai_result2 = await asyncio.gather(
+        run_in_threadpool(detect_ai_content_windows, text1, AI_WINDOW_WORDS, deadline),
+        run_in_threadpool(detect_ai_content_windows, text2, AI_WINDOW_WORDS, deadline)
+    )
+    return (
+        build_ai_detection_result(ai_result1, highlight_format),
+        build_ai_detection_result(ai_result2, highlight_format)
+    )
+
+
+async def google_lookup_both(text1: str, text2: str, deadline: Deadline):
+    """Google lookups of both texts, run side by side within the remaining time budget"""
+    if not deadline.start_stage("google"):
+        return None, None
+    timeout = deadline.timeout(GOOGLE_REQUEST_TIMEOUT)
+    google_result1, google_result2 = await asyncio.gather(
+        run_in_threadpool(check_google_similarity, text1, GOOGLE_API_KEY, GOOGLE_SEARCH_ENGINE_ID, timeout),
+        run_in_threadpool(check_google_similarity, text2, GOOGLE_API_KEY, GOOGLE_SEARCH_ENGINE_ID, timeout)
+    )
+    # A lookup that came back empty-handed after the budget ran out timed out
+    if deadline.expired() and (google_result1 is None or google_result2 is None):
+        deadline.mark_partial("google")
+    return google_result1, google_result2
+
+
+def build_alignment(text1: str, text2: str, highlight_format: str = "html") -> dict:
+    """PlagiarismResult fields for the passages text1 and text2 share"""
+    passages = find_aligned_passages(text1, text2)
+    spans1, spans2 = passage_spans(passages)
+    spans_only = highlight_format == "spans"
+    return {
+        "aligned_passages": [AlignedPassage(**passage) for passage in passages],
+        "highlighted_text1": None if spans_only else render_highlighted_html(text1, spans1),
+        "highlighted_text2": None if spans_only else render_highlighted_html(text2, spans2),
+        "highlight_spans_text1": spans1 if spans_only else None,
+        "highlight_spans_text2": spans2 if spans_only else None,
+    }
+
+
+class AIWindowStreamRequest(BaseModel):
+    text: str
+    window_words: int = Field(AI_WINDOW_WORDS, ge=20, le=2000)
 
 
 # Define schemas for Google-only check
 class GoogleOnlyCheck(BaseModel):
     text: str
+    highlight_format: HighlightFormat = "html"
 
 
 class GoogleOnlyResult(BaseModel):
@@ -72,17 +123,24 @@ class GoogleOnlyResult(BaseModel):
     google_similarity: Optional[float] = None
     google_sources: Optional[List[GoogleSource]] = None
     google_highlighted_text: Optional[str] = None
+    google_highlight_spans: Optional[List[HighlightSpan]] = None
     all_google_matches: Optional[List[str]] = None
     message: str
 
 
-@router.post("/check", response_model=PlagiarismResult)
+@router.post("/check", response_model=PlagiarismResult, dependencies=[Depends(admission("heavy"))])
 async def check_plagiarism(
     plagiarism_data: PlagiarismCheck,
+    view: ResponseView = Query("full"),
+    fields: Optional[str] = Query(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Check plagiarism between two text inputs"""
+    selected_fields = parse_fields(fields, PlagiarismResult)
     db = get_database()
+    if view == "compact":
+        plagiarism_data.highlight_format = "spans"
+    deadline = Deadline.from_budget(plagiarism_data.time_budget_seconds)
 
     if not plagiarism_data.text1 or not plagiarism_data.text2:
         raise HTTPException(
@@ -90,54 +148,75 @@ async def check_plagiarism(
             detail="Both text inputs are required"
         )
 
-    # Calculate text similarity
-    similarity_score = calculate_text_similarity(
+    # Calculate text similarity (chunked for very large texts)
+    comparison = compare_texts(
         plagiarism_data.text1,
-        plagiarism_data.text2
+        plagiarism_data.text2,
+        plagiarism_data.comparison_mode,
+        deadline=deadline
     )
+    similarity_score = comparison["similarity"]
+
+    # Side-by-side passages shared by both texts
+    alignment = {}
+    if plagiarism_data.check_alignment and deadline.start_stage("alignment"):
+        alignment = build_alignment(plagiarism_data.text1, plagiarism_data.text2, plagiarism_data.highlight_format)
+
+    # Sentence-level similarity that survives rewording
+    semantic_score = None
+    semantic_alignments = None
+    if plagiarism_data.check_semantic and deadline.start_stage("semantic"):
+        semantic_result = semantic_similarity(plagiarism_data.text1, plagiarism_data.text2)
+        semantic_score = semantic_result["similarity"]
+        semantic_alignments = [
+            SemanticAlignment(**alignment) for alignment in semantic_result["alignments"]
+        ]
 
     # Check Google similarity for BOTH texts if requested
     google_similarity_text1 = None
     google_sources_text1 = []
     google_highlighted_text1 = None
+    google_highlight_spans_text1 = None
     all_google_matches_text1 = []
 
     google_similarity_text2 = None
     google_sources_text2 = []
     google_highlighted_text2 = None
+    google_highlight_spans_text2 = None
     all_google_matches_text2 = []
 
-    if plagiarism_data.check_google:
-        # Check Text 1 against Google
-        google_result1 = check_google_similarity(
-            plagiarism_data.text1,
-            GOOGLE_API_KEY,
-            GOOGLE_SEARCH_ENGINE_ID
-        )
+    # Deferred analyses are computed on first request of /history/{id}/google or /ai
+    defer = plagiarism_data.defer_analyses
+    deferred = [name for name, requested in (("google", plagiarism_data.check_google), ("ai", plagiarism_data.check_ai))
+                if requested and defer]
+
+    if plagiarism_data.check_google and not defer:
+        # Check both texts against Google within the time budget
+        google_result1, google_result2 = await google_lookup_both(
+            plagiarism_data.text1, plagiarism_data.text2, deadline)
 
         if google_result1:
             google_similarity_text1 = google_result1["similarity_percentage"]
             google_sources_text1 = [
                 GoogleSource(**source) for source in google_result1["sources"]
             ]
-            google_highlighted_text1 = google_result1.get(
-                "highlighted_text", plagiarism_data.text1)
+            if plagiarism_data.highlight_format == "spans":
+                google_highlight_spans_text1 = google_result1.get("highlight_spans", [])
+            else:
+                google_highlighted_text1 = google_result1.get(
+                    "highlighted_text", plagiarism_data.text1)
             all_google_matches_text1 = google_result1.get("all_matches", [])
 
-        # Check Text 2 against Google
-        google_result2 = check_google_similarity(
-            plagiarism_data.text2,
-            GOOGLE_API_KEY,
-            GOOGLE_SEARCH_ENGINE_ID
-        )
-
         if google_result2:
             google_similarity_text2 = google_result2["similarity_percentage"]
             google_sources_text2 = [
                 GoogleSource(**source) for source in google_result2["sources"]
             ]
-            google_highlighted_text2 = google_result2.get(
-                "highlighted_text", plagiarism_data.text2)
+            if plagiarism_data.highlight_format == "spans":
+                google_highlight_spans_text2 = google_result2.get("highlight_spans", [])
+            else:
+                google_highlighted_text2 = google_result2.get(
+                    "highlighted_text", plagiarism_data.text2)
             all_google_matches_text2 = google_result2.get("all_matches", [])
 
     # Use higher Google similarity for overall score
@@ -150,17 +229,10 @@ async def check_plagiarism(
 
     # Check AI content if requested
     ai_detection_result = None
-    if plagiarism_data.check_ai:
-        ai_result = detect_ai_content(plagiarism_data.text1)
-        ai_detection_result = AIDetectionResult(
-            ai_probability=ai_result["ai_probability"],
-            human_probability=ai_result["human_probability"],
-            confidence=ai_result["confidence"],
-            analysis=ai_result["analysis"],
-            message=ai_result["message"],
-            ai_indicators=[AIIndicator(**indicator) for indicator in ai_result["ai_indicators"]],
-            highlighted_text=ai_result["highlighted_text"]
-        )
+    ai_detection_result_text2 = None
+    if plagiarism_data.check_ai and not defer:
+        ai_detection_result, ai_detection_result_text2 = await detect_ai_for_both(
+            plagiarism_data.text1, plagiarism_data.text2, plagiarism_data.highlight_format, deadline)
 
     # Save to history with separate text metadata
     history_entry = {
@@ -186,6 +258,7 @@ async def check_plagiarism(
             "google_sources_count": len(google_sources_text2) if google_sources_text2 else 0
         },
         "similarity_score": similarity_score,
+        "semantic_similarity": semantic_score,
         "google_similarity": google_similarity,
         "google_similarity_text1": google_similarity_text1,
         "google_similarity_text2": google_similarity_text2,
@@ -193,15 +266,19 @@ async def check_plagiarism(
         "google_sources_text2": [source.dict() for source in google_sources_text2] if google_sources_text2 else None,
         "google_highlighted_text1": google_highlighted_text1,
         "google_highlighted_text2": google_highlighted_text2,
+        "google_highlight_spans_text1": google_highlight_spans_text1,
+        "google_highlight_spans_text2": google_highlight_spans_text2,
         "google_sources": [source.dict() for source in google_sources_text1] if google_sources_text1 else None,
         "google_highlighted_text": google_highlighted_text1,
         "ai_detection": ai_detection_result.dict() if ai_detection_result else None,
+        "ai_detection_text2": ai_detection_result_text2.dict() if ai_detection_result_text2 else None,
+        "partial_stages": deadline.partial_stages or None,
         "timestamp": datetime.utcnow(),
         "file_name": None,
         "check_type": "text_comparison"
     }
 
-    await db.history.insert_one(history_entry)
+    inserted = await insert_history_record(db, history_entry)
 
     # Determine message based on similarity
     if similarity_score >= 80:
@@ -211,8 +288,14 @@ async def check_plagiarism(
     else:
         message = "Low similarity - Content appears original"
 
-    return PlagiarismResult(
+    result = PlagiarismResult(
         similarity_score=similarity_score,
+        comparison_mode=comparison["mode"],
+        chunks_compared=comparison["chunks"],
+        chunks_total=comparison["total_chunks"],
+        **alignment,
+        semantic_similarity=semantic_score,
+        semantic_alignments=semantic_alignments,
         google_similarity=google_similarity,
         google_similarity_text1=google_similarity_text1,
         google_similarity_text2=google_similarity_text2,
@@ -222,33 +305,58 @@ async def check_plagiarism(
         google_highlighted_text=google_highlighted_text1,
         google_highlighted_text1=google_highlighted_text1,
         google_highlighted_text2=google_highlighted_text2,
+        google_highlight_spans_text1=google_highlight_spans_text1,
+        google_highlight_spans_text2=google_highlight_spans_text2,
         all_google_matches=all_google_matches_text1 if all_google_matches_text1 else None,
         all_google_matches_text1=all_google_matches_text1 if all_google_matches_text1 else None,
         all_google_matches_text2=all_google_matches_text2 if all_google_matches_text2 else None,
         ai_detection=ai_detection_result,
+        ai_detection_text2=ai_detection_result_text2,
+        deferred_analyses=deferred or None,
+        **deadline.result_fields(),
+        history_id=str(inserted.inserted_id),
         message=message
     )
 
+    return render_result(result, view, selected_fields)
+
 
-@router.post("/upload", response_model=PlagiarismResult)
+@router.post("/upload", response_model=PlagiarismResult, dependencies=[Depends(admission("heavy"))])
 async def check_plagiarism_from_file(
     file1: UploadFile = File(...),
     file2: UploadFile = File(...),
     check_google: bool = Form(False),
     check_ai: bool = Form(False),
+    highlight_format: str = Form("html"),
+    comparison_mode: str = Form("auto"),
+    check_alignment: bool = Form(False),
+    time_budget_seconds: Optional[float] = Form(None),
+    defer_analyses: bool = Form(False),
+    view: ResponseView = Query("full"),
+    fields: Optional[str] = Query(None),
     current_user: dict = Depends(get_current_user)
 ):
     """Check plagiarism between two uploaded files (PDF, DOCX, or TXT)"""
+    selected_fields = parse_fields(fields, PlagiarismResult)
     db = get_database()
+    if view == "compact":
+        highlight_format = "spans"
+    deadline = Deadline.from_budget(time_budget_seconds)
 
-    # Validate file types
-    allowed_types = [
-        "application/pdf",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "text/plain"
-    ]
+    if highlight_format not in ("html", "spans"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="highlight_format must be 'html' or 'spans'"
+        )
 
-    if file1.content_type not in allowed_types or file2.content_type not in allowed_types:
+    if comparison_mode not in ("auto", "full", "chunked"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="comparison_mode must be 'auto', 'full' or 'chunked'"
+        )
+
+    # Validate file types
+    if file1.content_type not in ALLOWED_CONTENT_TYPES or file2.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Only PDF, DOCX, and TXT files are supported"
@@ -259,25 +367,8 @@ async def check_plagiarism_from_file(
     content2 = await file2.read()
 
     # Extract text based on file type
-    if file1.content_type == "application/pdf":
-        text1 = extract_text_from_pdf(content1)
-    elif file1.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        text1 = extract_text_from_docx(content1)
-    else:
-        try:
-            text1 = content1.decode("utf-8")
-        except UnicodeDecodeError:
-            text1 = content1.decode("latin-1", errors='ignore')
-
-    if file2.content_type == "application/pdf":
-        text2 = extract_text_from_pdf(content2)
-    elif file2.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        text2 = extract_text_from_docx(content2)
-    else:
-        try:
-            text2 = content2.decode("utf-8")
-        except UnicodeDecodeError:
-            text2 = content2.decode("latin-1", errors='ignore')
+    text1 = extract_text(content1, file1.content_type, deadline)
+    text2 = extract_text(content2, file2.content_type, deadline)
 
     # Check if text extraction was successful
     if not text1 or len(text1.strip()) < 10:
@@ -292,51 +383,64 @@ async def check_plagiarism_from_file(
             detail=f"Could not extract meaningful text from {file2.filename}. The file may be empty, corrupted, or image-based."
         )
 
-    # Calculate similarity
-    similarity_score = calculate_text_similarity(text1, text2)
+    # Calculate similarity (chunked for book-length uploads)
+    comparison = compare_texts(
+        text1,
+        text2,
+        comparison_mode,
+        deadline=deadline,
+        label=f"{file1.filename} vs {file2.filename}"
+    )
+    similarity_score = comparison["similarity"]
+
+    # Side-by-side passages shared by both files
+    alignment = {}
+    if check_alignment and deadline.start_stage("alignment"):
+        alignment = build_alignment(text1, text2, highlight_format)
 
     # Check Google similarity for BOTH files if requested
     google_similarity_text1 = None
     google_sources_text1 = []
     google_highlighted_text1 = None
+    google_highlight_spans_text1 = None
     all_google_matches_text1 = []
 
     google_similarity_text2 = None
     google_sources_text2 = []
     google_highlighted_text2 = None
+    google_highlight_spans_text2 = None
     all_google_matches_text2 = []
 
-    if check_google:
-        # Check File 1 (text1) against Google
-        google_result1 = check_google_similarity(
-            text1,
-            GOOGLE_API_KEY,
-            GOOGLE_SEARCH_ENGINE_ID
-        )
+    # Deferred analyses are computed on first request of /history/{id}/google or /ai
+    deferred = [name for name, requested in (("google", check_google), ("ai", check_ai))
+                if requested and defer_analyses]
+
+    if check_google and not defer_analyses:
+        # Check both files against Google within the time budget
+        google_result1, google_result2 = await google_lookup_both(text1, text2, deadline)
 
         if google_result1:
             google_similarity_text1 = google_result1["similarity_percentage"]
             google_sources_text1 = [
                 GoogleSource(**source) for source in google_result1["sources"]
             ]
-            google_highlighted_text1 = google_result1.get(
-                "highlighted_text", text1)
+            if highlight_format == "spans":
+                google_highlight_spans_text1 = google_result1.get("highlight_spans", [])
+            else:
+                google_highlighted_text1 = google_result1.get(
+                    "highlighted_text", text1)
             all_google_matches_text1 = google_result1.get("all_matches", [])
 
-        # Check File 2 (text2) against Google
-        google_result2 = check_google_similarity(
-            text2,
-            GOOGLE_API_KEY,
-            GOOGLE_SEARCH_ENGINE_ID
-        )
-
         if google_result2:
             google_similarity_text2 = google_result2["similarity_percentage"]
             google_sources_text2 = [
                 GoogleSource(**source) for source in google_result2["sources"]
             ]
-            google_highlighted_text2 = google_result2.get(
-                "highlighted_text", text2)
+            if highlight_format == "spans":
+                google_highlight_spans_text2 = google_result2.get("highlight_spans", [])
+            else:
+                google_highlighted_text2 = google_result2.get(
+                    "highlighted_text", text2)
             all_google_matches_text2 = google_result2.get("all_matches", [])
 
     # Use higher Google similarity for overall score
@@ -349,17 +453,9 @@ async def check_plagiarism_from_file(
 
     # Check AI content if requested
     ai_detection_result = None
-    if check_ai:
-        ai_result = detect_ai_content(text1)
-        ai_detection_result = AIDetectionResult(
-            ai_probability=ai_result["ai_probability"],
-            human_probability=ai_result["human_probability"],
-            confidence=ai_result["confidence"],
-            analysis=ai_result["analysis"],
-            message=ai_result["message"],
-            ai_indicators=[AIIndicator(**indicator) for indicator in ai_result["ai_indicators"]],
-            highlighted_text=ai_result["highlighted_text"]
-        )
+    ai_detection_result_text2 = None
+    if check_ai and not defer_analyses:
+        ai_detection_result, ai_detection_result_text2 = await detect_ai_for_both(text1, text2, highlight_format, deadline)
 
     # Save to history with detailed metadata for each file
     history_entry = {
@@ -398,15 +494,19 @@ async def check_plagiarism_from_file(
         "google_sources_text2": [source.dict() for source in google_sources_text2] if google_sources_text2 else None,
         "google_highlighted_text1": google_highlighted_text1,
         "google_highlighted_text2": google_highlighted_text2,
+        "google_highlight_spans_text1": google_highlight_spans_text1,
+        "google_highlight_spans_text2": google_highlight_spans_text2,
         "google_sources": [source.dict() for source in google_sources_text1] if google_sources_text1 else None,
         "google_highlighted_text": google_highlighted_text1,
         "ai_detection": ai_detection_result.dict() if ai_detection_result else None,
+        "ai_detection_text2": ai_detection_result_text2.dict() if ai_detection_result_text2 else None,
+        "partial_stages": deadline.partial_stages or None,
         "timestamp": datetime.utcnow(),
         "file_name": f"{file1.filename} vs {file2.filename}",
         "check_type": "file_upload"
     }
 
-    await db.history.insert_one(history_entry)
+    inserted = await insert_history_record(db, history_entry)
 
     # Determine message
     if similarity_score >= 80:
@@ -416,8 +516,12 @@ async def check_plagiarism_from_file(
     else:
         message = "Low similarity - Content appears original"
 
-    return PlagiarismResult(
+    result = PlagiarismResult(
         similarity_score=similarity_score,
+        comparison_mode=comparison["mode"],
+        chunks_compared=comparison["chunks"],
+        chunks_total=comparison["total_chunks"],
+        **alignment,
         google_similarity=google_similarity,
         google_similarity_text1=google_similarity_text1,
         google_similarity_text2=google_similarity_text2,
@@ -427,15 +531,184 @@ async def check_plagiarism_from_file(
         google_highlighted_text=google_highlighted_text1,
         google_highlighted_text1=google_highlighted_text1,
         google_highlighted_text2=google_highlighted_text2,
+        google_highlight_spans_text1=google_highlight_spans_text1,
+        google_highlight_spans_text2=google_highlight_spans_text2,
         all_google_matches=all_google_matches_text1 if all_google_matches_text1 else None,
         all_google_matches_text1=all_google_matches_text1 if all_google_matches_text1 else None,
         all_google_matches_text2=all_google_matches_text2 if all_google_matches_text2 else None,
         ai_detection=ai_detection_result,
+        ai_detection_text2=ai_detection_result_text2,
+        deferred_analyses=deferred or None,
+        **deadline.result_fields(),
+        history_id=str(inserted.inserted_id),
+        message=message
+    )
+
+    return render_result(result, view, selected_fields)
+
+
+@router.post("/ai-detection/stream")
+async def stream_ai_detection(
+    stream_request: AIWindowStreamRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream per-window AI scores as NDJSON while a long text is analysed"""
+    if not stream_request.text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Text is required"
+        )
+    release_slot = await hold_for_stream(str(current_user["_id"]), "heavy")
+
+    async def lines():
+        # Windows are scored in a worker thread; each line is sent as soon as it is ready
+        async for window in iterate_in_threadpool(iter_ai_windows(stream_request.text, stream_request.window_words)):
+            yield json.dumps({"type": "window", **window}) + "\n"
+
+        summary = await run_in_threadpool(detect_ai_content, stream_request.text)
+        summary.pop("highlighted_text", None)
+        yield json.dumps({"type": "summary", **summary}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=BackgroundTask(release_slot))
+
+
+@router.post("/recheck", response_model=PlagiarismResult, dependencies=[Depends(admission("heavy"))])
+async def recheck_revision_plagiarism(
+    recheck_data: PlagiarismRecheck,
+    view: ResponseView = Query("full"),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Re-check a revised submission, recomputing only changed paragraphs"""
+    selected_fields = parse_fields(fields, PlagiarismResult)
+    db = get_database()
+    if view == "compact":
+        recheck_data.highlight_format = "spans"
+    deadline = Deadline.from_budget(recheck_data.time_budget_seconds)
+    user_id = str(current_user["_id"])
+
+    try:
+        previous_id = ObjectId(recheck_data.previous_id)
+    except InvalidId:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid previous_id"
+        )
+
+    previous = await db.history.find_one({"_id": previous_id, "user_id": user_id})
+    if not previous:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Previous version not found"
+        )
+
+    text2 = recheck_data.text2 if recheck_data.text2 is not None else previous.get("text2", "")
+    if not recheck_data.text1 or not text2 or text2 == "[Google Only Check]":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Both text inputs are required"
+        )
+
+    # Blocking Google lookups and AI scoring; keep them off the event loop
+    revision = await run_in_threadpool(
+        recheck_revision,
+        recheck_data.text1,
+        text2,
+        previous,
+        check_google=recheck_data.check_google,
+        check_ai=recheck_data.check_ai,
+        api_key=GOOGLE_API_KEY,
+        search_engine_id=GOOGLE_SEARCH_ENGINE_ID,
+        deadline=deadline
+    )
+    similarity_score = revision["similarity"]
+    spans_only = recheck_data.highlight_format == "spans"
+
+    google_similarity = None
+    google_sources = []
+    google_highlighted_text = None
+    google_highlight_spans = None
+    all_google_matches = []
+    if revision["google"]:
+        google_similarity = revision["google"]["similarity_percentage"]
+        google_sources = [GoogleSource(**source) for source in revision["google"]["sources"]]
+        if spans_only:
+            google_highlight_spans = revision["google"]["highlight_spans"]
+        else:
+            google_highlighted_text = revision["google"]["highlighted_text"]
+        all_google_matches = revision["google"]["all_matches"]
+
+    ai_detection_result = None
+    if revision["ai"]:
+        ai_detection_result = build_ai_detection_result(revision["ai"], recheck_data.highlight_format)
+
+    history_entry = {
+        "user_id": user_id,
+        "text1": recheck_data.text1,
+        "text2": text2,
+        "text1_name": previous.get("text1_name") or "Text 1 (Revision)",
+        "text2_name": previous.get("text2_name") or "Text 2",
+        "text1_metadata": {
+            "source": "revision",
+            "length": len(recheck_data.text1),
+            "word_count": len(recheck_data.text1.split()),
+            "submitted_at": datetime.utcnow().isoformat(),
+            "google_similarity": google_similarity,
+            "google_sources_count": len(google_sources)
+        },
+        "text2_metadata": previous.get("text2_metadata"),
+        "similarity_score": similarity_score,
+        "google_similarity": google_similarity,
+        "google_similarity_text1": google_similarity,
+        "google_sources_text1": [source.dict() for source in google_sources] if google_sources else None,
+        "google_highlighted_text1": google_highlighted_text,
+        "google_highlight_spans_text1": google_highlight_spans,
+        "google_sources": [source.dict() for source in google_sources] if google_sources else None,
+        "google_highlighted_text": google_highlighted_text,
+        "ai_detection": ai_detection_result.dict() if ai_detection_result else None,
+        "partial_stages": deadline.partial_stages or None,
+        "timestamp": datetime.utcnow(),
+        "file_name": previous.get("file_name"),
+        "check_type": previous.get("check_type", "text_comparison"),
+        "revision_of": str(previous_id),
+        "paragraph_results": revision["paragraph_results"]
+    }
+
+    inserted = await insert_history_record(db, history_entry)
+
+    # Determine message based on similarity
+    if similarity_score >= 80:
+        message = "High similarity detected - Likely plagiarism"
+    elif similarity_score >= 50:
+        message = "Moderate similarity detected - Review recommended"
+    else:
+        message = "Low similarity - Content appears original"
+
+    result = PlagiarismResult(
+        similarity_score=similarity_score,
+        comparison_mode="revision",
+        revision_of=str(previous_id),
+        paragraphs_total=revision["paragraphs"],
+        paragraphs_reused=revision["paragraphs_reused"],
+        google_similarity=google_similarity,
+        google_similarity_text1=google_similarity,
+        google_sources=google_sources if google_sources else None,
+        google_sources_text1=google_sources if google_sources else None,
+        google_highlighted_text=google_highlighted_text,
+        google_highlighted_text1=google_highlighted_text,
+        google_highlight_spans_text1=google_highlight_spans,
+        all_google_matches=all_google_matches if all_google_matches else None,
+        all_google_matches_text1=all_google_matches if all_google_matches else None,
+        ai_detection=ai_detection_result,
+        **deadline.result_fields(),
+        history_id=str(inserted.inserted_id),
         message=message
     )
 
+    return render_result(result, view, selected_fields)
+
 
-@router.post("/check-google-only", response_model=GoogleOnlyResult)
+@router.post("/check-google-only", response_model=GoogleOnlyResult, dependencies=[Depends(admission("heavy"))])
 async def check_google_only(
     google_check: GoogleOnlyCheck,
     current_user: dict = Depends(get_current_user)
@@ -453,6 +726,7 @@ async def check_google_only(
     google_similarity = None
     google_sources = []
     google_highlighted_text = None
+    google_highlight_spans = None
     all_google_matches = []
 
     google_result = check_google_similarity(
@@ -466,8 +740,11 @@ async def check_google_only(
         google_sources = [
             GoogleSource(**source) for source in google_result["sources"]
         ]
-        google_highlighted_text = google_result.get(
-            "highlighted_text", google_check.text)
+        if google_check.highlight_format == "spans":
+            google_highlight_spans = google_result.get("highlight_spans", [])
+        else:
+            google_highlighted_text = google_result.get(
+                "highlighted_text", google_check.text)
         all_google_matches = google_result.get("all_matches", [])
     else:
         raise HTTPException(
@@ -493,12 +770,13 @@ async def check_google_only(
         "google_similarity": google_similarity,
         "google_sources": [source.dict() for source in google_sources] if google_sources else None,
         "google_highlighted_text": google_highlighted_text,
+        "google_highlight_spans": google_highlight_spans,
         "timestamp": datetime.utcnow(),
         "file_name": None,
         "check_type": "google_only"
     }
 
-    await db.history.insert_one(history_entry)
+    await insert_history_record(db, history_entry)
 
     # Determine message based on Google similarity
     if google_similarity >= 80:
@@ -515,6 +793,7 @@ async def check_google_only(
         google_similarity=google_similarity,
         google_sources=google_sources if google_sources else None,
         google_highlighted_text=google_highlighted_text,
+        google_highlight_spans=google_highlight_spans,
         all_google_matches=all_google_matches if all_google_matches else None,
         message=message
     )
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Tuple, Literal
 from datetime import datetime
 from bson import ObjectId
 
@@ -49,15 +49,69 @@ class UserResponse(BaseModel):
     is_admin: bool
     created_at: datetime
 
+# ==========================================
+# HIGHLIGHT SCHEMAS
+# ==========================================
+
+# (start, end, kind) character span; kind is the CSS class, e.g. "google-match"
+HighlightSpan = Tuple[int, int, str]
+
+# "html" returns <mark>-annotated copies of the text, "spans" returns raw spans only
+HighlightFormat = Literal["html", "spans"]
+
+# "full" returns every PlagiarismResult field; "compact" drops the legacy
+# aliases of the text1 fields, rendered HTML copies of the documents and
+# empty fields (highlights come back as spans instead)
+ResponseView = Literal["full", "compact"]
+
 # ==========================================
 # PLAGIARISM CHECK SCHEMAS
 # ==========================================
 
+# "chunked" compares paragraph windows so memory stays bounded on very large
+# documents; "auto" picks it above CHUNKED_COMPARISON_CHARS
+ComparisonMode = Literal["auto", "full", "chunked"]
+
 class PlagiarismCheck(BaseModel):
     text1: str
     text2: str
     check_google: bool = False
     check_ai: bool = False
+    check_semantic: bool = False  # Paraphrase-tolerant sentence alignment
+    comparison_mode: ComparisonMode = "auto"
+    check_alignment: bool = False  # Matched passages with offsets in both texts
+    highlight_format: HighlightFormat = "html"
+    time_budget_seconds: Optional[float] = None  # Overall budget; slow stages return partial results
+    defer_analyses: bool = False  # Skip Google/AI now; /history/{id}/google and /ai compute them on demand
+
+class PlagiarismRecheck(BaseModel):
+    """Revised text1 of an earlier check; unchanged paragraphs reuse its results"""
+    previous_id: str  # History record of the previous version
+    text1: str
+    text2: Optional[str] = None  # Defaults to the previous version's text2
+    check_google: bool = False
+    check_ai: bool = False
+    highlight_format: HighlightFormat = "html"
+    time_budget_seconds: Optional[float] = None
+
+class SemanticAlignment(BaseModel):
+    """A text1 sentence and the text2 sentence it most likely paraphrases"""
+    text1_sentence: str
+    text2_sentence: str
+    text1_start: int
+    text1_end: int
+    text2_start: int
+    text2_end: int
+    similarity: float
+
+class AlignedPassage(BaseModel):
+    """Run of identical words found in both texts"""
+    text1_start: int
+    text1_end: int
+    text2_start: int
+    text2_end: int
+    words: int
+    text: str
 
 # ==========================================
 # GOOGLE SIMILARITY SCHEMAS
@@ -79,6 +133,16 @@ class AIIndicator(BaseModel):
     description: str  # Changed from 'context' to 'description'
     confidence: Optional[float] = 0.0  # Added confidence field
 
+class AIWindowScore(BaseModel):
+    """AI score of one paragraph/window of the text (heatmap cell)"""
+    index: int
+    start: int
+    end: int
+    words: int
+    ai_probability: float
+    confidence: str
+    patterns_detected: int = 0
+
 class AIDetectionResult(BaseModel):
     ai_probability: float
     human_probability: float
@@ -87,6 +151,8 @@ class AIDetectionResult(BaseModel):
     message: str
     ai_indicators: List[AIIndicator]
     highlighted_text: Optional[str] = None
+    highlight_spans: Optional[List[HighlightSpan]] = None
+    windows: Optional[List[AIWindowScore]] = None  # Per-window heatmap
 
 # ==========================================
 # PLAGIARISM RESULT SCHEMA (COMPREHENSIVE)
@@ -95,6 +161,25 @@ class AIDetectionResult(BaseModel):
 class PlagiarismResult(BaseModel):
     # Text similarity between text1 and text2
     similarity_score: float
+    comparison_mode: Optional[str] = None  # "full", "chunked" or "revision"
+    chunks_compared: Optional[int] = None  # Chunked mode: text1 chunks compared out of chunks_total
+    chunks_total: Optional[int] = None  # (fewer when the time budget cut the comparison short)
+    
+    # Passages shared by text1 and text2 (check_alignment only)
+    aligned_passages: Optional[List[AlignedPassage]] = None
+    highlighted_text1: Optional[str] = None
+    highlighted_text2: Optional[str] = None
+    highlight_spans_text1: Optional[List[HighlightSpan]] = None
+    highlight_spans_text2: Optional[List[HighlightSpan]] = None
+    
+    # Revision re-checks only
+    revision_of: Optional[str] = None
+    paragraphs_total: Optional[int] = None
+    paragraphs_reused: Optional[int] = None
+    
+    # Sentence-level semantic similarity (check_semantic only)
+    semantic_similarity: Optional[float] = None
+    semantic_alignments: Optional[List[SemanticAlignment]] = None
     
     # Overall Google similarity (highest of text1 and text2)
     google_similarity: Optional[float] = None
@@ -106,18 +191,28 @@ class PlagiarismResult(BaseModel):
     google_similarity_text1: Optional[float] = None
     google_sources_text1: Optional[List[GoogleSource]] = None
     google_highlighted_text1: Optional[str] = None
+    google_highlight_spans_text1: Optional[List[HighlightSpan]] = None
     all_google_matches_text1: Optional[List[str]] = None
     
     # Text 2 specific Google results
     google_similarity_text2: Optional[float] = None
     google_sources_text2: Optional[List[GoogleSource]] = None
     google_highlighted_text2: Optional[str] = None
+    google_highlight_spans_text2: Optional[List[HighlightSpan]] = None
     all_google_matches_text2: Optional[List[str]] = None
     
     # AI Detection results
     ai_detection: Optional[AIDetectionResult] = None  # For text1
     ai_detection_text2: Optional[AIDetectionResult] = None  # For text2 (if needed)
     
+    # Time budget: stages cut short when it ran out (partial results)
+    partial: bool = False
+    partial_stages: Optional[List[str]] = None
+    time_budget_seconds: Optional[float] = None
+    elapsed_seconds: Optional[float] = None
+    # History record of this check; deferred analyses are its sub-resources
+    history_id: Optional[str] = None
+    deferred_analyses: Optional[List[str]] = None  # "google" and/or "ai"
     # Result message
     message: str
 
@@ -155,6 +250,40 @@ class HistoryResponse(BaseModel):
     text1_metadata: Optional[dict] = None
     text2_metadata: Optional[dict] = None
 
+class SearchPruningStats(BaseModel):
+    """How many records/texts each tier of the similarity cascade eliminated"""
+    records_pruned_by_db: int = 0  # Filtered out by stored lengths in Mongo
+    records_scanned: int = 0
+    texts_considered: int = 0
+    pruned_by_length: int = 0
+    pruned_by_quick_ratio: int = 0
+    exact_scored: int = 0
+    index_candidates: Optional[int] = None  # Texts sharing shingles with the query
+
+# "scan" compares every record; "shingle_index" (Mongo) and "fingerprint_index"
+# (memory-mapped snapshot) only compare records sharing shingles with the query
+CandidateSource = Literal["scan", "shingle_index", "fingerprint_index"]
+
+class OverlapPassage(BaseModel):
+    """Passage of a stored text that shares shingles with the query"""
+    start: int
+    end: int
+    text: str
+
+# "sequence" runs the character-level similarity cascade; "tfidf" ranks
+# every stored text at once by TF-IDF cosine similarity of its words
+ScoringMethod = Literal["sequence", "tfidf"]
+
+class TfidfEngineStats(BaseModel):
+    """Size of the in-memory TF-IDF engine"""
+    documents: int = 0
+    tombstoned: int = 0  # Rows of deleted records still held in the matrix
+    nonzeros: int = 0
+    matrix_bytes: int = 0
+    df_bytes: int = 0
+    norms_bytes: int = 0
+    total_bytes: int = 0
+
 # ==========================================
 # DATABASE MODELS
 # ==========================================
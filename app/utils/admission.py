@@ -0,0 +1,186 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict
+from fastapi import Depends, HTTPException, status
+from app.utils.security import get_current_user
+
+# Cost classes: how many slots one request of each class holds while it runs.
+# Light endpoints (history listing, auth, ...) are not admission controlled.
+OPERATION_COSTS = {
+    "heavy": 1,  # single document checks and history scans
+    "batch": int(os.getenv("ADMISSION_BATCH_COST", "2")),  # many documents in one request
+}
+
+# Slots are counted in each worker process. ADMISSION_GLOBAL_SLOTS is the
+# total for the machine and is split across the WEB_CONCURRENCY gunicorn
+# workers; ADMISSION_USER_SLOTS is the most one user may hold in one worker
+# (a user's requests spread over workers may hold that many in each)
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+ADMISSION_GLOBAL_SLOTS = int(os.getenv("ADMISSION_GLOBAL_SLOTS", "0")) or os.cpu_count() or 4
+ADMISSION_WORKER_SLOTS = max(1, ADMISSION_GLOBAL_SLOTS // WEB_CONCURRENCY)
+ADMISSION_USER_SLOTS = int(os.getenv("ADMISSION_USER_SLOTS", "2"))
+
+# Requests wait this long for a slot before getting a 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+# Beyond this many waiting requests new ones are turned away immediately
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+
+
+class AdmissionController:
+    """
+    Caps concurrent CPU-heavy requests per user and for this worker process
+    A request that doesn't fit waits (up to ADMISSION_QUEUE_TIMEOUT) for a
+    release; when the queue is full or the wait runs out it gets a 429 with a
+    Retry-After estimated from how long operations have been holding slots.
+    """
+
+    def __init__(self, global_slots: int = ADMISSION_WORKER_SLOTS, user_slots: int = ADMISSION_USER_SLOTS):
+        self.global_slots = global_slots
+        self.user_slots = user_slots
+        self.in_use = 0
+        self.in_use_by_user: Dict[str, int] = {}
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_hold = 1.0  # EWMA of seconds a slot stays held
+        self._condition = asyncio.Condition()
+
+    def _weight(self, cost: str) -> int:
+        # A request must always be able to fit once everything else has drained
+        return max(1, min(OPERATION_COSTS[cost], self.user_slots, self.global_slots))
+
+    def _fits(self, user_id: str, weight: int) -> bool:
+        return (self.in_use + weight <= self.global_slots and
+                self.in_use_by_user.get(user_id, 0) + weight <= self.user_slots)
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before retrying"""
+        backlog = (self.waiting + 1) / max(self.global_slots, 1)
+        return max(1, math.ceil(self.avg_hold * backlog))
+
+    def _reject(self, reason: str) -> HTTPException:
+        self.rejected += 1
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Server busy: {reason}. Please retry shortly.",
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    async def acquire(self, user_id: str, cost: str) -> int:
+        """Wait for a slot for user_id; returns the weight to pass to release()"""
+        weight = self._weight(cost)
+        async with self._condition:
+            if not self._fits(user_id, weight):
+                if self.waiting >= ADMISSION_MAX_QUEUE:
+                    raise self._reject("too many queued requests")
+
+                self.waiting += 1
+                self.queued += 1
+                started = time.perf_counter()
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._fits(user_id, weight)),
+                        ADMISSION_QUEUE_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    raise self._reject("timed out waiting for a free slot")
+                finally:
+                    self.waiting -= 1
+                    waited = time.perf_counter() - started
+                    self.total_wait += waited
+                    self.max_wait = max(self.max_wait, waited)
+
+            self.in_use += weight
+            self.in_use_by_user[user_id] = self.in_use_by_user.get(user_id, 0) + weight
+            self.admitted += 1
+        return weight
+
+    async def release(self, user_id: str, weight: int, held_seconds: float):
+        async with self._condition:
+            self.in_use -= weight
+            remaining = self.in_use_by_user.get(user_id, 0) - weight
+            if remaining > 0:
+                self.in_use_by_user[user_id] = remaining
+            else:
+                self.in_use_by_user.pop(user_id, None)
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held_seconds
+            self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        return {
+            "global_slots": self.global_slots,
+            "web_concurrency": WEB_CONCURRENCY,
+            "user_slots": self.user_slots,
+            "slots_in_use": self.in_use,
+            "active_users": len(self.in_use_by_user),
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.total_wait / self.queued, 3) if self.queued else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "avg_hold_seconds": round(self.avg_hold, 3),
+        }
+
+
+_controller = AdmissionController()
+
+
+def get_admission_controller() -> AdmissionController:
+    return _controller
+
+
+def admission(cost: str):
+    """
+    Dependency that holds an admission slot of the given cost class for the
+    duration of the request, e.g. dependencies=[Depends(admission("heavy"))]
+    """
+    if cost not in OPERATION_COSTS:
+        raise ValueError(f"Unknown operation cost class: {cost}")
+
+    async def hold_slot(current_user: dict = Depends(get_current_user)):
+        async with admitted(str(current_user["_id"]), cost):
+            yield
+
+    return hold_slot
+
+
+@asynccontextmanager
+async def admitted(user_id: str, cost: str):
+    """
+    Hold a slot for the body of an async with block
+    For endpoints that only sometimes do heavy work (e.g. serving a stored
+    analysis or computing it), so cheap requests don't wait for a slot.
+    """
+    weight = await _controller.acquire(user_id, cost)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        await _controller.release(user_id, weight, time.perf_counter() - started)
+
+
+async def hold_for_stream(user_id: str, cost: str) -> Callable[[], Awaitable[None]]:
+    """
+    Take a slot for a streaming response (429 now if it doesn't fit)
+    Yield dependencies exit before a StreamingResponse body is produced, so
+    streaming endpoints take the slot themselves and pass the returned
+    release to the response as its background task, which runs once the
+    stream has finished or the client has gone.
+    """
+    weight = await _controller.acquire(user_id, cost)
+    started = time.perf_counter()
+
+    async def release():
+        await _controller.release(user_id, weight, time.perf_counter() - started)
+
+    return release
@@ -1,29 +1,45 @@
+import os
 import re
-from typing import Dict, List, Tuple
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Tuple
 from difflib import SequenceMatcher
+from app.utils.google_similarity import find_match_spans, render_highlighted_html
+from app.utils.chunked_similarity import paragraph_spans
+from app.utils.tokens import DocumentLike, TokenizedDocument, tokenize
+from app.utils.ngram_lm import get_language_model
+from app.utils.deadline import Deadline
 
-def calculate_perplexity_score(text: str) -> float:
+# Words per AI detection window; shorter paragraphs are packed together
+AI_WINDOW_WORDS = int(os.getenv("AI_WINDOW_WORDS", "200"))
+
+# Bits per character under the language model mapped to perplexity scores 0 and 100
+LM_BITS_LOW = float(os.getenv("LM_BITS_LOW", "1.5"))
+LM_BITS_HIGH = float(os.getenv("LM_BITS_HIGH", "3.5"))
+
+def calculate_perplexity_score(text: DocumentLike) -> float:
     """
     Calculate a simple perplexity-like score
     AI text tends to have lower perplexity (more predictable)
     Human text tends to have higher perplexity (more varied)
+    Accepts raw text or a TokenizedDocument built once by the caller.
     """
-    words = text.lower().split()
-    if len(words) < 10:
+    doc = tokenize(text)
+    text = doc.text
+    total_words = len(doc)
+    if total_words < 10:
         return 50.0  # Not enough data
     
     # Calculate word diversity
-    unique_words = len(set(words))
-    total_words = len(words)
+    unique_words = doc.unique_count()
     diversity_ratio = unique_words / total_words
     
     # Calculate average word length
-    avg_word_length = sum(len(word) for word in words) / len(words)
+    avg_word_length = (sum(doc.ends) - sum(doc.starts)) / total_words
     
     # Calculate sentence complexity
     sentences = re.split(r'[.!?]+', text)
     sentences = [s.strip() for s in sentences if s.strip()]
-    avg_sentence_length = len(words) / max(len(sentences), 1)
+    avg_sentence_length = total_words / max(len(sentences), 1)
     
     # Score calculation (0-100, higher = more likely human)
     score = 0
@@ -60,6 +76,21 @@ def calculate_perplexity_score(text: str) -> float:
     
     return min(100, max(0, score))
 
+def language_model_perplexity(text: str):
+    """
+    (perplexity score, bits per char) from the n-gram language model
+    Same 0-100 scale as calculate_perplexity_score (higher = more likely
+    human); None when no model is configured or the text is empty.
+    """
+    model = get_language_model()
+    if model is None:
+        return None
+    bits = model.bits_per_char(text)
+    if bits is None:
+        return None
+    score = (bits - LM_BITS_LOW) / (LM_BITS_HIGH - LM_BITS_LOW) * 100
+    return min(100.0, max(0.0, score)), bits
+
 def detect_ai_patterns(text: str) -> Dict[str, any]:
     """
     Detect common AI writing patterns
@@ -138,11 +169,81 @@ def analyze_sentence_structure(text: str) -> Dict[str, float]:
         "variance": variance
     }
 
-def detect_ai_content(text: str) -> Dict[str, any]:
+def ai_verdict(ai_probability: float) -> Tuple[str, str]:
+    """Confidence level and message for an AI probability"""
+    # Determine confidence level
+    if ai_probability > 75 or ai_probability < 25:
+        confidence = "high"
+    elif ai_probability > 60 or ai_probability < 40:
+        confidence = "medium"
+    else:
+        confidence = "low"
+    
+    # Generate message
+    if ai_probability >= 70:
+        message = "High likelihood of AI-generated content"
+    elif ai_probability >= 50:
+        message = "Moderate indicators of AI-generated content"
+    elif ai_probability >= 30:
+        message = "Some AI patterns detected, likely human-written"
+    else:
+        message = "Appears to be human-written content"
+    
+    return confidence, message
+
+def combine_ai_results(text: str, parts: List[Tuple[int, int, Dict]]) -> Dict[str, any]:
+    """
+    Merge detect_ai_content() results of pieces of a text into one result
+    parts are (start, end, result) with character offsets of each piece in
+    text. Scores are averaged weighted by word count; pieces too short to be
+    analysed don't count. Indicators are concatenated and spans shifted.
+    """
+    weights = []
+    for start, end, result in parts:
+        analysed = len(text[start:end].strip()) >= 50
+        weights.append(len(text[start:end].split()) if analysed else 0)
+    total_weight = sum(weights)
+    
+    if not total_weight:
+        return detect_ai_content(text)
+    
+    def weighted(value):
+        return sum(weight * value(result) for weight, (_, _, result) in zip(weights, parts)) / total_weight
+    
+    ai_probability = weighted(lambda result: result["ai_probability"])
+    confidence, message = ai_verdict(ai_probability)
+    
+    indicators = []
+    highlight_spans = []
+    for start, _, result in parts:
+        indicators.extend(result["ai_indicators"])
+        highlight_spans.extend((span_start + start, span_end + start, kind)
+                               for span_start, span_end, kind in result.get("highlight_spans") or [])
+    
+    return {
+        "ai_probability": round(ai_probability, 2),
+        "human_probability": round(100 - ai_probability, 2),
+        "confidence": confidence,
+        "analysis": {
+            "perplexity_score": round(weighted(lambda result: result["analysis"]["perplexity_score"]), 2),
+            "patterns_detected": len(indicators),
+            "uniformity_score": round(weighted(lambda result: result["analysis"]["uniformity_score"]), 2),
+            "avg_sentence_length": round(weighted(lambda result: result["analysis"].get("avg_sentence_length", 0)), 2)
+        },
+        "message": message,
+        "ai_indicators": indicators,
+        "highlighted_text": render_highlighted_html(text, highlight_spans),
+        "highlight_spans": highlight_spans
+    }
+
+def detect_ai_content(text: DocumentLike) -> Dict[str, any]:
     """
     Main AI detection function
     Returns comprehensive AI detection results
+    Accepts raw text or a TokenizedDocument built once by the caller.
     """
+    doc = tokenize(text)
+    text = doc.text
     if not text or len(text.strip()) < 50:
         return {
             "ai_probability": 0.0,
@@ -155,11 +256,18 @@ def detect_ai_content(text: str) -> Dict[str, any]:
             },
             "message": "Text too short for accurate analysis",
             "ai_indicators": [],
-            "highlighted_text": text
+            "highlighted_text": text,
+            "highlight_spans": []
         }
     
-    # Run all detection methods
-    perplexity_score = calculate_perplexity_score(text)
+    # Run all detection methods on a single tokenization of the text
+    # Real per-character perplexity when a language model is configured
+    bits_per_char = None
+    lm_result = language_model_perplexity(text)
+    if lm_result is not None:
+        perplexity_score, bits_per_char = lm_result
+    else:
+        perplexity_score = calculate_perplexity_score(doc)
     patterns = detect_ai_patterns(text)
     structure = analyze_sentence_structure(text)
     
@@ -183,35 +291,15 @@ def detect_ai_content(text: str) -> Dict[str, any]:
     ai_probability = min(100, max(0, ai_probability))
     human_probability = 100 - ai_probability
     
-    # Determine confidence level
-    if ai_probability > 75 or ai_probability < 25:
-        confidence = "high"
-    elif ai_probability > 60 or ai_probability < 40:
-        confidence = "medium"
-    else:
-        confidence = "low"
-    
-    # Generate message
-    if ai_probability >= 70:
-        message = "High likelihood of AI-generated content"
-    elif ai_probability >= 50:
-        message = "Moderate indicators of AI-generated content"
-    elif ai_probability >= 30:
-        message = "Some AI patterns detected, likely human-written"
-    else:
-        message = "Appears to be human-written content"
+    confidence, message = ai_verdict(ai_probability)
     
     # Highlight AI patterns in text
-    highlighted_text = text
-    for pattern in patterns["patterns_found"]:
-        phrase = pattern["phrase"]
-        # Case-insensitive replacement with highlight
-        pattern_regex = re.compile(re.escape(phrase), re.IGNORECASE)
-        highlighted_text = pattern_regex.sub(
-            f'<mark class="ai-pattern">{phrase}</mark>',
-            highlighted_text,
-            count=1
-        )
+    highlight_spans = find_match_spans(
+        text,
+        [pattern["phrase"] for pattern in patterns["patterns_found"]],
+        kind="ai-pattern"
+    )
+    highlighted_text = render_highlighted_html(text, highlight_spans)
     
     return {
         "ai_probability": round(ai_probability, 2),
@@ -221,9 +309,70 @@ def detect_ai_content(text: str) -> Dict[str, any]:
             "perplexity_score": round(perplexity_score, 2),
             "patterns_detected": patterns["pattern_count"],
             "uniformity_score": round(structure["uniformity_score"], 2),
-            "avg_sentence_length": round(structure["avg_length"], 2)
+            "avg_sentence_length": round(structure["avg_length"], 2),
+            "bits_per_char": round(bits_per_char, 3) if bits_per_char is not None else None
         },
         "message": message,
         "ai_indicators": patterns["patterns_found"],
-        "highlighted_text": highlighted_text
-    }
\ No newline at end of file
+        "highlighted_text": highlighted_text,
+        "highlight_spans": highlight_spans
+    }
+
+def ai_window_ranges(doc: TokenizedDocument, window_words: int = AI_WINDOW_WORDS) -> List[Tuple[int, int]]:
+    """
+    Token ranges of the detection windows
+    Paragraphs are packed together up to window_words; longer paragraphs are
+    cut into window_words pieces.
+    """
+    ranges: List[Tuple[int, int]] = []
+    window_start = None
+    for start, end in paragraph_spans(doc.text):
+        first, last = bisect_left(doc.starts, start), bisect_left(doc.starts, end)
+        if first == last:
+            continue
+        if window_start is not None and last - window_start > window_words:
+            ranges.append((window_start, first))
+            window_start = None
+        if window_start is None:
+            window_start = first
+        while last - window_start > window_words:
+            ranges.append((window_start, window_start + window_words))
+            window_start += window_words
+    if window_start is not None and window_start < len(doc):
+        ranges.append((window_start, len(doc)))
+    return ranges
+
+def iter_ai_windows(text: DocumentLike, window_words: int = AI_WINDOW_WORDS,
+                    deadline: Optional[Deadline] = None) -> Iterator[Dict[str, any]]:
+    """
+    Score each window of the text, yielding heatmap entries as they finish
+    The text is tokenized once; each window is a view over the shared tokens.
+    Stops early (after at least one window) once the deadline passes.
+    """
+    doc = tokenize(text)
+    for index, (first, last) in enumerate(ai_window_ranges(doc, window_words)):
+        if index and deadline is not None and deadline.expired():
+            deadline.mark_partial("ai")
+            break
+        result = detect_ai_content(doc.window(first, last))
+        start, end = doc.char_span(first, last)
+        yield {
+            "index": index,
+            "start": start,
+            "end": end,
+            "words": last - first,
+            "ai_probability": result["ai_probability"],
+            "confidence": result["confidence"],
+            "patterns_detected": result["analysis"]["patterns_detected"],
+        }
+
+def detect_ai_content_windows(text: DocumentLike, window_words: int = AI_WINDOW_WORDS,
+                              deadline: Optional[Deadline] = None) -> Dict[str, any]:
+    """
+    detect_ai_content() for the whole text plus a per-window heatmap under "windows"
+    The heatmap is cut short when the deadline passes.
+    """
+    doc = tokenize(text)
+    result = detect_ai_content(doc)
+    result["windows"] = list(iter_ai_windows(doc, window_words, deadline))
+    return result
@@ -0,0 +1,74 @@
+from typing import Dict, List, Tuple
+from app.utils.tokens import DocumentLike, Vocabulary, tokenize
+from app.utils.google_similarity import Span, merge_spans
+
+# Shortest run of identical words reported as a matched passage
+MIN_MATCH_WORDS = 5
+
+# Positions in text2 tried per anchor; bounds work on highly repetitive text
+MAX_ANCHOR_CANDIDATES = 8
+
+MAX_ALIGNED_PASSAGES = 500
+
+
+def find_aligned_passages(text1: DocumentLike, text2: DocumentLike,
+                          min_words: int = MIN_MATCH_WORDS) -> List[Dict]:
+    """
+    Maximal runs of identical words shared by two texts, with offsets in both
+    text2 is indexed by its min_words-grams. text1 is scanned left to right:
+    at each position the anchoring n-gram's occurrences in text2 are extended
+    forward as far as the words keep matching, the longest extension is
+    reported, and the scan resumes after it. Every text1 word is passed over
+    once and every extension step consumes a matched word, so the work is
+    linear in the text lengths (times the bounded candidate count).
+    """
+    vocab = Vocabulary()
+    doc1 = tokenize(text1, vocab)
+    doc2 = tokenize(text2, vocab)
+    ids1, ids2 = doc1.ids, doc2.ids
+    n1, n2 = len(ids1), len(ids2)
+    if n1 < min_words or n2 < min_words:
+        return []
+
+    anchors: Dict[Tuple[int, ...], List[int]] = {}
+    for j in range(n2 - min_words + 1):
+        positions = anchors.setdefault(tuple(ids2[j:j + min_words]), [])
+        if len(positions) < MAX_ANCHOR_CANDIDATES:
+            positions.append(j)
+
+    passages = []
+    i = 0
+    while i <= n1 - min_words and len(passages) < MAX_ALIGNED_PASSAGES:
+        candidates = anchors.get(tuple(ids1[i:i + min_words]))
+        if not candidates:
+            i += 1
+            continue
+
+        best_j, best_length = candidates[0], 0
+        for j in candidates:
+            length = min_words
+            while i + length < n1 and j + length < n2 and ids1[i + length] == ids2[j + length]:
+                length += 1
+            if length > best_length:
+                best_j, best_length = j, length
+
+        start1, end1 = doc1.char_span(i, i + best_length)
+        start2, end2 = doc2.char_span(best_j, best_j + best_length)
+        passages.append({
+            "text1_start": start1,
+            "text1_end": end1,
+            "text2_start": start2,
+            "text2_end": end2,
+            "words": best_length,
+            "text": doc1.text[start1:end1],
+        })
+        i += best_length
+
+    return passages
+
+
+def passage_spans(passages: List[Dict], kind: str = "pair-match") -> Tuple[List[Span], List[Span]]:
+    """Highlight spans of the aligned passages on each side"""
+    spans1 = merge_spans([(p["text1_start"], p["text1_end"], kind) for p in passages])
+    spans2 = merge_spans([(p["text2_start"], p["text2_end"], kind) for p in passages])
+    return spans1, spans2
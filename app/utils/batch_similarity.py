@@ -0,0 +1,119 @@
+import os
+from typing import Dict, List, Optional, Tuple
+from app.utils.google_similarity import calculate_text_similarity
+from app.utils.fingerprint import fingerprint_text, candidate_pairs
+from app.utils.process_pool import pool_map, pool_workers
+
+# Below this many candidate pairs the process pool costs more than it saves
+PARALLEL_MIN_PAIRS = int(os.getenv("BATCH_PARALLEL_MIN_PAIRS", "64"))
+
+
+def _score_text_pairs(texts, pairs: List[Tuple[int, int]]) -> List[Tuple[int, int, float]]:
+    """Exact calculate_text_similarity scores for a chunk of pairs (texts: list or {index: text})"""
+    return [(i, j, calculate_text_similarity(texts[i], texts[j])) for i, j in pairs]
+
+
+def _score_chunk(chunk: Tuple[Dict[int, str], List[Tuple[int, int]]]) -> List[Tuple[int, int, float]]:
+    texts, pairs = chunk
+    return _score_text_pairs(texts, pairs)
+
+
+def _chunk(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def score_candidate_pairs(texts: List[str], pairs: List[Tuple[int, int]]) -> Dict[Tuple[int, int], float]:
+    """Score candidate pairs exactly, across the shared process pool when it pays off"""
+    chunk_results = None
+    if len(pairs) >= PARALLEL_MIN_PAIRS and pool_workers() > 1:
+        # A few chunks per worker keeps the pool busy when pair costs vary; each
+        # carries only the texts its pairs use (pairs are sorted, so few per chunk)
+        chunk_size = max(1, len(pairs) // (pool_workers() * 4))
+        chunks = [
+            ({index: texts[index] for pair in chunk for index in pair}, chunk)
+            for chunk in _chunk(pairs, chunk_size)
+        ]
+        chunk_results = pool_map(_score_chunk, chunks)
+    if chunk_results is None:
+        chunk_results = [_score_text_pairs(texts, pairs)]
+
+    return {(i, j): score for chunk_scores in chunk_results for i, j, score in chunk_scores}
+
+
+def cluster_pairs(n: int, pairs: List[Tuple[int, int, float]], threshold: float) -> List[List[int]]:
+    """Group documents connected by pairs scoring at least threshold (union-find)"""
+    parent = list(range(n))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j, score in pairs:
+        if score >= threshold:
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_j] = root_i
+
+    groups: Dict[int, List[int]] = {}
+    for doc_id in range(n):
+        groups.setdefault(find(doc_id), []).append(doc_id)
+
+    clusters = [members for members in groups.values() if len(members) > 1]
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+def compute_similarity_matrix(texts: List[str], min_similarity: float = 50.0,
+                              top_k: int = 50, min_shared: int = 1,
+                              include_matrix: bool = False, cluster: bool = False,
+                              max_postings: int = 0) -> Dict:
+    """
+    Pairwise similarity for a batch of documents
+    Winnowed fingerprints select candidate pairs; only those are scored with
+    calculate_text_similarity. Pairs without shared fingerprints are treated
+    as unrelated and left unscored (None in the matrix). max_postings > 0
+    ignores fingerprints found in more documents than that (e.g. a shared
+    assignment prompt).
+    """
+    n = len(texts)
+    fingerprints = [fingerprint_text(text) for text in texts]
+    candidates = candidate_pairs(fingerprints, min_shared=min_shared, max_postings=max_postings)
+
+    scores = score_candidate_pairs(texts, sorted(candidates))
+    scored_pairs = [(i, j, score) for (i, j), score in scores.items()]
+    scored_pairs.sort(key=lambda pair: pair[2], reverse=True)
+
+    suspicious = [pair for pair in scored_pairs if pair[2] >= min_similarity]
+
+    result = {
+        "document_count": n,
+        "total_pairs": n * (n - 1) // 2,
+        "candidate_pairs": len(candidates),
+        "suspicious_pairs": [
+            {
+                "doc1": i,
+                "doc2": j,
+                "similarity_score": score,
+                "shared_fingerprints": candidates[(i, j)]
+            }
+            for i, j, score in suspicious[:top_k]
+        ],
+        "suspicious_count": len(suspicious),
+        "matrix": None,
+        "clusters": None
+    }
+
+    if include_matrix:
+        matrix: List[List[Optional[float]]] = [[None] * n for _ in range(n)]
+        for i in range(n):
+            matrix[i][i] = 100.0
+        for i, j, score in scored_pairs:
+            matrix[i][j] = matrix[j][i] = score
+        result["matrix"] = matrix
+
+    if cluster:
+        result["clusters"] = cluster_pairs(n, scored_pairs, min_similarity)
+
+    return result
@@ -0,0 +1,161 @@
+import os
+import re
+import time
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.utils.google_similarity import calculate_text_similarity, clean_text
+from app.utils.fingerprint import fingerprint_text
+from app.utils.deadline import Deadline
+
+# Combined length (characters) above which "auto" switches to chunked comparison
+CHUNKED_COMPARISON_CHARS = int(os.getenv("CHUNKED_COMPARISON_CHARS", "100000"))
+
+# Target size of a comparison window; paragraphs are packed up to this size
+CHUNK_WINDOW_CHARS = int(os.getenv("CHUNK_WINDOW_CHARS", "4000"))
+
+# Windows of the other document compared exactly per window
+MAX_CANDIDATE_WINDOWS = 3
+
+_PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+
+
+def paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of each paragraph, split on blank lines"""
+    start = 0
+    for m in _PARAGRAPH_BREAK_RE.finditer(text):
+        yield start, m.start()
+        start = m.end()
+    yield start, len(text)
+
+
+def iter_windows(text: str, window_chars: int = CHUNK_WINDOW_CHARS) -> Iterator[Tuple[int, int]]:
+    """
+    (start, end) character ranges of consecutive comparison windows
+    Whole paragraphs are packed until a window reaches window_chars; a single
+    paragraph longer than that is cut at the last whitespace before the limit.
+    """
+    window_start = window_end = None
+    for start, end in paragraph_spans(text):
+        if start == end:
+            continue
+        if window_start is not None and end - window_start > window_chars:
+            yield window_start, window_end
+            window_start = None
+        if window_start is None:
+            window_start = start
+        window_end = end
+
+        while window_end - window_start > window_chars:
+            cut = text.rfind(" ", window_start, window_start + window_chars)
+            if cut <= window_start:
+                cut = window_start + window_chars
+            yield window_start, cut
+            window_start = cut
+
+    if window_start is not None and window_end > window_start:
+        yield window_start, window_end
+
+
+def count_windows(text: str, window_chars: int = CHUNK_WINDOW_CHARS) -> int:
+    return sum(1 for _ in iter_windows(text, window_chars))
+
+
+class WindowIndex:
+    """
+    Windows of a document indexed by their winnowed fingerprints
+    matched_chars() diffs a cleaned piece of another text against only the
+    few windows sharing the most fingerprints with it.
+    """
+
+    def __init__(self, text: str, window_chars: int = CHUNK_WINDOW_CHARS):
+        self.text = text
+        self.windows: List[Tuple[int, int]] = list(iter_windows(text, window_chars))
+        self.clean_length = 0
+        self._postings: Dict[int, List[int]] = {}
+        for window_id, (start, end) in enumerate(self.windows):
+            window_text = text[start:end]
+            self.clean_length += len(clean_text(window_text))
+            for fingerprint in fingerprint_text(window_text):
+                self._postings.setdefault(fingerprint, []).append(window_id)
+
+    def matched_chars(self, piece_clean: str) -> int:
+        """Characters of the cleaned piece matched by its best window (SequenceMatcher blocks)"""
+        shared: Dict[int, int] = {}
+        for fingerprint in fingerprint_text(piece_clean):
+            for window_id in self._postings.get(fingerprint, ()):
+                shared[window_id] = shared.get(window_id, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:MAX_CANDIDATE_WINDOWS]
+        if not candidates and len(self.windows) <= MAX_CANDIDATE_WINDOWS:
+            # Short pieces may share no winnowed fingerprint; small documents are diffed whole
+            candidates = range(len(self.windows))
+
+        best = 0
+        for window_id in candidates:
+            start, end = self.windows[window_id]
+            blocks = SequenceMatcher(None, piece_clean, clean_text(self.text[start:end])).get_matching_blocks()
+            best = max(best, sum(block.size for block in blocks))
+        return best
+
+
+def matched_ratio(matched: float, length1: int, length2: int) -> float:
+    """SequenceMatcher-style 2M / (|a| + |b|) percentage from summed matches"""
+    # A window may be the best match of several pieces, so cap the total
+    matched = min(matched, length1, length2)
+    return round(2 * matched / (length1 + length2) * 100, 2) if length1 + length2 else 0.0
+
+
+def chunked_similarity(text1: str, text2: str, window_chars: int = CHUNK_WINDOW_CHARS,
+                       deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Approximate calculate_text_similarity for documents too large to diff whole
+    text2's windows are indexed by winnowed fingerprints; each text1 window is
+    diffed against the few text2 windows sharing the most fingerprints. The
+    matched characters are summed and turned into the same 2M / (|a| + |b|)
+    ratio SequenceMatcher reports, so peak memory depends on the window size
+    instead of the document size. When the deadline passes the remaining
+    text1 windows are skipped and the score covers the windows compared so
+    far; "chunks" and "total_chunks" say how far it got.
+    """
+    index = WindowIndex(text2, window_chars)
+
+    total = count_windows(text1, window_chars)
+    length1 = 0
+    matched = 0
+    done = 0
+    for start, end in iter_windows(text1, window_chars):
+        if done and deadline is not None and deadline.expired():
+            deadline.mark_partial("similarity")
+            break
+        done += 1
+        window1 = clean_text(text1[start:end])
+        length1 += len(window1)
+        matched += index.matched_chars(window1)
+
+    return {
+        "similarity": matched_ratio(matched, length1, index.clean_length),
+        "chunks": done,
+        "total_chunks": total,
+        "indexed_chunks": len(index.windows),
+    }
+
+
+def compare_texts(text1: str, text2: str, mode: str = "auto",
+                  deadline: Optional[Deadline] = None, label: str = "Text comparison") -> Dict:
+    """
+    Similarity of two texts using the full or chunked comparison
+    mode is "full", "chunked" or "auto" (chunked above CHUNKED_COMPARISON_CHARS).
+    Chunked results report the text1 windows compared ("chunks") out of
+    "total_chunks"; both are None for a full comparison.
+    """
+    if mode == "auto":
+        mode = "chunked" if len(text1) + len(text2) > CHUNKED_COMPARISON_CHARS else "full"
+
+    if mode == "chunked":
+        started = time.perf_counter()
+        result = chunked_similarity(text1, text2, deadline=deadline)
+        print(f"🧩 {label}: compared {result['chunks']}/{result['total_chunks']} chunks "
+              f"in {time.perf_counter() - started:.2f}s")
+        return {"similarity": result["similarity"], "mode": "chunked",
+                "chunks": result["chunks"], "total_chunks": result["total_chunks"]}
+
+    return {"similarity": calculate_text_similarity(text1, text2), "mode": "full", "chunks": None, "total_chunks": None}
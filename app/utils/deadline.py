@@ -0,0 +1,74 @@
+import os
+import time
+import math
+from typing import List, Optional
+
+# Time budget (seconds) of a check request when the client doesn't send one
+# (0: none, requests run to completion), and the most a client may ask for
+REQUEST_TIME_BUDGET = float(os.getenv("REQUEST_TIME_BUDGET", "0"))
+MAX_REQUEST_TIME_BUDGET = float(os.getenv("MAX_REQUEST_TIME_BUDGET", "120"))
+
+# Stages are not started with less than this left; they would only return empty
+MIN_STAGE_SECONDS = 0.05
+
+
+class Deadline:
+    """
+    Time budget of one request, passed down to every stage
+    Stages check remaining()/expired() between units of work (pages, chunks,
+    windows, lookups) and stop early instead of overrunning, recording
+    themselves with mark_partial() so the response can say what was cut.
+    A budget of None never expires.
+    """
+
+    def __init__(self, budget_seconds: Optional[float] = None):
+        self.budget = budget_seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget_seconds if budget_seconds is not None else math.inf
+        self.partial_stages: List[str] = []
+
+    @classmethod
+    def from_budget(cls, budget_seconds: Optional[float] = None) -> "Deadline":
+        """
+        Deadline for a client-supplied budget, defaulted and capped by configuration
+        Without either (the default), the request runs to completion.
+        """
+        budget = budget_seconds if budget_seconds and budget_seconds > 0 else REQUEST_TIME_BUDGET
+        if budget <= 0:
+            return cls(None)
+        return cls(min(budget, MAX_REQUEST_TIME_BUDGET))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def expired(self) -> bool:
+        return self.remaining() < MIN_STAGE_SECONDS
+
+    def timeout(self, cap: float) -> float:
+        """A stage's own timeout (e.g. an HTTP call) limited to what is left"""
+        return max(MIN_STAGE_SECONDS, min(cap, self.remaining()))
+
+    def mark_partial(self, stage: str, reason: str = "Time budget exhausted"):
+        if stage not in self.partial_stages:
+            budget = f"{self.budget:.1f}s" if self.budget is not None else "no budget"
+            print(f"⏱️ {reason} during {stage} ({self.elapsed():.2f}s of {budget})")
+            self.partial_stages.append(stage)
+
+    def start_stage(self, stage: str) -> bool:
+        """False (and the stage is marked partial) if there's no time left to start it"""
+        if self.expired():
+            self.mark_partial(stage)
+            return False
+        return True
+
+    def result_fields(self) -> dict:
+        """PlagiarismResult fields describing how the budget was used"""
+        return {
+            "partial": bool(self.partial_stages),
+            "partial_stages": list(self.partial_stages) or None,
+            "time_budget_seconds": self.budget,
+            "elapsed_seconds": round(self.elapsed(), 3),
+        }
@@ -0,0 +1,93 @@
+import hashlib
+from typing import Dict, Iterable, List, Set, Tuple
+from app.utils.google_similarity import clean_text
+
+# Word n-gram size used for shingling and window size used for winnowing
+SHINGLE_SIZE = 5
+WINNOW_WINDOW = 4
+
+
+def stable_hash(value: str) -> int:
+    """
+    64-bit hash that is stable across processes and restarts
+    (Python's built-in hash() is salted per process)
+    """
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_SIZE) -> List[int]:
+    """Hash every k-word shingle of the cleaned text, in order"""
+    words = clean_text(text).split()
+    if len(words) < k:
+        return [stable_hash(" ".join(words))] if words else []
+    return [stable_hash(" ".join(words[i:i + k])) for i in range(len(words) - k + 1)]
+
+
+def winnow(hashes: List[int], window: int = WINNOW_WINDOW) -> Set[int]:
+    """
+    Select document fingerprints by winnowing (Schleimer et al.)
+    Keeps the minimum hash of every window, which guarantees that any shared
+    run of window + k - 1 words produces at least one shared fingerprint.
+    """
+    if len(hashes) <= window:
+        return set(hashes)
+
+    fingerprints = set()
+    for i in range(len(hashes) - window + 1):
+        fingerprints.add(min(hashes[i:i + window]))
+    return fingerprints
+
+
+def winnow_positions(hashes: List[int], window: int = WINNOW_WINDOW) -> Dict[int, List[int]]:
+    """Winnowed fingerprints with the shingle positions they were selected at"""
+    if len(hashes) <= window:
+        selected = range(len(hashes))
+    else:
+        selected = set()
+        for i in range(len(hashes) - window + 1):
+            window_hashes = hashes[i:i + window]
+            selected.add(i + window_hashes.index(min(window_hashes)))
+
+    positions: Dict[int, List[int]] = {}
+    for position in sorted(selected):
+        positions.setdefault(hashes[position], []).append(position)
+    return positions
+
+
+def fingerprint_text(text: str, k: int = SHINGLE_SIZE, window: int = WINNOW_WINDOW) -> Set[int]:
+    """Winnowed fingerprint set of a text"""
+    return winnow(shingle_hashes(text, k), window)
+
+
+def candidate_pairs(fingerprints: List[Set[int]], min_shared: int = 1,
+                    max_postings: int = 0) -> Dict[Tuple[int, int], int]:
+    """
+    Find document pairs that share fingerprints via an inverted index
+    Returns {(i, j): shared_count} for i < j. Fingerprints that occur in more
+    than max_postings documents (boilerplate) are ignored when max_postings > 0.
+    """
+    postings: Dict[int, List[int]] = {}
+    for doc_id, doc_fingerprints in enumerate(fingerprints):
+        for fp in doc_fingerprints:
+            postings.setdefault(fp, []).append(doc_id)
+
+    shared: Dict[Tuple[int, int], int] = {}
+    for doc_ids in postings.values():
+        if len(doc_ids) < 2:
+            continue
+        if max_postings and len(doc_ids) > max_postings:
+            continue
+        for a in range(len(doc_ids)):
+            for b in range(a + 1, len(doc_ids)):
+                pair = (doc_ids[a], doc_ids[b])
+                shared[pair] = shared.get(pair, 0) + 1
+
+    return {pair: count for pair, count in shared.items() if count >= min_shared}
+
+
+def containment(a: Iterable[int], b: Iterable[int]) -> float:
+    """Fraction of the smaller fingerprint set contained in the other"""
+    a, b = set(a), set(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
@@ -0,0 +1,286 @@
+"""
+Memory-mapped on-disk fingerprint index of history texts
+
+Snapshot file layout (little-endian, version 1):
+
+    header   magic "PCFI", u16 version, u16 reserved,
+             u64 hash count, u64 posting count, u64 record count,
+             i64 built-at (unix ms), 12-byte high-water ObjectId, 4 pad bytes
+    hashes   u64[hash count]         sorted winnowed shingle hashes
+    offsets  u64[hash count + 1]     postings of hashes[i] are postings[offsets[i]:offsets[i+1]]
+    postings u32[posting count]      record ordinal << 1 | slot (0 = text1, 1 = text2)
+    records  12-byte ObjectId[record count]
+
+Workers mmap the snapshot read-only, so its pages are shared through the OS
+page cache instead of being rebuilt and held per process. Records inserted
+after the snapshot are read at startup (and before each lookup) from the
+history collection (on the primary) in _id order past the snapshot's
+high-water mark, less a short lookback window; that delta lives in a small
+per-process overlay until the next snapshot.
+
+Build a snapshot with:  python -m app.utils.fingerprint_store build
+"""
+import asyncio
+import mmap
+import os
+import struct
+import sys
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from app.database import catch_up_history, close_mongo_connection, connect_to_mongo, get_database
+from app.utils.fingerprint import fingerprint_text, shingle_hashes
+
+MAGIC = b"PCFI"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHQQQq12s4x")
+_SLOTS = ("text1", "text2")
+_GOOGLE_ONLY_PLACEHOLDER = "[Google Only Check]"
+
+FINGERPRINT_INDEX_PATH = os.getenv("FINGERPRINT_INDEX_PATH")
+
+
+class FingerprintSnapshot:
+    """Read-only view over a snapshot file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, n_hashes, n_postings, n_records, built_at, high_water = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a fingerprint index")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        view = memoryview(self._mmap)
+        offset = _HEADER.size
+        self.hashes = view[offset:offset + 8 * n_hashes].cast("Q")
+        offset += 8 * n_hashes
+        self.offsets = view[offset:offset + 8 * (n_hashes + 1)].cast("Q")
+        offset += 8 * (n_hashes + 1)
+        self.postings = view[offset:offset + 4 * n_postings].cast("I")
+        offset += 4 * n_postings
+        self._records = view[offset:offset + 12 * n_records]
+
+        self.record_count = n_records
+        self.built_at = built_at
+        self.high_water = ObjectId(bytes(high_water)) if n_records else None
+
+    def lookup(self, fingerprint: int) -> List[Tuple[ObjectId, str]]:
+        """(history_id, slot) pairs whose text contains the fingerprint"""
+        i = bisect_left(self.hashes, fingerprint)
+        if i == len(self.hashes) or self.hashes[i] != fingerprint:
+            return []
+        return [
+            (self.record_id(posting >> 1), _SLOTS[posting & 1])
+            for posting in self.postings[self.offsets[i]:self.offsets[i + 1]]
+        ]
+
+    def record_id(self, ordinal: int) -> ObjectId:
+        return ObjectId(bytes(self._records[12 * ordinal:12 * ordinal + 12]))
+
+    def size_bytes(self) -> int:
+        return len(self._mmap)
+
+    def close(self):
+        for view in (self.hashes, self.offsets, self.postings, self._records):
+            view.release()
+        self._mmap.close()
+
+
+def write_snapshot(path: str, texts: Iterable[Tuple[ObjectId, str, Set[int]]]) -> Dict:
+    """
+    Write a snapshot from (history_id, slot, fingerprints) triples
+    Written to a temporary file and renamed, so readers never see a partial file.
+    """
+    record_ordinals: Dict[ObjectId, int] = {}
+    postings_by_hash: Dict[int, List[int]] = {}
+
+    for history_id, slot, fingerprints in texts:
+        ordinal = record_ordinals.setdefault(history_id, len(record_ordinals))
+        posting = (ordinal << 1) | _SLOTS.index(slot)
+        for fingerprint in fingerprints:
+            postings_by_hash.setdefault(fingerprint, []).append(posting)
+
+    hashes = sorted(postings_by_hash)
+    records = sorted(record_ordinals, key=record_ordinals.get)
+    high_water = max(records).binary if records else bytes(12)
+    n_postings = sum(len(postings) for postings in postings_by_hash.values())
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(hashes), n_postings, len(records),
+                             int(time.time() * 1000), high_water))
+        f.write(struct.pack(f"<{len(hashes)}Q", *hashes))
+
+        offsets = [0]
+        for fingerprint in hashes:
+            offsets.append(offsets[-1] + len(postings_by_hash[fingerprint]))
+        f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+
+        for fingerprint in hashes:
+            postings = postings_by_hash[fingerprint]
+            f.write(struct.pack(f"<{len(postings)}I", *postings))
+
+        for history_id in records:
+            f.write(history_id.binary)
+
+    os.replace(tmp_path, path)
+    return {"hashes": len(hashes), "postings": n_postings, "records": len(records)}
+
+
+class FingerprintIndex:
+    """Snapshot plus an in-memory overlay of records inserted since it was built"""
+
+    def __init__(self, snapshot: Optional[FingerprintSnapshot] = None):
+        self.snapshot = snapshot
+        self.high_water: Optional[ObjectId] = snapshot.high_water if snapshot else None
+        self._overlay: Dict[int, List[Tuple[ObjectId, str]]] = {}
+        # Records already in the overlay: this worker's own inserts are added
+        # directly and must not be added again when catch_up reaches them
+        self._overlay_ids: Set[ObjectId] = set()
+        self._lock = asyncio.Lock()
+
+    def add(self, history_id: ObjectId, record: Dict):
+        """
+        Add a record's texts to the overlay (once per record)
+        Doesn't move the high-water mark: only catch_up does, so other workers'
+        records with smaller _ids than this worker's inserts aren't skipped.
+        """
+        if history_id in self._overlay_ids:
+            return
+        self._overlay_ids.add(history_id)
+        for slot in _SLOTS:
+            text = record.get(slot)
+            if not text or text == _GOOGLE_ONLY_PLACEHOLDER:
+                continue
+            for fingerprint in fingerprint_text(text):
+                self._overlay.setdefault(fingerprint, []).append((history_id, slot))
+
+    async def catch_up(self, db, batch_size: int = 500) -> int:
+        """
+        Apply history records inserted past the high-water mark
+        Pass the primary handle; records a little below the mark are re-checked
+        too (see catch_up_history), since other workers' inserts can land late.
+        """
+        async with self._lock:
+            applied = 0
+
+            async def apply(records: List[Dict]):
+                nonlocal applied
+                for record in records:
+                    if record["_id"] not in self._overlay_ids:
+                        self.add(record["_id"], record)
+                        applied += 1
+
+            self.high_water = await catch_up_history(
+                db, self.high_water, self._overlay_ids.__contains__, apply, {"text1": 1, "text2": 1}, batch_size
+            )
+            return applied
+
+    def candidates(self, text: str, min_shared: int = 1) -> Dict[Tuple[ObjectId, str], Dict]:
+        """
+        Stored texts sharing fingerprints with the text
+        Same shape as shingle_index.find_shingle_candidates (positions are not
+        kept on disk, so they are always empty). Deleted records may still be
+        listed until the next snapshot; callers re-read records from Mongo.
+        """
+        shared: Dict[Tuple[ObjectId, str], int] = {}
+        for fingerprint in set(shingle_hashes(text)):
+            hits = self.snapshot.lookup(fingerprint) if self.snapshot else []
+            for key in hits + self._overlay.get(fingerprint, []):
+                shared[key] = shared.get(key, 0) + 1
+        return {
+            key: {"shared": count, "positions": []}
+            for key, count in shared.items()
+            if count >= min_shared
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "snapshot_path": self.snapshot.path if self.snapshot else None,
+            "snapshot_records": self.snapshot.record_count if self.snapshot else 0,
+            "snapshot_bytes": self.snapshot.size_bytes() if self.snapshot else 0,
+            "overlay_records": len(self._overlay_ids),
+            "overlay_fingerprints": len(self._overlay),
+        }
+
+
+_index: Optional[FingerprintIndex] = None
+
+
+def get_fingerprint_index() -> Optional[FingerprintIndex]:
+    """The process-wide index, or None if FINGERPRINT_INDEX_PATH isn't configured"""
+    return _index
+
+
+async def load_fingerprint_index(db, path: Optional[str] = None) -> Optional[FingerprintIndex]:
+    """mmap the snapshot (if present) and catch up with newer history records"""
+    global _index
+    path = path or FINGERPRINT_INDEX_PATH
+    if not path:
+        return None
+
+    snapshot = None
+    if os.path.exists(path):
+        try:
+            snapshot = FingerprintSnapshot(path)
+        except ValueError as e:
+            print(f"⚠️ Ignoring fingerprint index snapshot: {e}")
+
+    _index = FingerprintIndex(snapshot)
+    applied = await _index.catch_up(db)
+    print(f"✅ Fingerprint index loaded ({_index.stats()['snapshot_records']} snapshot records, {applied} delta records)")
+    return _index
+
+
+def note_history_insert(history_id: ObjectId, record: Dict):
+    """Keep this worker's overlay current with its own inserts"""
+    if _index is not None:
+        _index.add(history_id, record)
+
+
+async def build_snapshot_from_db(db, path: str) -> Dict:
+    """Fingerprint every history text and write a fresh snapshot"""
+    texts = []
+    cursor = db.history.find({}, {"text1": 1, "text2": 1}).batch_size(500)
+    async for record in cursor:
+        for slot in _SLOTS:
+            text = record.get(slot)
+            if text and text != _GOOGLE_ONLY_PLACEHOLDER:
+                texts.append((record["_id"], slot, fingerprint_text(text)))
+    return write_snapshot(path, texts)
+
+
+async def _main(argv: List[str]):
+    command = argv[1] if len(argv) > 1 else "info"
+    path = argv[2] if len(argv) > 2 else FINGERPRINT_INDEX_PATH
+    if not path:
+        print("Usage: python -m app.utils.fingerprint_store build|info [PATH] (or set FINGERPRINT_INDEX_PATH)")
+        return
+
+    if command == "build":
+        await connect_to_mongo()
+        try:
+            started = time.perf_counter()
+            result = await build_snapshot_from_db(get_database(), path)
+            print(f"✅ Wrote {path}: {result} in {time.perf_counter() - started:.2f}s")
+        finally:
+            await close_mongo_connection()
+    elif command == "info":
+        snapshot = FingerprintSnapshot(path)
+        print(f"{path}: {len(snapshot.hashes)} hashes, {len(snapshot.postings)} postings, "
+              f"{snapshot.record_count} records, {snapshot.size_bytes()} bytes, "
+              f"high-water {snapshot.high_water}")
+        snapshot.close()
+    else:
+        print(f"Unknown command: {command}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
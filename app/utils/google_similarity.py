@@ -1,104 +1,171 @@
-import requests
 from typing import Optional, List, Dict, Tuple
 import re
 from difflib import SequenceMatcher
+from bisect import bisect_left
+from app.utils.tokens import DocumentLike, Vocabulary, tokenize
+from app.utils.lazy_imports import lazy_import
+
+# Only Google lookups need it
+requests = lazy_import("requests")
 
 def clean_text(text: str) -> str:
     """Remove extra whitespace and normalize text"""
     text = re.sub(r'\s+', ' ', text)
     return text.strip().lower()
 
-def calculate_text_similarity(text1: str, text2: str) -> float:
-    """Calculate similarity between two texts using SequenceMatcher"""
-    text1_clean = clean_text(text1)
-    text2_clean = clean_text(text2)
-    
+def calculate_clean_similarity(text1_clean: str, text2_clean: str) -> float:
+    """Similarity of two texts that have already been through clean_text()"""
     similarity = SequenceMatcher(None, text1_clean, text2_clean).ratio()
     return round(similarity * 100, 2)
 
-def find_matching_segments(original_text: str, source_text: str, min_words: int = 3) -> List[str]:
+def calculate_text_similarity(text1: str, text2: str) -> float:
+    """Calculate similarity between two texts using SequenceMatcher"""
+    return calculate_clean_similarity(clean_text(text1), clean_text(text2))
+
+def find_matching_segments(original_text: DocumentLike, source_text: DocumentLike,
+                           min_words: int = 3, vocab: Optional[Vocabulary] = None) -> List[str]:
     """
     Find matching text segments between original and source
     Returns list of matching phrases
+
+    Both texts are compared as interned token-id arrays. Run lengths are
+    computed right-to-left along each diagonal (run[i][j] = run[i+1][j+1] + 1),
+    so the work is proportional to the number of equal token pairs rather
+    than re-extending every (i, j) start.
     """
-    # Split into words
-    original_words = original_text.lower().split()
-    source_words = source_text.lower().split()
-    
+    vocab = vocab if vocab is not None else Vocabulary()
+    original = tokenize(original_text, vocab)
+    source = tokenize(source_text, vocab)
+
+    original_ids = original.ids
+    source_positions = source.positions()
+
+    # lengths[i] = match lengths (>= min_words) starting at original token i,
+    # in ascending order of source position
+    lengths: Dict[int, List[int]] = {}
+    next_runs: Dict[int, int] = {}
+    for i in range(len(original_ids) - 1, -1, -1):
+        runs = {}
+        found = []
+        for j in source_positions.get(original_ids[i], ()):
+            run = next_runs.get(j + 1, 0) + 1
+            runs[j] = run
+            if run >= min_words:
+                found.append(run)
+        if found:
+            lengths[i] = found
+        next_runs = runs
+
     matches = []
-    
-    # Find consecutive matching word sequences
-    for i in range(len(original_words)):
-        for j in range(len(source_words)):
-            match_length = 0
+    seen = set()
+    for i in sorted(lengths):
+        for match_length in lengths[i]:
+            # Extract the matching phrase from original text (preserve case)
+            matched_phrase = original.slice_text(i, i + match_length)
             
-            # Count consecutive matches
-            while (i + match_length < len(original_words) and 
-                   j + match_length < len(source_words) and
-                   original_words[i + match_length] == source_words[j + match_length]):
-                match_length += 1
-            
-            # If we found a match of minimum length
-            if match_length >= min_words:
-                # Extract the matching phrase from original text (preserve case)
-                start_pos = sum(len(w) + 1 for w in original_words[:i])
-                end_pos = sum(len(w) + 1 for w in original_words[:i + match_length])
-                matched_phrase = original_text[start_pos:end_pos].strip()
-                
-                # Avoid duplicates
-                if matched_phrase.lower() not in [m.lower() for m in matches]:
-                    matches.append(matched_phrase)
+            # Avoid duplicates
+            key = matched_phrase.lower()
+            if key not in seen:
+                seen.add(key)
+                matches.append(matched_phrase)
     
     return matches
 
-def highlight_matching_text(text: str, matches: List[str]) -> str:
+Span = Tuple[int, int, str]
+
+
+def _find_occurrences(text: str, text_lower: str, needle: str):
+    """Yield (start, end) of case-insensitive occurrences of needle in text"""
+    needle_lower = needle.lower()
+    if len(text_lower) == len(text) and len(needle_lower) == len(needle):
+        # Lowercasing kept offsets aligned, so a plain find is safe
+        pos = text_lower.find(needle_lower)
+        while pos != -1:
+            yield pos, pos + len(needle)
+            pos = text_lower.find(needle_lower, pos + 1)
+    else:
+        pattern = re.compile(re.escape(needle), re.IGNORECASE)
+        for m in pattern.finditer(text):
+            yield m.span()
+
+
+def find_match_spans(text: str, matches: List[str], kind: str = "google-match") -> List[Span]:
     """
-    Highlight matching segments in the text
-    Returns HTML with highlighted portions
+    Locate matching segments in the text as (start, end, kind) spans
+    Each match claims its first occurrence that doesn't overlap an earlier
+    (longer) match. Returned spans are sorted and non-overlapping.
     """
     if not matches:
-        return text
-    
-    highlighted = text
-    
-    # Sort matches by length (longest first) to avoid partial replacements
+        return []
+
+    text_lower = text.lower()
+
+    # Sort matches by length (longest first) to avoid partial highlights
     sorted_matches = sorted(set(matches), key=len, reverse=True)
-    
-    # Track replaced positions to avoid double-highlighting
-    replaced_positions = []
-    
+
+    # Claimed intervals kept sorted by start for O(log n) overlap checks
+    starts: List[int] = []
+    ends: List[int] = []
+
     for match in sorted_matches:
         if not match or len(match.strip()) < 3:
             continue
-            
-        # Find all occurrences of this match (case-insensitive)
-        pattern = re.compile(re.escape(match), re.IGNORECASE)
-        
-        # Find first occurrence that hasn't been replaced
-        for m in pattern.finditer(text):
-            start, end = m.span()
-            
-            # Check if this position overlaps with already replaced text
-            overlap = any(start < r_end and end > r_start for r_start, r_end in replaced_positions)
-            
-            if not overlap:
-                # Get the actual text (preserving case)
-                actual_text = text[start:end]
-                
-                # Replace in highlighted version
-                highlighted = highlighted.replace(
-                    actual_text,
-                    f'<mark class="google-match">{actual_text}</mark>',
-                    1  # Only replace first occurrence
-                )
-                
-                replaced_positions.append((start, end))
-                break  # Only highlight first occurrence of each match
-    
-    return highlighted
+
+        for start, end in _find_occurrences(text, text_lower, match):
+            i = bisect_left(starts, start)
+            if i > 0 and ends[i - 1] > start:
+                continue
+            if i < len(starts) and starts[i] < end:
+                continue
+
+            starts.insert(i, start)
+            ends.insert(i, end)
+            break  # Only highlight first occurrence of each match
+
+    return [(start, end, kind) for start, end in zip(starts, ends)]
+
+
+def merge_spans(spans: List[Span]) -> List[Span]:
+    """
+    Sort spans and merge them into a non-overlapping list
+    Overlapping or touching spans of the same kind are joined; where kinds
+    differ, the span that starts first wins and the later one is clipped.
+    """
+    merged: List[Span] = []
+    for start, end, kind in sorted(spans):
+        if merged:
+            prev_start, prev_end, prev_kind = merged[-1]
+            if start <= prev_end and kind == prev_kind:
+                merged[-1] = (prev_start, max(prev_end, end), kind)
+                continue
+            if start < prev_end:
+                start = prev_end
+        if start < end:
+            merged.append((start, end, kind))
+    return merged
+
+
+def render_highlighted_html(text: str, spans: List[Span]) -> str:
+    """Render sorted, non-overlapping spans as <mark> tags in a single pass"""
+    if not spans:
+        return text
+
+    parts = []
+    cursor = 0
+    for start, end, kind in spans:
+        parts.append(text[cursor:start])
+        parts.append(f'<mark class="{kind}">{text[start:end]}</mark>')
+        cursor = end
+    parts.append(text[cursor:])
+    return "".join(parts)
+
+
+# Seconds to wait for the Custom Search API (callers with a deadline pass less)
+GOOGLE_REQUEST_TIMEOUT = 10
 
 def check_google_similarity(text: str, api_key: Optional[str] = None, 
-                           search_engine_id: Optional[str] = None) -> Optional[Dict]:
+                           search_engine_id: Optional[str] = None,
+                           timeout: float = GOOGLE_REQUEST_TIMEOUT) -> Optional[Dict]:
     """
     Check if text appears on Google search results
     Returns dictionary with similarity data, sources, and matching segments
@@ -121,7 +188,7 @@ def check_google_similarity(text: str, api_key: Optional[str] = None,
         
         print(f"Searching Google with query: {query[:50]}...")
         
-        response = requests.get(url, params=params, timeout=10)
+        response = requests.get(url, params=params, timeout=timeout)
         
         if response.status_code != 200:
             print(f"Google API error: {response.status_code}")
@@ -138,24 +205,32 @@ def check_google_similarity(text: str, api_key: Optional[str] = None,
                 "sources": [],
                 "total_sources": 0,
                 "all_matches": [],
-                "highlighted_text": text
+                "highlighted_text": text,
+                "highlight_spans": []
             }
         
         # Calculate similarity with search result snippets and collect sources
         sources = []
         all_matching_segments = []
+        seen_segments = set()
         max_similarity = 0.0
         
+        # Tokenize the query text once; snippets share its vocabulary
+        vocab = Vocabulary()
+        text_doc = tokenize(text, vocab)
+        text_clean = text_doc.clean_text()
+        
         for item in items:
             snippet = item.get("snippet", "")
             title = item.get("title", "Unknown")
             link = item.get("link", "")
             
             # Calculate similarity
-            similarity = calculate_text_similarity(text, snippet)
+            snippet_doc = tokenize(snippet, vocab)
+            similarity = calculate_clean_similarity(text_clean, snippet_doc.clean_text())
             
             # Find matching text segments
-            matching_segments = find_matching_segments(text, snippet, min_words=3)
+            matching_segments = find_matching_segments(text_doc, snippet_doc, min_words=3, vocab=vocab)
             
             print(f"Source: {title[:50]}... - Similarity: {similarity}%, Matches: {len(matching_segments)}")
             
@@ -170,7 +245,8 @@ def check_google_similarity(text: str, api_key: Optional[str] = None,
                 
                 # Collect all unique matching segments
                 for segment in matching_segments:
-                    if segment.lower() not in [m.lower() for m in all_matching_segments]:
+                    if segment.lower() not in seen_segments:
+                        seen_segments.add(segment.lower())
                         all_matching_segments.append(segment)
                 
                 max_similarity = max(max_similarity, similarity)
@@ -183,14 +259,16 @@ def check_google_similarity(text: str, api_key: Optional[str] = None,
         
         # Create highlighted version of original text
         print(f"Highlighting {len(all_matching_segments)} matching segments in text")
-        highlighted_text = highlight_matching_text(text, all_matching_segments)
+        highlight_spans = find_match_spans(text, all_matching_segments)
+        highlighted_text = render_highlighted_html(text, highlight_spans)
         
         return {
             "similarity_percentage": round(max_similarity, 2),
             "sources": top_sources,
             "total_sources": len(sources),
             "all_matches": all_matching_segments,
-            "highlighted_text": highlighted_text
+            "highlighted_text": highlighted_text,
+            "highlight_spans": highlight_spans
         }
     
     except Exception as e:
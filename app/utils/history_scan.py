@@ -0,0 +1,100 @@
+import asyncio
+import heapq
+import os
+from itertools import count
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pymongo.errors import PyMongoError
+from app.config import get_mongo_settings
+from app.database import get_database, is_transient_error, retry_delay
+from app.utils.shingle_index import find_shingle_candidates
+from app.utils.fingerprint_store import get_fingerprint_index
+
+# Records fetched per round trip while streaming history searches
+HISTORY_SCAN_BATCH_SIZE = int(os.getenv("HISTORY_SCAN_BATCH_SIZE", "200"))
+
+# Upper bound on offset + limit, i.e. on how many matches one search keeps in memory
+MAX_HISTORY_MATCHES = int(os.getenv("MAX_HISTORY_MATCHES", "1000"))
+
+
+async def iter_history(db, query_filter: Dict, projection: Dict,
+                       batch_size: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    Stream history records with only the projected fields
+    The cursor fetches batch_size records per round trip, so memory is bounded
+    by one batch rather than the size of the matched history.
+    A transient error (e.g. a failover) before the first record restarts the
+    scan with backoff; later ones are raised, since records were already used.
+    """
+    for attempt in count():
+        started = False
+        try:
+            cursor = db.history.find(query_filter, projection).batch_size(batch_size or HISTORY_SCAN_BATCH_SIZE)
+            async for record in cursor:
+                started = True
+                yield record
+            return
+        except PyMongoError as e:
+            if started or attempt + 1 >= get_mongo_settings().retry_attempts or not is_transient_error(e):
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+
+
+class TopK:
+    """
+    Keeps the k highest-scoring items seen so far in a min-heap
+    Ties keep insertion order, matching a stable sort by score descending.
+    """
+
+    def __init__(self, k: int):
+        self.k = max(0, k)
+        self.total = 0
+        self._heap: List = []
+        self._sequence = count()
+
+    def would_keep(self, score: float) -> bool:
+        """True if an item with this score would enter the heap"""
+        return len(self._heap) < self.k or (self.k > 0 and score > self._heap[0][0])
+
+    def push(self, score: float, item: Any):
+        """Count a match and keep it if it ranks in the top k"""
+        self.total += 1
+        if not self.would_keep(score):
+            return
+        entry = (score, -next(self._sequence), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self) -> List[Any]:
+        """Kept items, highest score first"""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+    def page(self, offset: int, limit: int) -> List[Any]:
+        return self.items()[offset:offset + limit]
+
+
+def page_capacity(offset: int, limit: int) -> int:
+    """How many matches a search has to keep to serve the requested page"""
+    return min(max(0, offset) + max(0, limit), MAX_HISTORY_MATCHES)
+
+
+async def find_candidates(db, source: str, text: str,
+                          user_id: Optional[str] = None) -> Optional[Dict[Tuple[Any, str], Dict]]:
+    """
+    Texts worth scoring for the given candidate source, or None to scan everything
+    Raises ValueError if the source isn't available in this process.
+    """
+    if source == "shingle_index":
+        return await find_shingle_candidates(db, text, user_id)
+
+    if source == "fingerprint_index":
+        index = get_fingerprint_index()
+        if index is None:
+            raise ValueError("Fingerprint index is not configured (set FINGERPRINT_INDEX_PATH)")
+        # Pick up records other workers inserted since the last lookup; this
+        # reads the primary even when the search itself runs on a secondary
+        await index.catch_up(get_database())
+        return index.candidates(text)
+
+    return None
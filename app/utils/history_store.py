@@ -0,0 +1,176 @@
+from typing import Dict, List, Optional
+from bson import ObjectId
+from app.utils.google_similarity import clean_text
+from app.utils.simhash import (
+    simhash,
+    simhash_bands,
+    simhash_fields,
+    from_signed64,
+    hamming_distance,
+    estimate_similarity,
+    MAX_NEAR_DUPLICATE_DISTANCE,
+)
+from app.utils.fingerprint_store import note_history_insert
+from app.utils import tfidf_engine
+from app.utils import stats
+from app.utils.shingle_index import (
+    ensure_shingle_indexes,
+    index_history_record,
+    remove_history_postings,
+)
+
+# Placeholder stored as text2 for Google-only checks; never compared against
+GOOGLE_ONLY_PLACEHOLDER = "[Google Only Check]"
+
+TEXT_SLOTS = ("text1", "text2")
+
+# What the statistics counters need to know about a deleted record
+STATS_PROJECTION = {"check_type": 1, "timestamp": 1}
+
+# Bump when add_derived_fields() changes so older records get backfilled
+DERIVED_FIELDS_VERSION = 3
+
+
+def add_derived_fields(entry: dict) -> dict:
+    """
+    Add fields derived from the texts that history searches use to skip work:
+    the cleaned length of each text (length-bound pruning) and its SimHash
+    with band keys (near-duplicate lookups)
+    """
+    for slot in TEXT_SLOTS:
+        text = entry.get(slot)
+        if text and text != GOOGLE_ONLY_PLACEHOLDER:
+            entry[f"{slot}_clean_length"] = len(clean_text(text))
+            entry.update(simhash_fields(slot, text))
+    entry["derived_version"] = DERIVED_FIELDS_VERSION
+    return entry
+
+
+async def insert_history_record(db, entry: dict):
+    """Insert a history record along with its derived search fields and postings"""
+    result = await db.history.insert_one(add_derived_fields(entry))
+    await index_history_record(db, result.inserted_id, entry, TEXT_SLOTS, skip_text=GOOGLE_ONLY_PLACEHOLDER)
+    note_history_insert(result.inserted_id, entry)
+    tfidf_engine.note_history_insert(result.inserted_id, entry)
+    await stats.note_history_insert(db, entry)
+    return result
+
+
+async def delete_history_record(db, history_id: ObjectId):
+    """Delete one history record and everything derived from it"""
+    record = await db.history.find_one({"_id": history_id}, STATS_PROJECTION)
+    await remove_history_postings(db, [history_id])
+    tfidf_engine.note_history_delete([history_id])
+    # Records claimed by a purge job are left to it (see delete_history_batch)
+    result = await db.history.delete_one({"_id": history_id, "purge_owner": None})
+    if result.deleted_count and record:
+        await stats.note_history_delete(db, [record])
+    return result
+
+
+async def delete_history_batch(db, history_ids: List[ObjectId], owner: ObjectId) -> int:
+    """
+    Delete a batch of history records and everything derived from them
+    The records are first claimed for owner (a purge job): when two jobs reach
+    the same records, each record is deleted, and taken off the statistics,
+    by exactly one of them.
+    """
+    await db.history.update_many(
+        {"_id": {"$in": history_ids}, "purge_owner": {"$in": [None, owner]}},
+        {"$set": {"purge_owner": owner}}
+    )
+    claimed = await db.history.find({"_id": {"$in": history_ids}, "purge_owner": owner}, STATS_PROJECTION).to_list(None)
+    if not claimed:
+        return 0
+    claimed_ids = [record["_id"] for record in claimed]
+    await remove_history_postings(db, claimed_ids)
+    tfidf_engine.note_history_delete(claimed_ids)
+    result = await db.history.delete_many({"_id": {"$in": claimed_ids}, "purge_owner": owner})
+    await stats.note_history_delete(db, claimed)
+    return result.deleted_count
+
+
+async def ensure_history_indexes(db):
+    """Create the indexes history searches rely on"""
+    await db.history.create_index([("user_id", 1), ("timestamp", -1)])
+    await db.history.create_index([("user_id", 1), ("text1_clean_length", 1)])
+    await db.history.create_index([("user_id", 1), ("text2_clean_length", 1)])
+    # Multikey indexes over the SimHash band keys act as the band lookup tables
+    await db.history.create_index([("user_id", 1), ("text1_simhash_bands", 1)])
+    await db.history.create_index([("user_id", 1), ("text2_simhash_bands", 1)])
+    await ensure_shingle_indexes(db)
+
+
+async def backfill_derived_fields(db, batch_size: int = 500):
+    """Compute derived fields for records stored before they existed"""
+    updated = 0
+    cursor = db.history.find(
+        {"$or": [
+            {"derived_version": {"$exists": False}},
+            {"derived_version": {"$lt": DERIVED_FIELDS_VERSION}},
+        ]},
+        {"user_id": 1, "text1": 1, "text2": 1}
+    ).batch_size(batch_size)
+
+    async for record in cursor:
+        fields = add_derived_fields({slot: record.get(slot) for slot in TEXT_SLOTS})
+        fields = {key: value for key, value in fields.items() if key not in TEXT_SLOTS}
+
+        # Rebuild postings from scratch so reruns stay idempotent
+        await remove_history_postings(db, [record["_id"]])
+        await index_history_record(db, record["_id"], record, TEXT_SLOTS, skip_text=GOOGLE_ONLY_PLACEHOLDER)
+
+        await db.history.update_one({"_id": record["_id"]}, {"$set": fields})
+        updated += 1
+
+    if updated:
+        print(f"✅ Backfilled search fields for {updated} history records")
+    return updated
+
+
+async def find_near_duplicates(db, text: str, base_filter: Optional[Dict] = None,
+                               max_distance: int = MAX_NEAR_DUPLICATE_DISTANCE) -> List[Dict]:
+    """
+    Find stored texts whose SimHash is within max_distance bits of the text's
+    Uses the band indexes, so the cost depends on the number of band
+    collisions rather than the size of the history. Returns dicts with
+    record, slot, distance and estimated similarity, closest first.
+    """
+    fingerprint = simhash(text)
+    bands = simhash_bands(fingerprint)
+
+    query_filter = {"$or": [{f"{slot}_simhash_bands": {"$in": bands}} for slot in TEXT_SLOTS]}
+    if base_filter:
+        query_filter = {"$and": [base_filter, query_filter]}
+
+    projection = {
+        "text1_simhash_bands": 0,
+        "text2_simhash_bands": 0,
+        "google_sources": 0,
+        "google_sources_text1": 0,
+        "google_sources_text2": 0,
+        "google_highlighted_text": 0,
+        "google_highlighted_text1": 0,
+        "google_highlighted_text2": 0,
+        "ai_detection": 0,
+        "ai_detection_text2": 0,
+        "paragraph_results": 0,
+    }
+
+    near_duplicates = []
+    async for record in db.history.find(query_filter, projection):
+        for slot in TEXT_SLOTS:
+            stored = record.get(f"{slot}_simhash")
+            if stored is None:
+                continue
+            distance = hamming_distance(fingerprint, from_signed64(stored))
+            if distance <= max_distance:
+                near_duplicates.append({
+                    "record": record,
+                    "slot": slot,
+                    "distance": distance,
+                    "similarity": estimate_similarity(distance),
+                })
+
+    near_duplicates.sort(key=lambda match: match["distance"])
+    return near_duplicates
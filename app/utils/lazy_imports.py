@@ -0,0 +1,79 @@
+import importlib
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Dict, List, Optional
+
+# Heavy dependencies only some endpoints need; "background" imports them in a
+# thread once the app has started, "blocking" before it accepts requests,
+# "off" leaves each to its first use
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+# Seconds each lazy module took to import, for the startup profile and /admin
+import_times: Dict[str, float] = {}
+
+_registry: Dict[str, "LazyModule"] = {}
+_lock = threading.Lock()
+
+
+class LazyModule(ModuleType):
+    """
+    Stand-in for a module that is imported on first attribute access
+    Modules write `PyPDF2 = lazy_import("PyPDF2")` instead of `import PyPDF2`
+    and use it unchanged; the import cost moves from process start to the
+    first request that needs it (or to warmup()).
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module: Optional[ModuleType] = None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self.__name__)
+                    import_times[self.__name__] = time.perf_counter() - started
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name__!r} ({'loaded' if self.loaded else 'not loaded'})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Shared LazyModule for name (the same object for every importer)"""
+    with _lock:
+        if name not in _registry:
+            _registry[name] = LazyModule(name)
+        return _registry[name]
+
+
+def warmup(names: Optional[List[str]] = None) -> Dict[str, float]:
+    """Import every registered lazy module (or the given ones) now; returns seconds per module"""
+    started = time.perf_counter()
+    timings = {}
+    for name in names or list(_registry):
+        try:
+            lazy_import(name).load()
+            timings[name] = round(import_times.get(name, 0.0), 4)
+        except ImportError as e:
+            print(f"⚠️ Warmup could not import {name}: {e}")
+    print(f"🔥 Warmed up {len(timings)} lazy modules in {time.perf_counter() - started:.2f}s")
+    return timings
+
+
+def lazy_import_status() -> List[Dict]:
+    return [
+        {"module": name, "loaded": module.loaded, "import_seconds": round(import_times[name], 4) if name in import_times else None}
+        for name, module in sorted(_registry.items())
+    ]
@@ -0,0 +1,234 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.history_store import delete_history_batch
+
+# History records deleted per batch; small batches keep each write short
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+
+# Seconds between checks for queued jobs and retention runs
+MAINTENANCE_POLL_INTERVAL = int(os.getenv("MAINTENANCE_POLL_INTERVAL", "30"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+
+# History older than this many days is purged (0 keeps history forever)
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "0"))
+
+# Finished job documents are removed by a TTL index after this many seconds
+MAINTENANCE_JOB_TTL = int(os.getenv("MAINTENANCE_JOB_TTL", str(7 * 24 * 3600)))
+
+# A running job whose heartbeat is older than this (seconds) belongs to a
+# stopped process and is queued again; heartbeats are written every batch
+MAINTENANCE_JOB_LEASE = int(os.getenv("MAINTENANCE_JOB_LEASE", "300"))
+
+JOBS_COLLECTION = "maintenance_jobs"
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _get_wakeup() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+async def ensure_maintenance_indexes(db):
+    """
+    History itself can't use a TTL index: its shingle postings, TF-IDF rows
+    and statistics must be removed with it, so retention runs through the
+    worker. The timestamp index keeps those range scans cheap.
+    """
+    await db.history.create_index([("timestamp", 1)])
+    await db[JOBS_COLLECTION].create_index([("status", 1), ("created_at", 1)])
+    await db[JOBS_COLLECTION].create_index([("finished_at", 1)], expireAfterSeconds=MAINTENANCE_JOB_TTL)
+    # At most one unfinished job per singleton key (e.g. retention), whichever worker queues it
+    await db[JOBS_COLLECTION].create_index(
+        [("singleton", 1)], unique=True, partialFilterExpression={"singleton": {"$exists": True}}
+    )
+
+
+def purge_filter(job: Dict) -> Dict:
+    """History filter of a purge job: a user's records and/or records older than a cutoff"""
+    history_filter = {}
+    if job.get("user_id"):
+        history_filter["user_id"] = job["user_id"]
+    if job.get("before"):
+        history_filter["timestamp"] = {"$lt": job["before"]}
+    return history_filter
+
+
+async def enqueue_history_purge(db, kind: str, user_id: Optional[str] = None,
+                                before: Optional[datetime] = None,
+                                singleton: Optional[str] = None) -> Optional[Dict]:
+    """
+    Queue deletion of a user's history records and/or those older than before
+    Returns the job document; the worker deletes in batches and records
+    its progress there. With a singleton key, nothing is queued (None is
+    returned) while another unfinished job holds the same key.
+    """
+    job = {
+        "kind": kind,
+        "user_id": user_id,
+        "before": before,
+        "status": "queued",
+        "deleted": 0,
+        "created_at": datetime.utcnow(),
+        "started_at": None,
+        "heartbeat_at": None,
+        "finished_at": None,
+        "error": None,
+    }
+    if not purge_filter(job):
+        raise ValueError("A purge job needs a user_id or a cutoff")
+    job["total"] = await db.history.count_documents(purge_filter(job))
+    if singleton:
+        job["singleton"] = singleton
+        try:
+            result = await db[JOBS_COLLECTION].update_one(
+                {"singleton": singleton},
+                {"$setOnInsert": {key: value for key, value in job.items() if key != "singleton"}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return None  # Another worker queued it at the same moment
+        if result.upserted_id is None:
+            return None
+        job["_id"] = result.upserted_id
+    else:
+        result = await db[JOBS_COLLECTION].insert_one(job)
+        job["_id"] = result.inserted_id
+    _get_wakeup().set()
+    return job
+
+
+async def get_job(db, job_id: ObjectId) -> Optional[Dict]:
+    return await db[JOBS_COLLECTION].find_one({"_id": job_id})
+
+
+async def list_jobs(db, limit: int = 50) -> List[Dict]:
+    return await db[JOBS_COLLECTION].find().sort("created_at", -1).limit(limit).to_list(None)
+
+
+def job_progress(job: Dict) -> Dict:
+    """Response view of a job document"""
+    total = job.get("total") or 0
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "user_id": job.get("user_id"),
+        "status": job["status"],
+        "total": total,
+        "deleted": job.get("deleted", 0),
+        "progress": round(100 * min(job.get("deleted", 0), total) / total, 1) if total else 100.0,
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+    }
+
+
+async def run_purge_job(db, job: Dict) -> int:
+    """Delete the job's records batch by batch, cascading to everything derived from them"""
+    deleted = 0
+    # Records claimed by another job (an overlapping purge) are left to it
+    query = dict(purge_filter(job), purge_owner={"$in": [None, job["_id"]]})
+    while True:
+        records = await db.history.find(query, {"_id": 1}).limit(MAINTENANCE_BATCH_SIZE).to_list(None)
+        if not records:
+            return deleted
+        batch_deleted = await delete_history_batch(db, [record["_id"] for record in records], job["_id"])
+        deleted += batch_deleted
+        await db[JOBS_COLLECTION].update_one(
+            {"_id": job["_id"]},
+            {"$inc": {"deleted": batch_deleted}, "$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+        # Let request handlers run between batches
+        await asyncio.sleep(0)
+
+
+async def _claim_next_job(db) -> Optional[Dict]:
+    now = datetime.utcnow()
+    return await db[JOBS_COLLECTION].find_one_and_update(
+        {"status": "queued"},
+        {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def requeue_stale_jobs(db) -> int:
+    """
+    Queue again running jobs whose heartbeat lapsed (their process stopped)
+    Jobs other live workers are running keep heartbeating and are left alone;
+    purges are idempotent, so a requeued job just carries on.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=MAINTENANCE_JOB_LEASE)
+    result = await db[JOBS_COLLECTION].update_many(
+        {"status": "running", "heartbeat_at": {"$lt": cutoff}},
+        {"$set": {"status": "queued"}}
+    )
+    if result.modified_count:
+        print(f"🧹 Requeued {result.modified_count} stale maintenance jobs")
+    return result.modified_count
+
+
+async def process_queued_jobs(db) -> int:
+    """Run queued jobs until none are left; returns how many ran"""
+    ran = 0
+    while True:
+        job = await _claim_next_job(db)
+        if job is None:
+            return ran
+        print(f"🧹 Maintenance job {job['_id']} ({job['kind']}): deleting {job['total']} history records")
+        update = {"status": "done"}
+        try:
+            deleted = await run_purge_job(db, job)
+            print(f"✅ Maintenance job {job['_id']} finished: {deleted} records deleted")
+        except Exception as e:
+            update.update({"status": "failed", "error": str(e)})
+            print(f"❌ Maintenance job {job['_id']} failed: {e}")
+        update["finished_at"] = datetime.utcnow()
+        await db[JOBS_COLLECTION].update_one({"_id": job["_id"]}, {"$set": update, "$unset": {"singleton": ""}})
+        ran += 1
+
+
+async def enqueue_retention_purge(db, retention_days: int = HISTORY_RETENTION_DAYS) -> Optional[Dict]:
+    """
+    Queue deletion of history older than the retention window, if anything is
+    due and no retention job is already queued or running (by any worker)
+    """
+    if retention_days <= 0:
+        return None
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    if not await db.history.find_one({"timestamp": {"$lt": cutoff}}, {"_id": 1}):
+        return None
+    return await enqueue_history_purge(db, "retention", before=cutoff, singleton="retention")
+
+
+async def run_maintenance_worker(db):
+    """
+    Background loop: runs queued purge jobs (woken as soon as one is queued)
+    and enforces the retention window every RETENTION_INTERVAL seconds
+    """
+    wakeup = _get_wakeup()
+    next_retention = datetime.utcnow()
+    while True:
+        wakeup.clear()
+        try:
+            if datetime.utcnow() >= next_retention:
+                await enqueue_retention_purge(db)
+                next_retention = datetime.utcnow() + timedelta(seconds=RETENTION_INTERVAL)
+            # Jobs left running by a stopped process are picked up again
+            await requeue_stale_jobs(db)
+            await process_queued_jobs(db)
+        except Exception as e:
+            print(f"⚠️ Maintenance worker error: {e}")
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), MAINTENANCE_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
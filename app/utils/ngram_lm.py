@@ -0,0 +1,346 @@
+"""
+Character n-gram language model stored as a memory-mappable file
+
+Model file layout (little-endian, version 1):
+
+    header   magic "PCLM", u16 version, u16 order, f32 discount,
+             u64 training characters, u32 vocabulary size, 8 pad bytes
+    orders   for n = 1..order: u64 gram count, u64 context count
+    tables   for n = 1..order:
+               u64[gram count]     sorted hashes of n-grams
+               u32[gram count]     their counts
+               (padded to 8 bytes)
+               for n >= 2 only:
+               u64[context count]  sorted hashes of (n-1)-gram contexts
+               u32[context count]  total count of n-grams with that context
+               u32[context count]  distinct characters seen after it
+               (padded to 8 bytes)
+
+Text is normalized like clean_text() (lowercased, whitespace collapsed) and
+prefixed with order - 1 start symbols. An n-gram hash is FNV-1a over its code
+points, so the hash of a context is the hash of the n-gram's prefix and all
+hashes of a text are computed with a few vectorized NumPy passes.
+
+Probabilities use interpolated absolute discounting:
+
+    P(c | h) = max(count(hc) - D, 0) / total(h)
+               + D * distinct(h) / total(h) * P(c | h')
+
+where h' drops the oldest character, bottoming out at add-one unigrams.
+
+Workers mmap the file read-only, so it loads instantly and its pages are
+shared through the OS page cache.
+
+Train a model with:  python -m app.utils.ngram_lm train MODEL FILE...
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.utils.google_similarity import clean_text
+
+MAGIC = b"PCLM"
+FORMAT_VERSION = 1
+
+DEFAULT_ORDER = 5
+DEFAULT_DISCOUNT = 0.75
+
+_HEADER = struct.Struct("<4sHHfQI8x")
+_ORDER_ENTRY = struct.Struct("<QQ")
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+# Code point of the start symbol padding each text
+_BOS = 0x02
+
+NGRAM_LM_PATH = os.getenv("NGRAM_LM_PATH")
+
+
+def encode(text: str, order: int) -> np.ndarray:
+    """Code points of the normalized text, prefixed with order - 1 start symbols"""
+    codes = np.frombuffer(clean_text(text).encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+    return np.concatenate((np.full(order - 1, _BOS, dtype=np.uint64), codes))
+
+
+def gram_hashes(codes: np.ndarray, order: int) -> List[np.ndarray]:
+    """
+    hashes[n - 1][i] is the hash of the n-gram starting at codes[i]
+    Each order extends the previous order's hashes by one character.
+    """
+    hashes = []
+    with np.errstate(over="ignore"):
+        current = (_FNV_OFFSET ^ codes) * _FNV_PRIME
+        hashes.append(current)
+        for n in range(2, order + 1):
+            current = (current[:-1] ^ codes[n - 1:]) * _FNV_PRIME
+            hashes.append(current)
+    return hashes
+
+
+def _pad8(f, written: int):
+    if written % 8:
+        f.write(bytes(8 - written % 8))
+
+
+def _lookup(keys: np.ndarray, values: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """values for each query hash, 0 where the hash isn't in the sorted keys"""
+    if not len(keys):
+        return np.zeros(len(queries), dtype=np.float64)
+    positions = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+    return np.where(keys[positions] == queries, values[positions], 0).astype(np.float64)
+
+
+class NGramModel:
+    """Read-only memory-mapped character n-gram model"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, order, discount, total, vocab_size = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an n-gram model")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        self.order = order
+        self.discount = discount
+        self.total = total
+        self.vocab_size = vocab_size
+
+        offset = _HEADER.size
+        sizes = []
+        for _ in range(order):
+            sizes.append(_ORDER_ENTRY.unpack_from(self._mmap, offset))
+            offset += _ORDER_ENTRY.size
+
+        def take(dtype: str, count: int) -> np.ndarray:
+            nonlocal offset
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        def align():
+            nonlocal offset
+            offset += -offset % 8
+
+        self.grams: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.contexts: List[Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = []
+        for n, (n_grams, n_contexts) in enumerate(sizes, 1):
+            self.grams.append((take("<u8", n_grams), take("<u4", n_grams)))
+            align()
+            if n >= 2:
+                self.contexts.append((take("<u8", n_contexts), take("<u4", n_contexts), take("<u4", n_contexts)))
+                align()
+            else:
+                self.contexts.append(None)
+
+    def log_probs(self, text: str) -> np.ndarray:
+        """log2 probability of each character of the normalized text given its context"""
+        codes = encode(text, self.order)
+        length = len(codes) - (self.order - 1)
+        if length <= 0:
+            return np.zeros(0)
+        hashes = gram_hashes(codes, self.order)
+
+        # Character t (t = 0..length-1) sits at codes[t + order - 1]; its n-gram starts n - 1 earlier
+        first = self.order - 1
+        unigram_keys, unigram_counts = self.grams[0]
+        probs = (_lookup(unigram_keys, unigram_counts, hashes[0][first:first + length]) + 1) / (self.total + self.vocab_size)
+
+        for n in range(2, self.order + 1):
+            start = first - (n - 1)
+            gram_keys, gram_counts = self.grams[n - 1]
+            context_keys, context_totals, context_distinct = self.contexts[n - 1]
+            counts = _lookup(gram_keys, gram_counts, hashes[n - 1][start:start + length])
+            context = hashes[n - 2][start:start + length]
+            totals = _lookup(context_keys, context_totals, context)
+            distinct = _lookup(context_keys, context_distinct, context)
+
+            seen = totals > 0
+            safe_totals = np.where(seen, totals, 1)
+            interpolated = (np.maximum(counts - self.discount, 0) + self.discount * distinct * probs) / safe_totals
+            probs = np.where(seen, interpolated, probs)
+
+        return np.log2(probs)
+
+    def bits_per_char(self, text: str) -> Optional[float]:
+        """Cross-entropy of the text under the model (log2 perplexity per character)"""
+        log_probs = self.log_probs(text)
+        if not len(log_probs):
+            return None
+        return float(-log_probs.mean())
+
+    def size_bytes(self) -> int:
+        return len(self._mmap)
+
+    def close(self):
+        self.grams = []
+        self.contexts = []
+        self._mmap.close()
+
+
+def _merge_counts(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum counts of equal keys; returns sorted unique keys"""
+    if not len(keys):
+        return keys, counts
+    order = np.argsort(keys, kind="stable")
+    keys, counts = keys[order], counts[order]
+    boundaries = np.concatenate(([True], keys[1:] != keys[:-1]))
+    return keys[boundaries], np.add.reduceat(counts, np.nonzero(boundaries)[0])
+
+
+def train_model(texts: Iterable[str], path: str, order: int = DEFAULT_ORDER,
+                discount: float = DEFAULT_DISCOUNT, min_count: int = 1) -> Dict:
+    """
+    Count n-grams of the texts and write a model file
+    n-grams of order 3 and up seen fewer than min_count times are dropped to
+    keep the file small; context totals are computed before pruning.
+    """
+    gram_keys: List[List[np.ndarray]] = [[] for _ in range(order)]
+    gram_contexts: List[List[np.ndarray]] = [[] for _ in range(order)]
+    characters = 0
+
+    for text in texts:
+        codes = encode(text, order)
+        if len(codes) <= order - 1:
+            continue
+        characters += len(codes) - (order - 1)
+        hashes = gram_hashes(codes, order)
+        for n in range(1, order + 1):
+            # Skip grams made only of padding and grams predicting a start symbol
+            start = max(0, order - n)
+            gram_keys[n - 1].append(hashes[n - 1][start:])
+            if n >= 2:
+                gram_contexts[n - 1].append(hashes[n - 2][start:len(hashes[n - 1])])
+
+    tables = []
+    for n in range(1, order + 1):
+        keys = np.concatenate(gram_keys[n - 1]) if gram_keys[n - 1] else np.zeros(0, dtype=np.uint64)
+        contexts = None
+        if n >= 2:
+            contexts = np.concatenate(gram_contexts[n - 1]) if gram_contexts[n - 1] else np.zeros(0, dtype=np.uint64)
+            # One (gram, context) pair per distinct gram, then group by context
+            pair_keys, inverse = np.unique(keys, return_inverse=True)
+            pair_contexts = np.zeros(len(pair_keys), dtype=np.uint64)
+            pair_contexts[inverse] = contexts
+            counts = np.bincount(inverse, minlength=len(pair_keys)).astype(np.uint32)
+            context_keys, context_totals = _merge_counts(pair_contexts, counts.astype(np.uint64))
+            _, context_distinct = _merge_counts(pair_contexts, np.ones(len(pair_keys), dtype=np.uint64))
+            keys = pair_keys
+            contexts = (context_keys, context_totals.astype(np.uint32), context_distinct.astype(np.uint32))
+        else:
+            keys, counts = np.unique(keys, return_counts=True)
+            counts = counts.astype(np.uint32)
+
+        if n >= 3 and min_count > 1:
+            keep = counts >= min_count
+            keys, counts = keys[keep], counts[keep]
+        tables.append((keys, counts, contexts))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, order, discount, characters, len(tables[0][0]) + 1))
+        for keys, _, contexts in tables:
+            f.write(_ORDER_ENTRY.pack(len(keys), len(contexts[0]) if contexts else 0))
+        for keys, counts, contexts in tables:
+            f.write(keys.astype("<u8").tobytes())
+            f.write(counts.astype("<u4").tobytes())
+            _pad8(f, counts.nbytes)
+            if contexts:
+                context_keys, context_totals, context_distinct = contexts
+                f.write(context_keys.astype("<u8").tobytes())
+                f.write(context_totals.astype("<u4").tobytes())
+                f.write(context_distinct.astype("<u4").tobytes())
+                _pad8(f, context_totals.nbytes + context_distinct.nbytes)
+
+    os.replace(tmp_path, path)
+    return {
+        "order": order,
+        "characters": characters,
+        "grams": [len(keys) for keys, _, _ in tables],
+        "bytes": os.path.getsize(path),
+    }
+
+
+_model: Optional[NGramModel] = None
+_model_loaded = False
+
+
+def get_language_model() -> Optional[NGramModel]:
+    """The process-wide model, or None if NGRAM_LM_PATH isn't configured or unreadable"""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if NGRAM_LM_PATH and os.path.exists(NGRAM_LM_PATH):
+            try:
+                _model = NGramModel(NGRAM_LM_PATH)
+                print(f"✅ Language model loaded ({_model.order}-gram, {_model.size_bytes()} bytes)")
+            except ValueError as e:
+                print(f"⚠️ Ignoring language model: {e}")
+    return _model
+
+
+def _read_files(paths: List[str]) -> Iterable[str]:
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            yield f.read()
+
+
+def _main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="python -m app.utils.ngram_lm")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="train a model from UTF-8 text files")
+    train.add_argument("model")
+    train.add_argument("files", nargs="+")
+    train.add_argument("--order", type=int, default=DEFAULT_ORDER)
+    train.add_argument("--discount", type=float, default=DEFAULT_DISCOUNT)
+    train.add_argument("--min-count", type=int, default=1)
+
+    bench = commands.add_parser("bench", help="score text files and report throughput")
+    bench.add_argument("model")
+    bench.add_argument("files", nargs="+")
+    bench.add_argument("--repeat", type=int, default=3)
+
+    info = commands.add_parser("info", help="describe a model file")
+    info.add_argument("model")
+
+    args = parser.parse_args(argv[1:])
+
+    if args.command == "train":
+        started = time.perf_counter()
+        result = train_model(_read_files(args.files), args.model, args.order, args.discount, args.min_count)
+        print(f"✅ Wrote {args.model}: {result} in {time.perf_counter() - started:.2f}s")
+
+    elif args.command == "bench":
+        started = time.perf_counter()
+        model = NGramModel(args.model)
+        print(f"Loaded in {(time.perf_counter() - started) * 1000:.2f} ms")
+        texts = list(_read_files(args.files))
+        characters = sum(len(clean_text(text)) for text in texts)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            bits = [model.bits_per_char(text) for text in texts]
+        elapsed = (time.perf_counter() - started) / args.repeat
+        for path, value in zip(args.files, bits):
+            print(f"{path}: {value:.3f} bits/char" if value is not None else f"{path}: empty")
+        print(f"{characters} chars in {elapsed * 1000:.1f} ms ({characters / elapsed / 1e6:.2f} M chars/s)")
+
+    elif args.command == "info":
+        model = NGramModel(args.model)
+        print(f"{args.model}: order {model.order}, discount {model.discount}, "
+              f"{model.total} training chars, vocabulary {model.vocab_size}, {model.size_bytes()} bytes")
+        for n, (keys, _) in enumerate(model.grams, 1):
+            contexts = len(model.contexts[n - 1][0]) if model.contexts[n - 1] else 0
+            print(f"  order {n}: {len(keys)} grams, {contexts} contexts")
+
+
+if __name__ == "__main__":
+    _main(sys.argv)
@@ -0,0 +1,282 @@
+"""
+Offline batch checker for a directory of PDF/DOCX/TXT files
+
+Runs the same extraction, calculate_text_similarity, find_matching_segments
+and detect_ai_content code as the API, without the HTTP stack or Mongo:
+
+    python -m app.utils.offline_check DIR --json report.json --csv pairs.csv \
+        --checkpoint audit.jsonl
+
+Every document, then every candidate pair (documents sharing winnowed
+fingerprints), is processed across a process pool. Finished work is appended
+to the checkpoint file as it completes, so an interrupted run started again
+with the same --checkpoint only does what is left. Documents whose size or
+modification time changed since they were checkpointed are redone.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.utils.text_extraction import content_type_from_filename, extract_text, extraction_failed
+from app.utils.google_similarity import calculate_text_similarity, find_matching_segments
+from app.utils.ai_detector import detect_ai_content
+from app.utils.fingerprint import fingerprint_text, candidate_pairs
+from app.utils.process_pool import BATCH_WORKERS
+
+# Matching segments kept per reported pair
+MAX_PAIR_SEGMENTS = 20
+
+# Progress is printed at most this often (seconds)
+PROGRESS_INTERVAL = 2.0
+
+
+def find_documents(root: str) -> List[str]:
+    """Paths (relative to root) of every supported file under root"""
+    paths = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if content_type_from_filename(filename):
+                paths.append(os.path.relpath(os.path.join(directory, filename), root))
+    return sorted(paths)
+
+
+def file_signature(root: str, path: str) -> Tuple[int, float]:
+    stat = os.stat(os.path.join(root, path))
+    return stat.st_size, stat.st_mtime
+
+
+def analyse_document(task: Tuple[str, str, bool]) -> Dict:
+    """Extract one file and compute what the pairwise pass and report need (runs in a worker)"""
+    root, path, check_ai = task
+    size, mtime = file_signature(root, path)
+    entry = {"type": "document", "path": path, "size": size, "mtime": mtime}
+
+    with open(os.path.join(root, path), "rb") as f:
+        text = extract_text(f.read(), content_type_from_filename(path))
+    if not text or len(text.strip()) < 10 or extraction_failed(text):
+        entry["skipped"] = text[:200] if text else "No text extracted"
+        return entry
+
+    entry.update({
+        "text": text,
+        "words": len(text.split()),
+        "fingerprints": sorted(fingerprint_text(text)),
+    })
+    if check_ai:
+        ai = detect_ai_content(text)
+        entry["ai"] = {
+            "ai_probability": ai["ai_probability"],
+            "confidence": ai["confidence"],
+            "patterns_detected": ai["analysis"]["patterns_detected"],
+        }
+    return entry
+
+
+# Texts shared with pool workers once, instead of pickling them per pair
+_worker_texts: List[str] = []
+_worker_min_similarity = 0.0
+
+
+def _init_pair_worker(texts: List[str], min_similarity: float):
+    global _worker_texts, _worker_min_similarity
+    _worker_texts = texts
+    _worker_min_similarity = min_similarity
+
+
+def _score_pairs(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int, float, Optional[List[str]]]]:
+    """Similarity of each pair, plus the matching segments of suspicious ones (runs in a worker)"""
+    scored = []
+    for i, j in pairs:
+        score = calculate_text_similarity(_worker_texts[i], _worker_texts[j])
+        segments = None
+        if score >= _worker_min_similarity:
+            segments = find_matching_segments(_worker_texts[i], _worker_texts[j])[:MAX_PAIR_SEGMENTS]
+        scored.append((i, j, score, segments))
+    return scored
+
+
+def load_checkpoint(path: Optional[str]) -> Tuple[Dict[str, Dict], Dict[Tuple[str, str], Dict]]:
+    """Documents and pairs finished by earlier runs"""
+    documents: Dict[str, Dict] = {}
+    pairs: Dict[Tuple[str, str], Dict] = {}
+    if not path or not os.path.exists(path):
+        return documents, pairs
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Last line of an interrupted run
+            if entry.get("type") == "document":
+                documents[entry["path"]] = entry
+            elif entry.get("type") == "pair":
+                pairs[(entry["doc1"], entry["doc2"])] = entry
+    return documents, pairs
+
+
+class Progress:
+    """Throttled "done/total" progress lines"""
+
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self.last_report = 0.0
+
+    def advance(self, count: int = 1):
+        self.done += count
+        now = time.perf_counter()
+        if self.done == self.total or now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            rate = self.done / max(now - self.started, 1e-9)
+            print(f"⏳ {self.label}: {self.done}/{self.total} ({rate:.1f}/s)", flush=True)
+
+
+def run_check(root: str, checkpoint: Optional[str] = None, workers: Optional[int] = None,
+              min_similarity: float = 50.0, min_shared: int = 1, max_postings: int = 0,
+              check_ai: bool = True) -> Dict:
+    """Check every document under root against every other; returns the report"""
+    workers = workers or BATCH_WORKERS
+    started = time.perf_counter()
+    done_documents, done_pairs = load_checkpoint(checkpoint)
+    checkpoint_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+
+    def record(entry: Dict):
+        if checkpoint_file:
+            checkpoint_file.write(json.dumps(entry) + "\n")
+            checkpoint_file.flush()
+
+    try:
+        # Pass 1: extraction, fingerprints and AI detection per document
+        paths = find_documents(root)
+        documents: Dict[str, Dict] = {}
+        pending = []
+        for path in paths:
+            entry = done_documents.get(path)
+            if (entry and [entry["size"], entry["mtime"]] == list(file_signature(root, path))
+                    and (not check_ai or "ai" in entry or "skipped" in entry)):
+                documents[path] = entry
+            else:
+                pending.append(path)
+        print(f"📄 {len(paths)} documents, {len(documents)} from checkpoint, {len(pending)} to extract")
+        # Pairs involving a changed (re-extracted) document must be scored again
+        changed = set(pending)
+        done_pairs = {key: entry for key, entry in done_pairs.items() if not changed.intersection(key)}
+
+        progress = Progress("Documents", len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for entry in pool.map(analyse_document, [(root, path, check_ai) for path in pending], chunksize=4):
+                documents[entry["path"]] = entry
+                record(entry)
+                progress.advance()
+
+        usable = [path for path in paths if "skipped" not in documents[path]]
+        texts = [documents[path]["text"] for path in usable]
+
+        # Pass 2: candidate pairs by shared fingerprints, scored exactly
+        candidates = candidate_pairs([set(documents[path]["fingerprints"]) for path in usable],
+                                     min_shared=min_shared, max_postings=max_postings)
+        pairs: Dict[Tuple[str, str], Dict] = {}
+        to_score = []
+        for i, j in sorted(candidates):
+            entry = done_pairs.get((usable[i], usable[j]))
+            # Pairs checkpointed under a higher threshold may lack their segments
+            if entry and (entry["segments"] is not None or entry["similarity_score"] < min_similarity):
+                pairs[(usable[i], usable[j])] = entry
+            else:
+                to_score.append((i, j))
+        print(f"🔗 {len(candidates)} candidate pairs of {len(usable) * (len(usable) - 1) // 2}, "
+              f"{len(pairs)} from checkpoint, {len(to_score)} to score")
+
+        progress = Progress("Pairs", len(to_score))
+        chunk_size = max(1, min(256, len(to_score) // (workers * 4) or 1))
+        chunks = [to_score[k:k + chunk_size] for k in range(0, len(to_score), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_pair_worker,
+                                 initargs=(texts, min_similarity)) as pool:
+            for scored in pool.map(_score_pairs, chunks):
+                for i, j, score, segments in scored:
+                    entry = {"type": "pair", "doc1": usable[i], "doc2": usable[j], "similarity_score": score,
+                             "shared_fingerprints": candidates[(i, j)], "segments": segments}
+                    pairs[(usable[i], usable[j])] = entry
+                    record(entry)
+                progress.advance(len(scored))
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    suspicious = sorted((pair for pair in pairs.values() if pair["similarity_score"] >= min_similarity),
+                        key=lambda pair: pair["similarity_score"], reverse=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "root": os.path.abspath(root),
+        "generated_at": datetime.utcnow().isoformat(),
+        "min_similarity": min_similarity,
+        "document_count": len(paths),
+        "candidate_pairs": len(candidates),
+        "suspicious_count": len(suspicious),
+        "elapsed_seconds": round(elapsed, 2),
+        "documents": [
+            {key: value for key, value in documents[path].items() if key not in ("type", "text", "fingerprints")}
+            for path in paths
+        ],
+        "suspicious_pairs": [
+            {key: value for key, value in pair.items() if key != "type"} for pair in suspicious
+        ],
+    }
+
+
+def write_csv(report: Dict, path: str):
+    """One row per suspicious pair, with both documents' AI probabilities"""
+    ai = {document["path"]: (document.get("ai") or {}).get("ai_probability") for document in report["documents"]}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["document1", "document2", "similarity_score", "shared_fingerprints",
+                         "matching_segments", "longest_segment", "ai_probability1", "ai_probability2"])
+        for pair in report["suspicious_pairs"]:
+            segments = pair["segments"] or []
+            writer.writerow([pair["doc1"], pair["doc2"], pair["similarity_score"], pair["shared_fingerprints"],
+                             len(segments), max(segments, key=len) if segments else "",
+                             ai.get(pair["doc1"]), ai.get(pair["doc2"])])
+
+
+def _main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="python -m app.utils.offline_check",
+                                     description="Check a directory of PDF/DOCX/TXT files for plagiarism offline")
+    parser.add_argument("root", help="directory to scan (recursively)")
+    parser.add_argument("--json", dest="json_path", help="write the full report as JSON")
+    parser.add_argument("--csv", dest="csv_path", help="write suspicious pairs as CSV")
+    parser.add_argument("--checkpoint", help="JSONL file to resume from and append progress to")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-similarity", type=float, default=50.0)
+    parser.add_argument("--min-shared", type=int, default=1, help="fingerprints a pair must share to be scored")
+    parser.add_argument("--max-postings", type=int, default=0,
+                        help="ignore fingerprints found in more documents than this (boilerplate)")
+    parser.add_argument("--no-ai", action="store_true", help="skip AI detection")
+    args = parser.parse_args(argv[1:])
+
+    if not os.path.isdir(args.root):
+        parser.error(f"{args.root} is not a directory")
+
+    report = run_check(args.root, args.checkpoint, args.workers, args.min_similarity,
+                       args.min_shared, args.max_postings, check_ai=not args.no_ai)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.csv_path:
+        write_csv(report, args.csv_path)
+
+    print(f"✅ {report['document_count']} documents, {report['suspicious_count']} suspicious pairs "
+          f"(>= {args.min_similarity}%) in {report['elapsed_seconds']}s")
+    for pair in report["suspicious_pairs"][:10]:
+        print(f"  {pair['similarity_score']:6.2f}%  {pair['doc1']}  ↔  {pair['doc2']}")
+
+
+if __name__ == "__main__":
+    _main(sys.argv)
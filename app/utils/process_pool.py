@@ -0,0 +1,62 @@
+"""
+Process pool shared by the batch endpoints
+
+One pool per API worker, started with the app rather than per request, and
+with the spawn start method: forking a process that already runs the event
+loop, the Mongo client's threads and the threadpool can leave the child
+holding locks no thread will release. Without a pool (scripts, or one worker
+configured) callers do the work in their own thread.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional
+
+# Processes for batch scoring on this machine; offline_check uses them all
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "0")) or os.cpu_count() or 1
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Processes in each API worker's pool, so the gunicorn workers together use BATCH_WORKERS
+BATCH_POOL_WORKERS = int(os.getenv("BATCH_POOL_WORKERS", "0")) or max(1, BATCH_WORKERS // WEB_CONCURRENCY)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def start_process_pool(workers: int = BATCH_POOL_WORKERS) -> Optional[ProcessPoolExecutor]:
+    """Create this process's pool (processes are spawned on first use); None for one worker"""
+    global _pool
+    if _pool is None and workers > 1:
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        print(f"🧮 Batch process pool: {workers} workers (spawn)")
+    return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def pool_workers() -> int:
+    return _pool._max_workers if _pool is not None else 1
+
+
+def pool_map(function: Callable, chunks: List) -> Optional[List]:
+    """
+    function applied to each chunk in the shared pool, in order
+    None when there is no pool, or it broke (a worker was killed): the
+    caller then does the work itself, and the next call gets a fresh pool.
+    """
+    pool = _pool
+    if pool is None:
+        return None
+    try:
+        return list(pool.map(function, chunks))
+    except BrokenProcessPool:
+        print("⚠️ Batch process pool broke; starting a new one")
+        workers = pool._max_workers
+        shutdown_process_pool()
+        start_process_pool(workers)
+        return None
@@ -0,0 +1,58 @@
+from typing import Dict, Optional
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+# Legacy fields that repeat a text1 field under an older name
+DUPLICATE_FIELDS = ("google_sources", "google_highlighted_text", "all_google_matches")
+
+# Full <mark>-annotated copies of the documents; spans carry the same information
+RENDERED_FIELDS = ("highlighted_text1", "highlighted_text2",
+                   "google_highlighted_text1", "google_highlighted_text2")
+
+# Nested results that embed their own rendered copy of a document
+RENDERED_NESTED_FIELDS = ("ai_detection", "ai_detection_text2")
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == [] or value == {}
+
+
+def compact_result(data: Dict) -> Dict:
+    """The "compact" view of a dumped result (see ResponseView)"""
+    compact = {}
+    for key, value in data.items():
+        if key in DUPLICATE_FIELDS or key in RENDERED_FIELDS or _is_empty(value):
+            continue
+        if key in RENDERED_NESTED_FIELDS:
+            value = {k: v for k, v in value.items() if k != "highlighted_text" and not _is_empty(v)}
+        compact[key] = value
+    return compact
+
+
+def parse_fields(fields: Optional[str], model: type) -> Optional[set]:
+    """Validate a comma-separated fields= selector against a response model"""
+    if not fields:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return selected
+
+
+def render_result(result: BaseModel, view: str = "full", fields: Optional[set] = None) -> ORJSONResponse:
+    """
+    Serialize a response model in the requested view, keeping only the
+    selected top-level fields (as returned by parse_fields, which endpoints
+    call before doing any work so a bad selector costs nothing)
+    Returned as a ready response so FastAPI doesn't re-validate the trimmed
+    payload against response_model (which would put the dropped fields back).
+    """
+    data = result.model_dump(include=fields)
+    if view == "compact":
+        data = compact_result(data)
+    return ORJSONResponse(data)
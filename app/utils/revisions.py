@@ -0,0 +1,149 @@
+import os
+from typing import Dict, List, Optional, Tuple
+from app.utils.ai_detector import combine_ai_results, detect_ai_content
+from app.utils.chunked_similarity import compare_texts, paragraph_spans
+from app.utils.deadline import Deadline
+from app.utils.fingerprint import stable_hash
+from app.utils.google_similarity import GOOGLE_REQUEST_TIMEOUT, check_google_similarity, clean_text, find_match_spans, render_highlighted_html
+from app.utils.simhash import to_signed64
+
+# Paragraphs shorter than this are not looked up on Google on their own
+MIN_LOOKUP_WORDS = 8
+
+# Google lookups of new paragraphs per recheck (each one is an API call and an
+# HTTP round trip); the rest are looked up by later rechecks
+MAX_RECHECK_LOOKUPS = int(os.getenv("MAX_RECHECK_LOOKUPS", "3"))
+
+MAX_GOOGLE_SOURCES = 10
+
+
+def paragraph_hash(paragraph: str) -> int:
+    """Hash of a paragraph's cleaned text (whitespace and case edits don't change it)"""
+    return to_signed64(stable_hash(clean_text(paragraph)))
+
+
+def split_paragraphs(text: str) -> List[Tuple[int, int]]:
+    """Non-empty paragraphs as (start, end) offsets, trimmed of surrounding whitespace"""
+    spans = []
+    for start, end in paragraph_spans(text):
+        paragraph = text[start:end]
+        stripped = paragraph.strip()
+        if stripped:
+            start += len(paragraph) - len(paragraph.lstrip())
+            spans.append((start, start + len(stripped)))
+    return spans
+
+
+def _slim_ai_result(result: Dict) -> Dict:
+    """What a paragraph's AI result needs to be merged later (no rendered HTML)"""
+    return {key: value for key, value in result.items() if key != "highlighted_text"}
+
+
+def recheck_revision(text: str, reference: str, previous: Optional[Dict] = None,
+                     check_google: bool = False, check_ai: bool = False,
+                     api_key: Optional[str] = None, search_engine_id: Optional[str] = None,
+                     deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Check a revised text, recomputing only paragraphs the previous version lacks
+    The similarity to the reference is computed over the whole text exactly
+    as /check computes it (compare_texts), so a revision scores the same as
+    submitting it fresh. previous is the earlier version's history record;
+    its stored paragraph_results are reused for paragraphs whose hash is
+    unchanged, for the Google lookup and the AI result only. Returns the
+    merged scores and the new paragraph_results to store with the revision.
+    A paragraph left without a Google lookup (deadline passed, lookup failed,
+    or past the MAX_RECHECK_LOOKUPS lookups per recheck) or an AI result is
+    left out of that score, marks it partial and is retried on the next recheck.
+    """
+    deadline = deadline or Deadline()
+    cached = {entry["h"]: entry for entry in (previous or {}).get("paragraph_results") or []}
+
+    comparison = compare_texts(text, reference, deadline=deadline)
+
+    paragraph_results = []
+    reused = 0
+    lookups_left = MAX_RECHECK_LOOKUPS
+    for start, end in split_paragraphs(text):
+        paragraph = text[start:end]
+        h = paragraph_hash(paragraph)
+        old = cached.get(h)
+        entry = {"h": h, "start": start, "end": end}
+        hit = old is not None
+        old = old or {}
+
+        if check_google:
+            if "google" in old:
+                entry["google"] = old["google"]
+            elif deadline.expired():
+                hit = False
+            elif len(paragraph.split()) < MIN_LOOKUP_WORDS:
+                entry["google"] = None
+                hit = False
+            elif lookups_left <= 0:
+                hit = False
+            else:
+                lookups_left -= 1
+                google_result = check_google_similarity(paragraph, api_key, search_engine_id,
+                                                        deadline.timeout(GOOGLE_REQUEST_TIMEOUT))
+                if google_result:
+                    entry["google"] = {
+                        "similarity_percentage": google_result["similarity_percentage"],
+                        "sources": google_result["sources"],
+                        "all_matches": google_result.get("all_matches", []),
+                    }
+                hit = False
+
+        if check_ai:
+            if "ai" in old:
+                entry["ai"] = old["ai"]
+            elif deadline.expired():
+                deadline.mark_partial("ai")
+                hit = False
+            else:
+                entry["ai"] = _slim_ai_result(detect_ai_content(paragraph))
+                hit = False
+
+        reused += hit
+        paragraph_results.append(entry)
+
+    # Only completed lookups are stored; whatever is missing is retried next time
+    missing = sum("google" not in entry for entry in paragraph_results) if check_google else 0
+    if missing:
+        reason = "Time budget exhausted" if deadline.expired() else f"{missing} paragraphs without a Google lookup yet"
+        deadline.mark_partial("google", reason=reason)
+
+    result = {
+        "similarity": comparison["similarity"],
+        "paragraphs": len(paragraph_results),
+        "paragraphs_reused": reused,
+        "paragraph_results": paragraph_results,
+        "google": None,
+        "ai": None,
+    }
+
+    if check_google:
+        lookups = [entry["google"] for entry in paragraph_results if entry.get("google")]
+        if lookups:
+            sources_by_url: Dict[str, Dict] = {}
+            all_matches: List[str] = []
+            for lookup in lookups:
+                for source in lookup["sources"]:
+                    kept = sources_by_url.get(source["url"])
+                    if kept is None or source["similarity"] > kept["similarity"]:
+                        sources_by_url[source["url"]] = source
+                all_matches.extend(match for match in lookup["all_matches"] if match not in all_matches)
+            spans = find_match_spans(text, all_matches)
+            result["google"] = {
+                "similarity_percentage": max(lookup["similarity_percentage"] for lookup in lookups),
+                "sources": sorted(sources_by_url.values(), key=lambda source: source["similarity"], reverse=True)[:MAX_GOOGLE_SOURCES],
+                "all_matches": all_matches,
+                "highlighted_text": render_highlighted_html(text, spans),
+                "highlight_spans": spans,
+            }
+
+    if check_ai:
+        parts = [(entry["start"], entry["end"], entry["ai"]) for entry in paragraph_results if "ai" in entry]
+        if parts:
+            result["ai"] = combine_ai_results(text, parts)
+
+    return result
@@ -1,10 +1,9 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.database import get_database
+from app.database import get_database, with_retry
+from app.utils.lazy_imports import lazy_import
 import os
 from dotenv import load_dotenv
 
@@ -15,22 +14,32 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-default-secret-key-change-this")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib/bcrypt and jose are imported on the first login or authenticated request
+passlib_context = lazy_import("passlib.context")
+jwt = lazy_import("jose.jwt")
+
+_pwd_context = None
 security = HTTPBearer()
 
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = passlib_context.CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
 def hash_password(password: str) -> str:
     """Hash a password. Bcrypt has a 72-byte limit, so truncate if necessary."""
     # Truncate password to 72 bytes if longer (bcrypt limitation)
     if len(password.encode('utf-8')) > 72:
         password = password[:72]
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash. Truncate to match hashing behavior."""
     # Truncate password to 72 bytes if longer (bcrypt limitation)
     if len(plain_password.encode('utf-8')) > 72:
         plain_password = plain_password[:72]
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -56,11 +65,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.JWTError:
         raise credentials_exception
     
     db = get_database()
-    user = await db.users.find_one({"email": email})
+    user = await with_retry(db.users.find_one, {"email": email})
     if user is None:
         raise credentials_exception
     
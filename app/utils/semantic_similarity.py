@@ -0,0 +1,133 @@
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Hashed feature space and projected vector size
+FEATURE_DIM = 4096
+VECTOR_DIM = 256
+
+# Fixed seed so every process (and every release) projects identically
+PROJECTION_SEED = 1729
+
+# Sentence pairs at or above this cosine similarity (percentage) are reported
+SEMANTIC_ALIGNMENT_THRESHOLD = float(os.getenv("SEMANTIC_ALIGNMENT_THRESHOLD", "40"))
+
+# Sentences shorter than this many words are too generic to align
+MIN_SENTENCE_WORDS = 3
+
+MAX_SEMANTIC_ALIGNMENTS = 100
+
+STOP_WORDS = frozenset("""
+a an the and or but if of to in on at by for with from as into onto over under
+about after before between through during than then so that this these those
+it its is are was were be been being am do does did has have had having not no
+i you he she we they me him her us them my your his our their there here which
+who whom what when where why how all any some such can could will would shall
+should may might must also very just up out off again further once own same
+""".split())
+
+_SENTENCE_RE = re.compile(r'[^.!?\n]+[.!?]*')
+_WORD_RE = re.compile(r'\w+')
+
+_projection: Optional[np.ndarray] = None
+
+
+def get_projection() -> np.ndarray:
+    """The FEATURE_DIM x VECTOR_DIM Gaussian random projection, built on first use"""
+    global _projection
+    if _projection is None:
+        rng = np.random.default_rng(PROJECTION_SEED)
+        _projection = (rng.standard_normal((FEATURE_DIM, VECTOR_DIM)) / np.sqrt(VECTOR_DIM)).astype(np.float32)
+    return _projection
+
+
+def split_sentences(text: str) -> List[Tuple[int, int, str]]:
+    """(start, end, sentence) for each sentence, with character offsets into text"""
+    sentences = []
+    for m in _SENTENCE_RE.finditer(text):
+        sentence = m.group().strip()
+        if sentence:
+            start = m.start() + (len(m.group()) - len(m.group().lstrip()))
+            sentences.append((start, start + len(sentence), sentence))
+    return sentences
+
+
+def sentence_features(sentence: str) -> List[str]:
+    """
+    Content word unigrams, bigrams of consecutive content words and the
+    character trigrams of each content word
+    The trigrams let inflected or respelled words ("speeds"/"speed") still
+    share features, which is most of what makes rewording score high.
+    Function words are dropped: they are shared by almost any two sentences.
+    """
+    words = [word for word in _WORD_RE.findall(sentence.lower()) if word not in STOP_WORDS]
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+def feature_matrix(sentences: List[str]) -> np.ndarray:
+    """Signed hashed feature counts, one row per sentence"""
+    rows, cols, signs = [], [], []
+    for row, sentence in enumerate(sentences):
+        for feature in sentence_features(sentence):
+            h = zlib.crc32(feature.encode("utf-8"))
+            rows.append(row)
+            cols.append(h % FEATURE_DIM)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+    matrix = np.zeros((len(sentences), FEATURE_DIM), dtype=np.float32)
+    np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+              np.asarray(signs, dtype=np.float32))
+    return matrix
+
+
+def sentence_vectors(sentences: List[str]) -> np.ndarray:
+    """Unit-length projected vectors, one row per sentence"""
+    vectors = feature_matrix(sentences) @ get_projection()
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def semantic_similarity(text1: str, text2: str,
+                        threshold: float = SEMANTIC_ALIGNMENT_THRESHOLD) -> Dict:
+    """
+    Paraphrase-tolerant similarity between two texts
+    Every sentence of text1 is compared with every sentence of text2 in one
+    matrix product. Returns the overall similarity (word-weighted mean of each
+    text1 sentence's best match, 0-100) and the aligned sentence pairs.
+    """
+    sentences1 = [s for s in split_sentences(text1) if len(_WORD_RE.findall(s[2])) >= MIN_SENTENCE_WORDS]
+    sentences2 = [s for s in split_sentences(text2) if len(_WORD_RE.findall(s[2])) >= MIN_SENTENCE_WORDS]
+    if not sentences1 or not sentences2:
+        return {"similarity": 0.0, "alignments": []}
+
+    vectors1 = sentence_vectors([s[2] for s in sentences1])
+    vectors2 = sentence_vectors([s[2] for s in sentences2])
+    scores = np.clip(vectors1 @ vectors2.T, 0.0, 1.0) * 100
+
+    best = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(sentences1)), best]
+    weights = np.array([len(_WORD_RE.findall(s[2])) for s in sentences1], dtype=np.float32)
+
+    alignments = []
+    for i in np.nonzero(best_scores >= threshold)[0][:MAX_SEMANTIC_ALIGNMENTS]:
+        start1, end1, sentence1 = sentences1[i]
+        start2, end2, sentence2 = sentences2[best[i]]
+        alignments.append({
+            "text1_sentence": sentence1,
+            "text2_sentence": sentence2,
+            "text1_start": start1,
+            "text1_end": end1,
+            "text2_start": start2,
+            "text2_end": end2,
+            "similarity": round(float(best_scores[i]), 2),
+        })
+
+    return {
+        "similarity": round(float(np.average(best_scores, weights=weights)), 2),
+        "alignments": alignments,
+    }
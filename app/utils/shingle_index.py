@@ -0,0 +1,120 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from app.utils.fingerprint import shingle_hashes, winnow_positions, SHINGLE_SIZE
+from app.utils.simhash import to_signed64
+from app.utils.tokens import TokenizedDocument
+
+# Inverted index collection: one posting per (shingle, history record, text slot)
+#   {"h": <signed 64-bit shingle hash>, "history_id": ObjectId, "slot": "text1",
+#    "user_id": str, "pos": [word offsets of the shingle in that text]}
+SHINGLE_COLLECTION = "shingle_index"
+
+# Query hashes sent per $in lookup
+LOOKUP_CHUNK_SIZE = 500
+
+# Overlapping passages reported per matched text
+MAX_OVERLAP_PASSAGES = 20
+
+
+def build_postings(history_id: ObjectId, user_id: str, slot: str, text: str) -> List[Dict]:
+    """
+    Postings for one stored text
+    Only winnowed shingles are indexed, which keeps roughly 2 / (window + 1)
+    of them while still guaranteeing a hit for any long enough shared passage.
+    """
+    positions = winnow_positions(shingle_hashes(text))
+    return [
+        {
+            "h": to_signed64(shingle),
+            "history_id": history_id,
+            "slot": slot,
+            "user_id": user_id,
+            "pos": shingle_positions,
+        }
+        for shingle, shingle_positions in positions.items()
+    ]
+
+
+async def ensure_shingle_indexes(db):
+    collection = db[SHINGLE_COLLECTION]
+    await collection.create_index([("h", 1), ("user_id", 1)])
+    await collection.create_index([("history_id", 1)])
+    await collection.create_index([("user_id", 1)])
+
+
+async def index_history_record(db, history_id: ObjectId, entry: Dict, slots: Iterable[str],
+                               skip_text: Optional[str] = None):
+    """Add postings for the given text slots of a stored history record"""
+    postings = []
+    for slot in slots:
+        text = entry.get(slot)
+        if text and text != skip_text:
+            postings.extend(build_postings(history_id, entry["user_id"], slot, text))
+    if postings:
+        await db[SHINGLE_COLLECTION].insert_many(postings, ordered=False)
+    return len(postings)
+
+
+async def remove_history_postings(db, history_ids: List[ObjectId]):
+    """Drop postings of deleted history records"""
+    if history_ids:
+        await db[SHINGLE_COLLECTION].delete_many({"history_id": {"$in": history_ids}})
+
+
+async def find_shingle_candidates(db, text: str, user_id: Optional[str] = None,
+                                  min_shared: int = 1) -> Dict[Tuple[ObjectId, str], Dict]:
+    """
+    Stored texts sharing at least min_shared shingles with the text
+    Returns {(history_id, slot): {"shared": count, "positions": [word offsets]}}
+    where positions are shingle starts in the stored text.
+    """
+    query_hashes = sorted({to_signed64(h) for h in shingle_hashes(text)})
+    collection = db[SHINGLE_COLLECTION]
+    candidates: Dict[Tuple[ObjectId, str], Dict] = {}
+
+    for i in range(0, len(query_hashes), LOOKUP_CHUNK_SIZE):
+        match: Dict = {"h": {"$in": query_hashes[i:i + LOOKUP_CHUNK_SIZE]}}
+        if user_id is not None:
+            match["user_id"] = user_id
+
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"history_id": "$history_id", "slot": "$slot"},
+                "shared": {"$sum": 1},
+                "positions": {"$push": "$pos"},
+            }},
+        ]
+        async for group in collection.aggregate(pipeline):
+            key = (group["_id"]["history_id"], group["_id"]["slot"])
+            candidate = candidates.setdefault(key, {"shared": 0, "positions": []})
+            candidate["shared"] += group["shared"]
+            for shingle_positions in group["positions"]:
+                candidate["positions"].extend(shingle_positions)
+
+    return {key: value for key, value in candidates.items() if value["shared"] >= min_shared}
+
+
+def overlap_passages(text: str, positions: List[int], k: int = SHINGLE_SIZE,
+                     limit: int = MAX_OVERLAP_PASSAGES) -> List[Dict]:
+    """
+    Merge matched shingle positions into passages of the stored text
+    Returns [{"start", "end", "text"}] with character offsets into text.
+    """
+    doc = TokenizedDocument.from_text(text)
+    if not len(doc) or not positions:
+        return []
+
+    word_ranges: List[List[int]] = []
+    for position in sorted(set(positions)):
+        end = min(position + k, len(doc))
+        if word_ranges and position <= word_ranges[-1][1]:
+            word_ranges[-1][1] = max(word_ranges[-1][1], end)
+        elif position < len(doc):
+            word_ranges.append([position, end])
+
+    passages = []
+    for first_word, end_word in word_ranges[:limit]:
+        start, end = doc.char_span(first_word, end_word)
+        passages.append({"start": start, "end": end, "text": text[start:end]})
+    return passages
@@ -0,0 +1,89 @@
+import math
+from collections import Counter
+from typing import Dict, List
+from app.utils.google_similarity import clean_text
+from app.utils.fingerprint import stable_hash
+
+SIMHASH_BITS = 64
+
+# The hash is split into BANDS tables of BAND_BITS each. Two hashes within
+# MAX_NEAR_DUPLICATE_DISTANCE bits must agree on at least one whole band
+# (pigeonhole), so an exact lookup per band finds every near-duplicate.
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+MAX_NEAR_DUPLICATE_DISTANCE = BANDS - 1
+
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def simhash(text: str, k: int = 3) -> int:
+    """
+    64-bit SimHash (Charikar) of the text's word k-gram shingles
+    Texts that differ in a few words get hashes a few bits apart.
+    """
+    words = clean_text(text).split()
+    if len(words) < k:
+        shingles = Counter(words)
+    else:
+        shingles = Counter(" ".join(words[i:i + k]) for i in range(len(words) - k + 1))
+
+    if not shingles:
+        return 0
+
+    weights = [0] * SIMHASH_BITS
+    for shingle, weight in shingles.items():
+        h = stable_hash(shingle)
+        for bit in range(SIMHASH_BITS):
+            if (h >> bit) & 1:
+                weights[bit] += weight
+            else:
+                weights[bit] -= weight
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def estimate_similarity(distance: int) -> float:
+    """
+    Similarity percentage implied by a Hamming distance
+    The fraction of differing bits estimates the angle between the shingle
+    vectors, so cos(pi * d / 64) estimates their cosine similarity.
+    """
+    return round(max(0.0, math.cos(math.pi * distance / SIMHASH_BITS)) * 100, 2)
+
+
+def simhash_bands(fingerprint: int) -> List[int]:
+    """
+    Lookup keys for the banded index, one per band
+    The band number is folded into the key so all bands can share one
+    multikey Mongo index.
+    """
+    return [
+        (band << BAND_BITS) | ((fingerprint >> (band * BAND_BITS)) & _BAND_MASK)
+        for band in range(BANDS)
+    ]
+
+
+def to_signed64(value: int) -> int:
+    """Mongo stores signed 64-bit integers"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_signed64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def simhash_fields(slot: str, text: str) -> Dict:
+    """History document fields storing the SimHash of one text slot"""
+    fingerprint = simhash(text)
+    return {
+        f"{slot}_simhash": to_signed64(fingerprint),
+        f"{slot}_simhash_bands": simhash_bands(fingerprint),
+    }
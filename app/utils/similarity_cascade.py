@@ -0,0 +1,112 @@
+import math
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Dict, Optional, Tuple
+from app.utils.google_similarity import clean_text
+
+# Scores are rounded to 2 decimals before being compared with min_similarity,
+# so bounds are relaxed by half a rounding step to never prune a real match
+_ROUNDING_SLACK = 0.005
+
+
+class SimilarityCascade:
+    """
+    Tiered scorer for comparing one query against many stored texts
+    Produces exactly the scores of calculate_text_similarity, but skips the
+    SequenceMatcher pass for texts that provably cannot reach min_similarity:
+
+    1. length   - ratio <= 2*min(a, b) / (a + b)  (real_quick_ratio); can be
+                  pushed down to Mongo through the stored *_clean_length fields
+    2. quick    - ratio <= character-multiset overlap (quick_ratio)
+    3. exact    - SequenceMatcher(None, query, text).ratio()
+
+    Counters record how many texts each tier eliminated.
+    """
+
+    def __init__(self, query_text: str, min_similarity: float):
+        self.query_clean = clean_text(query_text)
+        self.query_length = len(self.query_clean)
+        self.min_similarity = min_similarity
+        self._query_counts: Optional[Counter] = None
+        self.stats: Dict[str, int] = {
+            "records_pruned_by_db": 0,
+            "texts_considered": 0,
+            "pruned_by_length": 0,
+            "pruned_by_quick_ratio": 0,
+            "exact_scored": 0,
+        }
+
+    def _threshold_ratio(self) -> float:
+        return max(0.0, (self.min_similarity - _ROUNDING_SLACK) / 100)
+
+    def length_bounds(self) -> Optional[Tuple[int, int]]:
+        """
+        Inclusive (min, max) cleaned length a stored text must have to possibly
+        reach min_similarity, or None when every length qualifies
+        """
+        t = self._threshold_ratio()
+        if t <= 0 or self.query_length == 0:
+            return None
+        if t > 1:
+            # Unreachable threshold; only an identical length can't be ruled out cheaply
+            return self.query_length, self.query_length
+        low = math.ceil(self.query_length * t / (2 - t))
+        high = math.floor(self.query_length * (2 - t) / t)
+        return low, high
+
+    def length_filter(self, *length_fields: str) -> Optional[Dict]:
+        """
+        Mongo filter keeping records where any of the given length fields is
+        within bounds. Records written before lengths were stored always pass.
+        """
+        bounds = self.length_bounds()
+        if bounds is None:
+            return None
+        low, high = bounds
+        clauses = [{length_fields[0]: {"$exists": False}}]
+        clauses.extend({field: {"$gte": low, "$lte": high}} for field in length_fields)
+        return {"$or": clauses}
+
+    def _upper_bound_quick(self, text_clean: str) -> float:
+        if self._query_counts is None:
+            self._query_counts = Counter(self.query_clean)
+        other_counts = Counter(text_clean)
+        query_counts = self._query_counts
+        if len(other_counts) > len(query_counts):
+            query_counts, other_counts = other_counts, query_counts
+        matches = sum(min(count, query_counts[char]) for char, count in other_counts.items())
+        total = self.query_length + len(text_clean)
+        return 2.0 * matches / total if total else 1.0
+
+    def score(self, text: str, clean_length: Optional[int] = None) -> Optional[float]:
+        """
+        Similarity percentage of text against the query, or None when a bound
+        proves it is below min_similarity
+        """
+        self.stats["texts_considered"] += 1
+        t = self._threshold_ratio()
+
+        if t > 0:
+            if clean_length is None:
+                text_clean = clean_text(text)
+                clean_length = len(text_clean)
+            else:
+                text_clean = None
+
+            total = self.query_length + clean_length
+            if total and 2.0 * min(self.query_length, clean_length) / total < t:
+                self.stats["pruned_by_length"] += 1
+                return None
+
+            if text_clean is None:
+                text_clean = clean_text(text)
+
+            if self._upper_bound_quick(text_clean) < t:
+                self.stats["pruned_by_quick_ratio"] += 1
+                return None
+        else:
+            text_clean = clean_text(text)
+
+        self.stats["exact_scored"] += 1
+        similarity = SequenceMatcher(None, self.query_clean, text_clean).ratio()
+        return round(similarity * 100, 2)
@@ -0,0 +1,94 @@
+"""
+Import-time profile of the API process, and a regression check for it
+
+    python -m app.utils.startup_profile                  # breakdown by package
+    python -m app.utils.startup_profile --max-ms 1500    # exit 1 if slower
+
+Imports app.main in a fresh interpreter under `python -X importtime` (best of
+--runs) and sums each module's own import time by top-level package. The check
+also fails if any of the lazily imported dependencies (PyPDF2, docx, passlib,
+jose, requests, scipy) were imported at startup, which is how a stray
+top-level import usually shows up first.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Dependencies that must only be imported on first use (see app.utils.lazy_imports)
+LAZY_DEPENDENCIES = ["PyPDF2", "docx", "passlib", "jose", "requests", "scipy"]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def profile_imports(module: str = "app.main") -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    Import module in a new interpreter; returns (total ms, [(module, self ms,
+    cumulative ms)]) from -X importtime, in import order
+    """
+    env = dict(os.environ, STARTUP_WARMUP="off")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    modules = []
+    total = 0.0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nesting is shown by indenting the name; top-level imports add up to the total
+        if not name[1:].startswith(" "):
+            total += int(cumulative_us) / 1000
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return total, modules
+
+
+def by_package(modules: List[Tuple[str, float, float]]) -> Dict[str, float]:
+    """Own import time (ms) summed per top-level package, slowest first"""
+    packages: Dict[str, float] = {}
+    for name, self_ms, _ in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + self_ms
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def _main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="python -m app.utils.startup_profile",
+                                     description="Profile (and check) the API's import time")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=3, help="profile this many times and keep the fastest")
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if importing takes longer than this")
+    parser.add_argument("--allow-eager", action="store_true",
+                        help="don't fail when a lazy dependency is imported at startup")
+    args = parser.parse_args(argv[1:])
+
+    total, modules = min((profile_imports(args.module) for _ in range(max(1, args.runs))), key=lambda run: run[0])
+
+    print(f"⏱️ import {args.module}: {total:.1f} ms (best of {max(1, args.runs)})")
+    for package, self_ms in list(by_package(modules).items())[:args.top]:
+        print(f"  {self_ms:8.1f} ms  {100 * self_ms / total if total else 0:5.1f}%  {package}")
+
+    failures = []
+    if args.max_ms is not None and total > args.max_ms:
+        failures.append(f"import took {total:.1f} ms (budget {args.max_ms:.0f} ms)")
+    if not args.allow_eager:
+        imported = {name.split(".")[0] for name, _, _ in modules}
+        eager = [dependency for dependency in LAZY_DEPENDENCIES if dependency in imported]
+        if eager:
+            failures.append(f"imported at startup instead of lazily: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Startup import check passed")
+
+
+if __name__ == "__main__":
+    _main(sys.argv)
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from pymongo.errors import DuplicateKeyError
+
+# Seconds between roll-ups of history into daily buckets
+STATS_ROLLUP_INTERVAL = int(os.getenv("STATS_ROLLUP_INTERVAL", "300"))
+
+# Only the worker holding the roll-up lease rolls up; it renews the lease every
+# run, and another worker takes over once it lapses (seconds)
+STATS_ROLLUP_LEASE = int(os.getenv("STATS_ROLLUP_LEASE", str(3 * STATS_ROLLUP_INTERVAL)))
+
+# Counters document in db.stats_counters; daily buckets live in db.stats_daily
+TOTALS_ID = "totals"
+ROLLUP_STATE_ID = "rollup"
+ROLLUP_LEASE_ID = "rollup_lease"
+
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+DAY_FORMAT = "%Y-%m-%d"
+
+# Same cut-offs as the result messages ("Low", "Moderate", "High" similarity)
+SCORE_BANDS = (("high", 80), ("moderate", 50), ("low", 0))
+
+
+def day_key(timestamp: datetime) -> str:
+    return timestamp.strftime(DAY_FORMAT)
+
+
+# ------------------------------------------------------------------
+# Incremental counters
+# ------------------------------------------------------------------
+
+async def _increment(db, deltas: Dict[str, int]):
+    """Apply deltas to the counters; before they are seeded there is nothing to update"""
+    deltas = {key: value for key, value in deltas.items() if value}
+    if deltas:
+        await db.stats_counters.update_one({"_id": TOTALS_ID}, {"$inc": deltas})
+
+
+async def ensure_stats_counters(db):
+    """
+    Seed the counters from the collections once (first start, or after they were dropped)
+    Every worker runs this at startup; the insert succeeds for exactly one
+    of them, so the counts are applied once.
+    """
+    await db.stats_daily.create_index([("day", 1)])
+    if await db.stats_counters.find_one({"_id": TOTALS_ID}):
+        return
+
+    counters = {
+        "_id": TOTALS_ID,
+        "users": await db.users.count_documents({}),
+        "admins": await db.users.count_documents({"is_admin": True}),
+        "checks": await db.history.count_documents({}),
+        "checks_by_type": {},
+    }
+    async for group in db.history.aggregate([{"$group": {"_id": "$check_type", "count": {"$sum": 1}}}]):
+        check_type = group["_id"] or "text_comparison"
+        counters["checks_by_type"][check_type] = counters["checks_by_type"].get(check_type, 0) + group["count"]
+
+    try:
+        await db.stats_counters.insert_one(counters)
+    except DuplicateKeyError:
+        return  # Another worker seeded them first
+    print(f"📈 Seeded statistics counters: {counters['checks']} checks, {counters['users']} users")
+
+
+async def note_user_created(db, is_admin: bool = False):
+    await _increment(db, {"users": 1, "admins": int(is_admin)})
+
+
+async def note_user_deleted(db, is_admin: bool = False):
+    await _increment(db, {"users": -1, "admins": -int(is_admin)})
+
+
+async def note_admin_toggled(db, is_admin: bool):
+    await _increment(db, {"admins": 1 if is_admin else -1})
+
+
+async def note_history_insert(db, entry: dict):
+    check_type = entry.get("check_type") or "text_comparison"
+    await _increment(db, {"checks": 1, f"checks_by_type.{check_type}": 1})
+
+
+async def note_history_delete(db, records: Iterable[dict]):
+    """
+    Update the counters for deleted records (check_type and timestamp are
+    enough) and mark their days for the next roll-up to recompute
+    """
+    deltas: Dict[str, int] = {}
+    days = set()
+    for record in records:
+        check_type = record.get("check_type") or "text_comparison"
+        deltas["checks"] = deltas.get("checks", 0) - 1
+        deltas[f"checks_by_type.{check_type}"] = deltas.get(f"checks_by_type.{check_type}", 0) - 1
+        if record.get("timestamp"):
+            days.add(day_key(record["timestamp"]))
+
+    await _increment(db, deltas)
+    if days:
+        await db.stats_counters.update_one(
+            {"_id": ROLLUP_STATE_ID},
+            {"$addToSet": {"dirty_days": {"$each": sorted(days)}}},
+            upsert=True
+        )
+
+
+async def get_totals(db) -> Dict:
+    """The counters document: one indexed read regardless of collection sizes"""
+    return await db.stats_counters.find_one({"_id": TOTALS_ID}) or {}
+
+
+# ------------------------------------------------------------------
+# Daily roll-ups
+# ------------------------------------------------------------------
+
+def _rollup_pipeline(match: dict) -> List[dict]:
+    """History -> one bucket per (day, check_type, user, score band)"""
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": DAY_FORMAT, "date": "$timestamp"}},
+                "check_type": {"$ifNull": ["$check_type", "text_comparison"]},
+                "user_id": {"$ifNull": ["$user_id", ""]},
+                "score_band": {"$switch": {
+                    "branches": [
+                        {"case": {"$gte": [{"$ifNull": ["$similarity_score", 0]}, minimum]}, "then": band}
+                        for band, minimum in SCORE_BANDS[:-1]
+                    ],
+                    "default": SCORE_BANDS[-1][0],
+                }},
+            },
+            "checks": {"$sum": 1},
+            "similarity_sum": {"$sum": {"$ifNull": ["$similarity_score", 0]}},
+            "google_checks": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$google_similarity", None]}, None]}, 1, 0]}},
+            "ai_checks": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$ai_detection", None]}, None]}, 1, 0]}},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.day", "|", "$_id.check_type", "|", "$_id.user_id", "|", "$_id.score_band"]},
+            "day": "$_id.day",
+            "check_type": "$_id.check_type",
+            "user_id": "$_id.user_id",
+            "score_band": "$_id.score_band",
+            "checks": 1,
+            "similarity_sum": 1,
+            "google_checks": 1,
+            "ai_checks": 1,
+        }},
+        {"$merge": {"into": "stats_daily", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+async def rollup_daily_stats(db, rebuild: bool = False) -> List[str]:
+    """
+    Recompute the daily buckets of every day that changed since the last run
+    That is the day of the last roll-up onwards (new checks) plus days
+    deletions were recorded on. Each such day's buckets are recomputed
+    whole, so the result doesn't depend on how often this runs.
+    """
+    state = await db.stats_counters.find_one({"_id": ROLLUP_STATE_ID}) or {}
+    now = datetime.utcnow()
+    dirty_days = sorted(set(state.get("dirty_days") or []))
+
+    if rebuild or not state.get("rolled_up_at"):
+        await db.stats_daily.delete_many({})
+        match = {"timestamp": {"$type": "date"}}
+        days = ["all days"]
+    else:
+        since = state["rolled_up_at"].replace(hour=0, minute=0, second=0, microsecond=0)
+        ranges = [{"timestamp": {"$gte": since}}]
+        for day in dirty_days:
+            start = datetime.strptime(day, DAY_FORMAT)
+            ranges.append({"timestamp": {"$gte": start, "$lt": start + timedelta(days=1)}})
+        match = {"$or": ranges}
+        days = sorted({day_key(since), *dirty_days})
+        # Buckets of recomputed days are replaced wholesale; ones left empty must go
+        await db.stats_daily.delete_many({"$or": [{"day": {"$gte": day_key(since)}}, {"day": {"$in": dirty_days}}]})
+
+    await db.history.aggregate(_rollup_pipeline(match)).to_list(None)
+    await db.stats_counters.update_one(
+        {"_id": ROLLUP_STATE_ID},
+        {"$set": {"rolled_up_at": now}, "$pullAll": {"dirty_days": dirty_days}},
+        upsert=True
+    )
+    return days
+
+
+async def acquire_rollup_lease(db, lease_seconds: int = STATS_ROLLUP_LEASE) -> bool:
+    """Take or renew the roll-up lease; False while another live worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await db.stats_counters.update_one(
+            {"_id": ROLLUP_LEASE_ID, "$or": [{"owner": _worker_id}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": _worker_id, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False  # The lease exists and belongs to someone else
+    return True
+
+
+async def run_stats_rollups(db, interval: int = STATS_ROLLUP_INTERVAL):
+    """
+    Background loop keeping stats_daily current
+    Runs in every worker, but only the lease holder rolls up, so runs never
+    race between clearing a day's buckets and merging them back.
+    """
+    while True:
+        try:
+            if await acquire_rollup_lease(db):
+                days = await rollup_daily_stats(db)
+                print(f"📈 Rolled up daily statistics for {', '.join(days)}")
+        except Exception as e:
+            print(f"⚠️ Statistics roll-up failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def daily_series(db, days: int = 30, group_by: str = "check_type",
+                       user_id: Optional[str] = None) -> List[Dict]:
+    """
+    Per-day totals from stats_daily, broken down by check_type, score_band
+    or user_id; reads only the (small) bucket collection
+    """
+    first_day = day_key(datetime.utcnow() - timedelta(days=days - 1))
+    query = {"day": {"$gte": first_day}}
+    if user_id:
+        query["user_id"] = user_id
+
+    series: Dict[str, Dict] = {}
+    async for bucket in db.stats_daily.find(query):
+        day = series.setdefault(bucket["day"], {"day": bucket["day"], "checks": 0, "similarity_sum": 0.0,
+                                                "google_checks": 0, "ai_checks": 0, "breakdown": {}})
+        day["checks"] += bucket["checks"]
+        day["similarity_sum"] += bucket["similarity_sum"]
+        day["google_checks"] += bucket["google_checks"]
+        day["ai_checks"] += bucket["ai_checks"]
+        key = bucket[group_by]
+        day["breakdown"][key] = day["breakdown"].get(key, 0) + bucket["checks"]
+
+    result = []
+    for day in sorted(series):
+        entry = series[day]
+        similarity_sum = entry.pop("similarity_sum")
+        entry["avg_similarity"] = round(similarity_sum / entry["checks"], 2) if entry["checks"] else 0.0
+        result.append(entry)
+    return result
@@ -0,0 +1,92 @@
+import io
+import os
+from typing import Optional
+from app.utils.deadline import Deadline
+from app.utils.lazy_imports import lazy_import
+
+# Imported on the first PDF/DOCX upload, not at startup
+PyPDF2 = lazy_import("PyPDF2")
+docx = lazy_import("docx")
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TXT_CONTENT_TYPE = "text/plain"
+
+ALLOWED_CONTENT_TYPES = [PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE, TXT_CONTENT_TYPE]
+
+# File extensions accepted when no content type is available (e.g. ZIP members)
+EXTENSION_CONTENT_TYPES = {
+    ".pdf": PDF_CONTENT_TYPE,
+    ".docx": DOCX_CONTENT_TYPE,
+    ".txt": TXT_CONTENT_TYPE,
+}
+
+
+def extract_text_from_pdf(file_content: bytes, deadline: Optional[Deadline] = None) -> str:
+    """Extract text from PDF file, stopping after the current page once the deadline passes"""
+    try:
+        pdf_file = io.BytesIO(file_content)
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        text = ""
+        for page in pdf_reader.pages:
+            if text and deadline is not None and deadline.expired():
+                deadline.mark_partial("extraction")
+                break
+            extracted = page.extract_text()
+            if extracted:
+                text += extracted + "\n"
+        
+        # If no text was extracted, return a meaningful message
+        if not text.strip():
+            return "[PDF file appears to be scanned or image-based. Text extraction not possible. Please use OCR or convert to text format.]"
+        
+        return text.strip()
+    except Exception as e:
+        print(f"PDF extraction error: {str(e)}")
+        # Return a fallback instead of raising an error
+        return f"[PDF text extraction failed: {str(e)}. File may be corrupted or password-protected.]"
+
+
+def extract_text_from_docx(file_content: bytes) -> str:
+    """Extract text from DOCX file"""
+    try:
+        docx_file = io.BytesIO(file_content)
+        doc = docx.Document(docx_file)
+        text = "\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
+        
+        # If no text was extracted, return a meaningful message
+        if not text.strip():
+            return "[DOCX file appears to be empty or contains only images. Text extraction not possible.]"
+        
+        return text.strip()
+    except Exception as e:
+        print(f"DOCX extraction error: {str(e)}")
+        # Return a fallback instead of raising an error
+        return f"[DOCX text extraction failed: {str(e)}. File may be corrupted or password-protected.]"
+
+
+def extract_text_from_txt(file_content: bytes) -> str:
+    """Decode a plain text file, falling back to latin-1"""
+    try:
+        return file_content.decode("utf-8")
+    except UnicodeDecodeError:
+        return file_content.decode("latin-1", errors='ignore')
+
+
+def extraction_failed(text: str) -> bool:
+    """True if text is one of the placeholder messages returned on failure"""
+    return text.startswith(("[PDF ", "[PDF file", "[DOCX ", "[DOCX file"))
+
+
+def content_type_from_filename(filename: str) -> Optional[str]:
+    """Guess a supported content type from the file extension"""
+    return EXTENSION_CONTENT_TYPES.get(os.path.splitext(filename.lower())[1])
+
+
+def extract_text(file_content: bytes, content_type: str, deadline: Optional[Deadline] = None) -> str:
+    """Extract text from PDF, DOCX or TXT content based on its content type"""
+    if content_type == PDF_CONTENT_TYPE:
+        return extract_text_from_pdf(file_content, deadline)
+    if content_type == DOCX_CONTENT_TYPE:
+        return extract_text_from_docx(file_content)
+    return extract_text_from_txt(file_content)
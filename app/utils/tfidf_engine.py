@@ -0,0 +1,294 @@
+import asyncio
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.database import catch_up_history
+from app.utils.lazy_imports import lazy_import
+
+# scipy adds a few hundred ms to startup; the engine is built on first search
+sparse = lazy_import("scipy.sparse")
+
+# Terms are hashed into a fixed feature space, so new vocabulary never
+# reshapes the matrix and inserts stay append-only
+N_FEATURES = 1 << 20
+_FEATURE_MASK = N_FEATURES - 1
+
+# Row norms use the IDF of when they were computed: rows added since are
+# normed on the next query, all rows again once the document count has moved
+# this fraction away from the last full refresh
+NORM_REFRESH_RATIO = float(os.getenv("TFIDF_NORM_REFRESH_RATIO", "0.1"))
+
+_TERM_RE = re.compile(r"\w+")
+_SLOTS = ("text1", "text2")
+_GOOGLE_ONLY_PLACEHOLDER = "[Google Only Check]"
+
+
+def hashed_term_frequencies(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted hashed term ids and their sublinear (1 + log) term frequencies"""
+    counts = Counter(zlib.crc32(term.encode("utf-8")) & _FEATURE_MASK for term in _TERM_RE.findall(text.lower()))
+    indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    order = np.argsort(indices)
+    return indices[order], values[order].astype(np.float32)
+
+
+def record_term_frequencies(record: Dict) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """(slot, indices, values) for each stored text of a history record"""
+    rows = []
+    for slot in _SLOTS:
+        text = record.get(slot)
+        if text and text != _GOOGLE_ONLY_PLACEHOLDER:
+            rows.append((slot, *hashed_term_frequencies(text)))
+    return rows
+
+
+def _grown(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class TfidfEngine:
+    """
+    TF-IDF cosine similarity over every stored history text
+    Keeps a CSR document-term matrix of sublinear term frequencies (one row
+    per text slot) plus document frequencies. IDF is applied at query time,
+    so inserts only append a row and bump df; a query is one sparse
+    matrix-vector product plus cached row norms. Per-row state (user, alive,
+    norm) lives in numpy arrays grown by doubling and updated in place.
+    """
+
+    def __init__(self):
+        self._matrix = sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        self._keys: List[Tuple[object, str]] = []
+        self._user_codes = np.zeros(0, dtype=np.int32)
+        self._users: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows_by_history: Dict[object, List[int]] = {}
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._normed_rows = 0  # rows [0, _normed_rows) have norms
+        self._normed_documents = 0  # document count at the last full refresh
+        self._alive_count = 0
+        self.high_water = None
+        self.loaded = False
+        self._lock = asyncio.Lock()
+
+    # ---- maintenance -------------------------------------------------
+
+    def add(self, history_id, user_id: str, record: Dict):
+        """Append rows for a history record's texts"""
+        self._append(history_id, user_id, record_term_frequencies(record))
+
+    def _append(self, history_id, user_id: str, rows: List[Tuple[str, np.ndarray, np.ndarray]]):
+        """
+        Append precomputed (slot, indices, values) rows, once per record
+        Doesn't move the high-water mark: only ensure_loaded does, so other
+        workers' records with smaller _ids than this worker's inserts aren't skipped.
+        """
+        if history_id in self._rows_by_history:
+            return
+        history_rows = self._rows_by_history.setdefault(history_id, [])
+        if len(self._keys) + len(rows) > len(self._alive):
+            capacity = max(1024, 2 * len(self._alive), len(self._keys) + len(rows))
+            self._user_codes = _grown(self._user_codes, capacity)
+            self._alive = _grown(self._alive, capacity)
+            self._norms = _grown(self._norms, capacity)
+        user_code = self._users.setdefault(user_id, len(self._users))
+        for slot, indices, values in rows:
+            row = len(self._keys)
+            self._pending.append((indices, values))
+            self._df[indices] += 1
+            history_rows.append(row)
+            self._keys.append((history_id, slot))
+            self._user_codes[row] = user_code
+            self._alive[row] = True
+            self._alive_count += 1
+
+    def remove(self, history_ids: List):
+        """Tombstone the rows of deleted history records"""
+        self._commit()
+        for history_id in history_ids:
+            for row in self._rows_by_history.pop(history_id, []):
+                if self._alive[row]:
+                    self._alive[row] = False
+                    self._alive_count -= 1
+                    start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+                    self._df[self._matrix.indices[start:end]] -= 1
+
+    def _commit(self):
+        """Fold pending rows into the CSR matrix"""
+        if not self._pending:
+            return
+        lengths = np.fromiter((len(indices) for indices, _ in self._pending), dtype=np.int64, count=len(self._pending))
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        block = sparse.csr_matrix(
+            (
+                np.concatenate([values for _, values in self._pending]),
+                np.concatenate([indices for indices, _ in self._pending]),
+                indptr,
+            ),
+            shape=(len(self._pending), N_FEATURES),
+            dtype=np.float32,
+        )
+        self._matrix = sparse.vstack([self._matrix, block], format="csr")
+        self._pending = []
+
+    async def ensure_loaded(self, db, batch_size: int = 500) -> int:
+        """
+        Build from the history collection on first use, then catch up by _id
+        Pass the primary handle (see catch_up_history). Term frequencies are
+        computed in a thread one batch at a time, so a first build over a
+        large history doesn't block the event loop.
+        """
+        async with self._lock:
+            added = 0
+
+            async def apply(records: List[Dict]):
+                nonlocal added
+                added += await self._add_batch(records)
+
+            self.high_water = await catch_up_history(
+                db, self.high_water, self._rows_by_history.__contains__, apply,
+                {"user_id": 1, "text1": 1, "text2": 1}, batch_size
+            )
+            if not self.loaded:
+                self.loaded = True
+                print(f"✅ TF-IDF engine built from {added} history records ({self.memory_stats()['total_bytes']} bytes)")
+            return added
+
+    async def _add_batch(self, records: List[Dict]) -> int:
+        if not records:
+            return 0
+        rows = await asyncio.to_thread(lambda: [record_term_frequencies(record) for record in records])
+        added = 0
+        for record, record_rows in zip(records, rows):
+            if record["_id"] not in self._rows_by_history:
+                self._append(record["_id"], record.get("user_id", ""), record_rows)
+                added += 1
+        return added
+
+    async def prune_deleted(self, db, history_ids: List) -> int:
+        """
+        Tombstone the given records that no longer exist in Mongo
+        Catches deletions made by other workers; returns how many were pruned.
+        Pass the primary handle: a lagging secondary would report records
+        inserted moments ago as deleted.
+        """
+        if not history_ids:
+            return 0
+        existing = {
+            record["_id"]
+            async for record in db.history.find({"_id": {"$in": list(history_ids)}}, {"_id": 1})
+        }
+        missing = [history_id for history_id in history_ids if history_id not in existing]
+        self.remove(missing)
+        return len(missing)
+
+    # ---- querying ----------------------------------------------------
+
+    def _idf(self) -> np.ndarray:
+        return (np.log((1.0 + self._alive_count) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+    def _update_norms(self, idf: np.ndarray):
+        """Norm rows added since the last query, or all rows once the IDF has drifted"""
+        rows = len(self._keys)
+        drifted = abs(self._alive_count - self._normed_documents) > NORM_REFRESH_RATIO * max(self._normed_documents, 1)
+        start = 0 if drifted else self._normed_rows
+        if start < rows:
+            block = self._matrix[start:rows]
+            self._norms[start:rows] = np.sqrt(block.multiply(block) @ (idf * idf))
+            self._normed_rows = rows
+        if drifted:
+            self._normed_documents = self._alive_count
+
+    def query(self, text: str, user_id: Optional[str] = None, min_similarity: float = 0.0,
+              top_k: int = 100) -> Tuple[int, List[Tuple[object, str, float]]]:
+        """
+        Records whose best text scores at least min_similarity (cosine, 0-100)
+        Returns (number of matching records, top_k (history_id, slot, score)
+        sorted by score, one entry per record).
+        """
+        self._commit()
+        if not self._keys:
+            return 0, []
+
+        rows = len(self._keys)
+        idf = self._idf()
+        self._update_norms(idf)
+
+        indices, values = hashed_term_frequencies(text)
+        if not len(indices):
+            return 0, []
+        query_weights = values * idf[indices]
+        query_norm = float(np.sqrt(np.dot(query_weights, query_weights)))
+
+        dense_query = np.zeros(N_FEATURES, dtype=np.float32)
+        dense_query[indices] = query_weights * idf[indices]
+        scores = self._matrix @ dense_query
+
+        denominators = self._norms[:rows] * query_norm
+        scores = np.divide(scores, denominators, out=np.zeros_like(scores), where=denominators > 0) * 100
+
+        mask = self._alive[:rows].copy()
+        if user_id is not None:
+            code = self._users.get(user_id)
+            if code is None:
+                return 0, []
+            mask &= self._user_codes[:rows] == code
+        mask &= (scores >= min_similarity) & (scores > 0)
+
+        rows = np.nonzero(mask)[0]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+
+        seen = set()
+        hits = []
+        for row in rows:
+            history_id, slot = self._keys[row]
+            if history_id in seen:
+                continue
+            seen.add(history_id)
+            if len(hits) < top_k:
+                hits.append((history_id, slot, round(float(scores[row]), 2)))
+        return len(seen), hits
+
+    def memory_stats(self) -> Dict:
+        self._commit()
+        matrix_bytes = self._matrix.data.nbytes + self._matrix.indices.nbytes + self._matrix.indptr.nbytes
+        norms_bytes = self._norms.nbytes
+        row_bytes = self._alive.nbytes + self._user_codes.nbytes
+        return {
+            "documents": self._alive_count,
+            "tombstoned": len(self._keys) - self._alive_count,
+            "nonzeros": int(self._matrix.nnz),
+            "matrix_bytes": int(matrix_bytes),
+            "df_bytes": int(self._df.nbytes),
+            "norms_bytes": int(norms_bytes),
+            "row_bytes": int(row_bytes),
+            "total_bytes": int(matrix_bytes + self._df.nbytes + norms_bytes + row_bytes),
+        }
+
+
+_engine: Optional[TfidfEngine] = None
+
+
+def get_tfidf_engine() -> TfidfEngine:
+    global _engine
+    if _engine is None:
+        _engine = TfidfEngine()
+    return _engine
+
+
+def note_history_insert(history_id, record: Dict):
+    """Keep the engine current with this worker's inserts once it is built"""
+    if _engine is not None and _engine.loaded:
+        _engine.add(history_id, record.get("user_id", ""), record)
+
+
+def note_history_delete(history_ids: List):
+    if _engine is not None and _engine.loaded:
+        _engine.remove(history_ids)
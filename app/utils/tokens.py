@@ -0,0 +1,126 @@
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+_TOKEN_RE = re.compile(r'\S+')
+
+
+class Vocabulary:
+    """
+    Maps lowercased tokens to dense integer ids
+    Documents that are compared with each other must share a vocabulary.
+    Keep vocabularies per comparison/request: they only ever grow.
+    """
+    __slots__ = ("_ids", "_words")
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._words: List[str] = []
+
+    def intern(self, word: str) -> int:
+        token_id = self._ids.get(word)
+        if token_id is None:
+            token_id = len(self._words)
+            self._ids[word] = token_id
+            self._words.append(word)
+        return token_id
+
+    def lookup(self, word: str) -> Optional[int]:
+        return self._ids.get(word)
+
+    def word(self, token_id: int) -> str:
+        return self._words[token_id]
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+
+class TokenizedDocument:
+    """
+    Compact tokenized form of a text, built once and shared by the analyzers
+    Tokens follow text.lower().split(): ids[i] is the vocabulary id of the
+    i-th whitespace-separated token and starts[i]/ends[i] are its character
+    offsets in the original text.
+    """
+    __slots__ = ("text", "vocab", "ids", "starts", "ends")
+
+    def __init__(self, text: str, vocab: Vocabulary, ids: array, starts: array, ends: array):
+        self.text = text
+        self.vocab = vocab
+        self.ids = ids
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_text(cls, text: str, vocab: Optional[Vocabulary] = None) -> "TokenizedDocument":
+        vocab = vocab if vocab is not None else Vocabulary()
+        intern = vocab.intern
+        ids, starts, ends = array('I'), array('I'), array('I')
+        for m in _TOKEN_RE.finditer(text):
+            ids.append(intern(m.group().lower()))
+            starts.append(m.start())
+            ends.append(m.end())
+        return cls(text, vocab, ids, starts, ends)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def tokens(self) -> List[str]:
+        """Lowercased token strings (same as text.lower().split())"""
+        word = self.vocab.word
+        return [word(token_id) for token_id in self.ids]
+
+    def unique_count(self) -> int:
+        return len(set(self.ids))
+
+    def token_length(self, i: int) -> int:
+        return self.ends[i] - self.starts[i]
+
+    def char_span(self, i: int, j: int) -> Tuple[int, int]:
+        """Character offsets covering tokens i..j-1"""
+        return self.starts[i], self.ends[j - 1]
+
+    def slice_text(self, i: int, j: int) -> str:
+        """Original text (case and spacing preserved) covering tokens i..j-1"""
+        start, end = self.char_span(i, j)
+        return self.text[start:end]
+
+    def window(self, i: int, j: int) -> "TokenizedDocument":
+        """
+        Tokens i..j-1 as a document of their own, sharing this vocabulary
+        Offsets are rebased onto the window's text, so analyzers can run on a
+        window without tokenizing it again.
+        """
+        if i >= j:
+            return TokenizedDocument("", self.vocab, array('I'), array('I'), array('I'))
+        base = self.starts[i]
+        return TokenizedDocument(
+            self.text[base:self.ends[j - 1]],
+            self.vocab,
+            self.ids[i:j],
+            array('I', (start - base for start in self.starts[i:j])),
+            array('I', (end - base for end in self.ends[i:j])),
+        )
+
+    def clean_text(self) -> str:
+        """Equivalent of google_similarity.clean_text() without re-scanning the text"""
+        return " ".join(self.tokens())
+
+    def positions(self) -> Dict[int, List[int]]:
+        """Token id -> ascending list of positions where it occurs"""
+        index: Dict[int, List[int]] = {}
+        for position, token_id in enumerate(self.ids):
+            index.setdefault(token_id, []).append(position)
+        return index
+
+
+DocumentLike = Union[str, TokenizedDocument]
+
+
+def tokenize(text: DocumentLike, vocab: Optional[Vocabulary] = None) -> TokenizedDocument:
+    """Return text as a TokenizedDocument, reusing it if it already is one"""
+    if isinstance(text, TokenizedDocument):
+        if vocab is None or text.vocab is vocab:
+            return text
+        text = text.text
+    return TokenizedDocument.from_text(text, vocab)